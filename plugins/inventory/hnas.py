@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = r'''
+---
+name: hnas
+short_description: Hitachi NAS inventory source
+description:
+  - Builds an inventory of Hitachi NAS cluster nodes, virtual servers, filesystems, NFS exports and CIFS/SMB shares.
+  - Many clusters can be listed, and they are read in parallel.
+  - The results can be cached using any of the Ansible inventory cache plugins, so each cluster is not read every time a playbook starts.
+  - The configuration file name must end with C(hnas.yml) or C(hnas.yaml).
+  - Host names are qualified by the type of object, and objects hosted by a virtual server also by the name of the virtual server, such as C(node_node-1), C(virtual_server_evs1), C(filesystem_evs1_fs01), C(nfs_export_evs1_/exports/fs01) and C(cifs_share_evs1_share01).
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+extends_documentation_fragment:
+  - constructed
+  - inventory_cache
+options:
+  plugin:
+    description: The name of this plugin, it should always be set to C(hitachivantara.hnas.hnas) for this plugin to recognise the file as its own.
+    required: true
+    choices: ['hitachivantara.hnas.hnas']
+  clusters:
+    description:
+    - A list of the Hitachi NAS clusters to read.
+    - Each entry holds the I(api_url) of a cluster and the credentials used to access it.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      api_url:
+        description:
+        - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+        - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+        type: str
+        required: true
+      api_key:
+        description: The REST API authentication key - the preferred authentication method.
+        type: str
+      api_username:
+        description: The username to authenticate with the REST API.
+        type: str
+      api_password:
+        description: The password to authenticate with the REST API.
+        type: str
+      validate_certs:
+        description: Should https certificates be validated?
+        type: bool
+        default: true
+  include:
+    description:
+    - The types of object to add to the inventory as hosts.
+    type: list
+    elements: str
+    choices: ['nodes', 'virtual_servers', 'filesystems', 'nfs_exports', 'cifs_shares']
+    default: ['nodes', 'virtual_servers', 'filesystems', 'nfs_exports', 'cifs_shares']
+  unique_hostnames:
+    description:
+    - If I(unique_hostnames=true), host names are prefixed with the address of their cluster, so objects with the same name on different clusters are kept apart.
+    type: bool
+    default: false
+  max_workers:
+    description: The maximum number of requests sent to the REST APIs at the same time.
+    type: int
+    default: 8
+'''
+
+EXAMPLES = r'''
+# hnas.yml
+plugin: hitachivantara.hnas.hnas
+clusters:
+- api_url: https://172.27.5.11:8444/v7
+  api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+  validate_certs: false
+- api_url: https://172.27.6.11:8444/v8
+  api_username: admin
+  api_password: secret
+include:
+- virtual_servers
+- filesystems
+cache: true
+cache_plugin: jsonfile
+cache_connection: /tmp/hnas_inventory
+cache_timeout: 3600
+keyed_groups:
+- key: hnas.status
+  prefix: status
+'''
+
+from ansible.errors import AnsibleError
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+
+from ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main import HNASFileServer, run_concurrently
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'hitachivantara.hnas.hnas'
+
+    def verify_file(self, path):
+        if super(InventoryModule, self).verify_file(path):
+            return path.endswith(('hnas.yml', 'hnas.yaml'))
+        return False
+
+    def get_cluster_objects(self, cluster):
+        """
+        Read all of the objects of one cluster
+        - the nodes, virtual servers and filesystems are read concurrently, then the shares and exports of each virtual server
+        - returns a dictionary of object lists, or a dictionary holding the error if the cluster could not be read
+        """
+        include = self.get_option('include')
+        max_workers = self.get_option('max_workers')
+        try:
+            hnas = HNASFileServer(cluster['api_url'], verify=cluster.get('validate_certs', True))
+            hnas.set_credentials(cluster.get('api_key', None), cluster.get('api_username', None), cluster.get('api_password', None))
+            listings = [
+                ('nodes', lambda: hnas.get_nodes()['nodes']),
+                ('virtual_servers', lambda: hnas.get_virtual_servers()['virtualServers']),
+                ('filesystems', lambda: hnas.get_file_systems()['filesystems']),
+            ]
+# virtual servers are needed to find the shares and exports
+            needed = [(key, read) for key, read in listings
+                      if key in include or (key == 'virtual_servers' and ('nfs_exports' in include or 'cifs_shares' in include))]
+            objects = dict(zip([key for key, _ in needed], run_concurrently(lambda item: item[1](), needed, max_workers)))
+            for key, type in [('nfs_exports', 'nfs'), ('cifs_shares', 'cifs')]:
+                if key in include:
+                    shares = run_concurrently(lambda evs: hnas.get_share_or_export(evs['virtualServerId'], type, include_authentications=False)['filesystemShares'],
+                                              objects['virtual_servers'], max_workers)
+                    objects[key] = []
+                    for evs, evs_shares in zip(objects['virtual_servers'], shares):
+                        for share in evs_shares:
+                            share.setdefault('virtualServerId', evs['virtualServerId'])
+                            objects[key].append(share)
+# the cluster is named by its first endpoint, whichever SMU served the requests
+            return {'address': hnas.address, 'objects': objects}
+        except Exception as error:
+            return {'address': cluster['api_url'], 'error': str(error)}
+
+    def get_inventory_data(self):
+        clusters = self.get_option('clusters')
+        for cluster in clusters:
+            if 'api_url' not in cluster:
+                raise AnsibleError("Each of the hnas inventory clusters requires an 'api_url'")
+        return run_concurrently(self.get_cluster_objects, clusters, self.get_option('max_workers'))
+
+    def get_hostname(self, address, type, evs_name, name):
+        """
+        Qualify the name of an object, so objects of different types, or on different virtual servers, do not share a host
+        """
+        parts = [type, name] if evs_name == None else [type, evs_name, name]
+        if self.get_option('unique_hostnames'):
+            parts.insert(0, address)
+        return "_".join([str(part) for part in parts])
+
+    def add_object_host(self, address, type, evs_name, name, obj, groups):
+        strict = self.get_option('strict')
+        host = self.get_hostname(address, type, evs_name, name)
+        hostvars = {'hnas_cluster': address, 'hnas_type': type, 'hnas': obj}
+        for group in groups:
+            self.inventory.add_group(group)
+            self.inventory.add_host(host, group=group)
+        for key, value in hostvars.items():
+            self.inventory.set_variable(host, key, value)
+        self._set_composite_vars(self.get_option('compose'), hostvars, host, strict=strict)
+        self._add_host_to_composed_groups(self.get_option('groups'), hostvars, host, strict=strict)
+        self._add_host_to_keyed_groups(self.get_option('keyed_groups'), hostvars, host, strict=strict)
+
+    def populate(self, clusters):
+        for cluster in clusters:
+            address = cluster['address']
+            if 'error' in cluster:
+                if self.get_option('strict'):
+                    raise AnsibleError("Failed to read the Hitachi NAS cluster at [{}] because of [{}]".format(address, cluster['error']))
+                self.display.warning("Skipping the Hitachi NAS cluster at [{}] because of [{}]".format(address, cluster['error']))
+                continue
+            objects = cluster['objects']
+            cluster_group = self._sanitize_group_name("hnas_{}".format(address))
+# objects hosted by a virtual server are also grouped by the name of the virtual server
+            evs_groups = {}
+            evs_names = {}
+            for evs in objects.get('virtual_servers', []):
+                evs_groups[evs['virtualServerId']] = self._sanitize_group_name("hnas_evs_{}".format(evs['name']))
+                evs_names[evs['virtualServerId']] = evs['name']
+            for node in objects.get('nodes', []) if 'nodes' in self.get_option('include') else []:
+                self.add_object_host(address, 'node', None, node.get('name', node.get('nodeId', '')), node, [cluster_group, 'hnas_nodes'])
+            for evs in objects.get('virtual_servers', []) if 'virtual_servers' in self.get_option('include') else []:
+                self.add_object_host(address, 'virtual_server', None, evs['name'], evs, [cluster_group, 'hnas_virtual_servers'])
+            for fs in objects.get('filesystems', []):
+                groups = [cluster_group, 'hnas_filesystems']
+                if fs.get('virtualServerId', None) in evs_groups:
+                    groups.append(evs_groups[fs['virtualServerId']])
+                evs_name = evs_names.get(fs.get('virtualServerId', None), fs.get('virtualServerId', None))
+                self.add_object_host(address, 'filesystem', evs_name, fs['label'], fs, groups)
+            for key, type in [('nfs_exports', 'nfs_export'), ('cifs_shares', 'cifs_share')]:
+                for share in objects.get(key, []):
+                    groups = [cluster_group, 'hnas_' + key]
+                    if share.get('virtualServerId', None) in evs_groups:
+                        groups.append(evs_groups[share['virtualServerId']])
+                    evs_name = evs_names.get(share.get('virtualServerId', None), share.get('virtualServerId', None))
+                    self.add_object_host(address, type, evs_name, share['name'], share, groups)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+# only read the cache if the user has enabled it, and only write it if it was not used or has expired
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+        if attempt_to_read_cache:
+            try:
+                clusters = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+        if not attempt_to_read_cache or cache_needs_update:
+            clusters = self.get_inventory_data()
+# the cache is only written if every cluster was read, so a cluster that failed is read again on the next run
+        if cache_needs_update and len([cluster for cluster in clusters if 'error' in cluster]) == 0:
+            self._cache[cache_key] = clusters
+        self.populate(clusters)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = r'''
+---
+name: hnas_id
+short_description: Resolve Hitachi NAS resource names to IDs
+description:
+  - Returns the ID of each named virtual server, storage pool, filesystem or cluster node.
+  - The first term is the kind of resource, one of C(virtual_server), C(storage_pool), C(filesystem) or C(node), and the remaining terms are names.
+  - Virtual servers and nodes are matched by name, storage pools and filesystems by label.
+  - Each kind of resource is listed once, and the names and IDs are kept in memory and in an on-disk cache, so many lookups cost a single listing.
+  - The cache is kept apart for each set of credentials, so lookups with different credentials never share names.
+  - If a name is not found in the cached names, the listing is read again before the name is reported as missing.
+  - Names that are still not found are remembered along with the listing, so they do not cause it to be read again until it expires.
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  _terms:
+    description: The kind of resource, followed by one or more names.
+    required: true
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    type: str
+    required: true
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  field:
+    description:
+    - The field to return for each resource, instead of its ID.
+    - For example C(objectId), which is needed instead of C(filesystemId) by some requests.
+    type: str
+  missing:
+    description:
+    - If I(missing=error), a name that is not found fails the lookup.
+    - If I(missing=none), a name that is not found returns C(None).
+    type: str
+    choices: ['error', 'none']
+    default: error
+  cache_ttl:
+    description:
+    - The number of seconds that listings are cached on disk and in memory.
+    - Set to C(0) to read the listing for every lookup.
+    type: int
+    default: 300
+  cache_dir:
+    description: The directory that holds the on-disk cache.
+    type: path
+    default: ~/.ansible/tmp/hnas_id
+'''
+
+EXAMPLES = r'''
+- name: Create an NFS export on a filesystem known only by its label
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  hitachivantara.hnas.hnas_share_export:
+    state: present
+    <<: *login
+    data:
+      name: "/fs01"
+      type: "nfs"
+      virtualServerId: "{{ lookup('hitachivantara.hnas.hnas_id', 'virtual_server', 'evs1', api_url=login.api_url, api_key=login.api_key, validate_certs=false) }}"
+      filesystemId: "{{ lookup('hitachivantara.hnas.hnas_id', 'filesystem', 'fs01', api_url=login.api_url, api_key=login.api_key, validate_certs=false) }}"
+      filesystemPath: "/"
+
+- name: Resolve several filesystem labels at once
+  debug:
+    msg: "{{ query('hitachivantara.hnas.hnas_id', 'filesystem', 'fs01', 'fs02', 'fs03', api_url=login.api_url, api_key=login.api_key) }}"
+'''
+
+RETURN = r'''
+_raw:
+  description: The ID, or the requested field, of each named resource.
+  type: list
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from ansible.errors import AnsibleError
+from ansible.plugins.lookup import LookupBase
+
+from ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main import HNASFileServer, RESOURCE_INDEXES
+
+# listings already resolved by this process, keyed by cluster, credentials, kind and field
+# each entry holds the time the listing was read, the name to value map, and the names known to be missing from it
+resolved = {}
+resolved_lock = threading.Lock()
+
+
+class LookupModule(LookupBase):
+
+    def get_cache_key(self, kind, field):
+        credentials = json.dumps([self.get_option('api_key'), self.get_option('api_username'), self.get_option('api_password')])
+        return [self.get_option('api_url'), hashlib.sha1(credentials.encode('utf-8')).hexdigest(), kind, field]
+
+    def get_cache_file(self, key):
+        cache_dir = os.path.expanduser(self.get_option('cache_dir'))
+        return os.path.join(cache_dir, hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest() + ".json")
+
+    def read_cache_file(self, key, ttl):
+        path = self.get_cache_file(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if time.time() - entry['time'] > ttl:
+                return None
+            return entry
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write_cache_file(self, key, entry):
+        path = self.get_cache_file(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), 0o700)
+# write a new file and rename it, so other processes never read a partial file
+            temp = "{}.{}.tmp".format(path, os.getpid())
+            with open(temp, 'w') as f:
+                json.dump(entry, f)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            self._display.warning("Unable to write the hnas_id cache file [{}]".format(path))
+
+    def read_listing(self, kind, field):
+        hnas = HNASFileServer(self.get_option('api_url'), verify=self.get_option('validate_certs'))
+        hnas.set_credentials(self.get_option('api_key'), self.get_option('api_username'), self.get_option('api_password'))
+        hnas.load_indexes([kind])
+        return dict([(name, item.get(field, None)) for name, item in hnas.indexes[kind]['names'].items()])
+
+    def get_entry(self, kind, field, refresh=False):
+        """
+        Return the cache entry for a kind of resource, holding the name to value map and the names known to be missing
+        - the entry is taken from memory, then the on-disk cache, and only read from the server if neither is current
+        """
+        ttl = self.get_option('cache_ttl')
+        key = self.get_cache_key(kind, field)
+        with resolved_lock:
+            entry = resolved.get(tuple(key), None)
+        if refresh == False and entry != None and time.time() - entry['time'] <= ttl:
+            return entry
+        entry = None
+        if refresh == False and ttl > 0:
+            entry = self.read_cache_file(key, ttl)
+        if entry == None:
+            entry = {'time': time.time(), 'values': self.read_listing(kind, field), 'missing': []}
+            if ttl > 0:
+                self.write_cache_file(key, entry)
+        with resolved_lock:
+            resolved[tuple(key)] = entry
+        return entry
+
+    def add_missing(self, kind, field, entry, names):
+        """
+        Remember names that are not in a listing, for as long as the listing is cached
+        """
+        key = self.get_cache_key(kind, field)
+        with resolved_lock:
+            entry['missing'] = sorted(set(entry['missing']) | set(names))
+        if self.get_option('cache_ttl') > 0:
+            self.write_cache_file(key, entry)
+
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        if len(terms) < 2:
+            raise AnsibleError("hnas_id requires the kind of resource and at least one name")
+        kind = terms[0]
+        if kind not in RESOURCE_INDEXES:
+            raise AnsibleError("hnas_id can not resolve [{}] - valid kinds are {}".format(kind, sorted(RESOURCE_INDEXES.keys())))
+        names = []
+        for term in terms[1:]:
+            names.extend(term if isinstance(term, list) else [term])
+        field = self.get_option('field') or RESOURCE_INDEXES[kind][3]
+        try:
+            entry = self.get_entry(kind, field)
+            if len([name for name in names if name not in entry['values'] and name not in entry['missing']]) != 0:
+# the cached listing may be older than the resource, so read it again before giving up
+                entry = self.get_entry(kind, field, refresh=True)
+                missing = [name for name in names if name not in entry['values']]
+                if len(missing) != 0:
+                    self.add_missing(kind, field, entry, missing)
+            values = entry['values']
+        except AnsibleError:
+            raise
+        except Exception as error:
+            raise AnsibleError("hnas_id failed to read the {} names from [{}] because of [{}]".format(kind, self.get_option('api_url'), str(error)))
+        results = []
+        for name in names:
+            if name not in values and self.get_option('missing') == 'error':
+                raise AnsibleError("hnas_id did not find a {} named [{}]".format(kind, name))
+            results.append(values.get(name, None))
+        return results
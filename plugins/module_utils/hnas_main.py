@@ -1,24 +1,1088 @@
 
 # Copyright: (c) 2021-2024, Hitachi Vantara, LTD
 
+import calendar
+import csv
+import fcntl
+import fnmatch
+import gzip
+import hashlib
+import io
 import json
+import mmap
+import os
 import requests
 import re
+import struct
+import threading
 import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+# upper limit on the number of requests issued at the same time by a single task
+DEFAULT_MAX_WORKERS = 8
+
+def run_concurrently(function, items, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Call function for every item using a bounded pool of threads
+    - results are returned in the same order as the items
+    - the first exception raised by any call is raised again here
+    """
+    items = list(items)
+    if len(items) == 0:
+        return []
+    if len(items) == 1 or max_workers <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+# field tables describe the settings of each type of resource
+# each entry is (field name, default value used when creating)
+# a field whose default is another field table holds a nested dictionary, which is compared and sent as a whole
+SHARE_SETTINGS_FIELDS = [
+    ('accessConfig', ""),
+    ('snapshotOption', "SHOW_AND_ALLOW_ACCESS"),
+    ('transferToReplicationTargetSetting', "USE_FS_DEFAULT"),
+]
+
+NFS_EXPORT_SETTINGS_FIELDS = SHARE_SETTINGS_FIELDS + [
+    ('localReadCacheOption', "DISABLED"),
+]
+
+CIFS_SHARE_SETTINGS_FIELDS = SHARE_SETTINGS_FIELDS + [
+    ('comment', ""),
+    ('userHomeDirectoryPath', ""),
+    ('isScanForVirusesEnabled', False),
+    ('maxConcurrentUsers', -1),
+    ('cacheOption', "MANUAL_CACHING_DOCS"),
+    ('userHomeDirectoryMode', "OFF"),
+    ('isFollowSymbolicLinks', False),
+    ('isFollowGlobalSymbolicLinks', False),
+    ('isForceFileNameToLowercase', False),
+    ('isABEEnabled', False),
+]
+
+QUOTA_THRESHOLD_FIELDS = [
+    ('limit', 0),
+    ('isHard', True),
+    ('reset', 5),
+    ('warning', 0),
+    ('severe', 0),
+]
+
+QUOTA_FIELDS = [
+    ('logEvent', False),
+    ('diskUsageThreshold', QUOTA_THRESHOLD_FIELDS),
+    ('fileCountThreshold', QUOTA_THRESHOLD_FIELDS),
+]
+
+def get_field_values(fields, params, existing=None):
+    """
+    Build the complete set of values for a field table
+    - requested values are used first, then existing values, then the table defaults
+    """
+    if existing == None:
+        existing = {}
+    values = {}
+    for field, default in fields:
+        if isinstance(default, list):
+            values[field] = get_field_values(default, params.get(field, {}), existing.get(field, {}))
+        else:
+            values[field] = params.get(field, existing.get(field, default))
+    return values
+
+def diff_fields(fields, params, existing):
+    """
+    Compare requested values with existing values in a single pass over a field table
+    - only fields present in params are compared
+    - returns a dictionary holding just the fields that need to change
+    """
+    changes = {}
+    for field, default in fields:
+        if field not in params:
+            continue
+        if isinstance(default, list):
+            requested = get_field_values(default, params[field], existing.get(field, {}))
+            if len(diff_fields(default, requested, existing.get(field, {}))) != 0:
+                changes[field] = requested
+        elif params[field] != existing.get(field, None):
+            changes[field] = params[field]
+    return changes
+
+def get_path_value(obj, path):
+    """
+    Look up a field, which may be a dotted path into nested dictionaries such as settings.snapshotOption
+    - returns a (found, value) tuple
+    """
+    for part in path.split('.'):
+        if not isinstance(obj, dict) or part not in obj:
+            return False, None
+        obj = obj[part]
+    return True, obj
+
+def project_fields(obj, fields):
+    """
+    Return a copy of obj holding only the listed fields, keeping the nesting of any dotted paths
+    """
+    projected = {}
+    for path in fields:
+        found, value = get_path_value(obj, path)
+        if found == False:
+            continue
+        parts = path.split('.')
+        target = projected
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return projected
+
+def shape_facts(facts, fields=None, where=None):
+    """
+    Filter and project a list of facts in a single pass
+    - where maps fields to required values, a list of allowed values, or a regular expression prefixed with ~
+    - fields lists the fields to keep in each of the remaining facts
+    - a single fact, rather than a list, is only projected
+    """
+    if isinstance(facts, dict):
+        if fields:
+            return project_fields(facts, fields)
+        return facts
+    return list(iterate_shaped_facts(facts, fields, where))
+
+def iterate_shaped_facts(facts, fields=None, where=None):
+    """
+    Yield each filtered and projected fact as it is read, so facts can be streamed from a paged listing
+    - facts that are not dictionaries, such as the names in a list of ports, are yielded unchanged
+    """
+    tests = []
+    for path, expected in (where or {}).items():
+        if hasattr(expected, 'startswith') and expected.startswith('~'):
+            pattern = re.compile(expected[1:])
+            tests.append((path, lambda found, value, pattern=pattern: found and pattern.search(str(value)) != None))
+        elif isinstance(expected, list):
+            tests.append((path, lambda found, value, expected=expected: found and value in expected))
+        else:
+            tests.append((path, lambda found, value, expected=expected: found and value == expected))
+    for fact in facts:
+        if not isinstance(fact, dict):
+            yield fact
+        elif all([test(*get_path_value(fact, path)) for path, test in tests]):
+            if fields:
+                fact = project_fields(fact, fields)
+            yield fact
+
+def flatten_fact(fact, prefix=""):
+    """
+    Flatten nested dictionaries into dotted field names, for writing facts as CSV rows
+    - lists are kept as JSON text
+    """
+    flat = {}
+    for field, value in fact.items():
+        if isinstance(value, dict):
+            flat.update(flatten_fact(value, prefix + field + "."))
+        elif isinstance(value, list):
+            flat[prefix + field] = json.dumps(value, sort_keys=True)
+        else:
+            flat[prefix + field] = value
+    return flat
+
+class FactFileWriter:
+    """
+    Write facts to JSON lines or CSV files as they are gathered, rather than holding them in memory
+    - if path contains {fact} each type of fact is written to its own file, named by replacing {fact} with the fact key
+    - otherwise every fact is written to one file - JSON lines are then written as {"fact": key, "data": fact}
+    - CSV output needs a file for each type of fact, and its columns are the fields requested, or the fields of the first fact
+    - files are gzip compressed if compress is True or the path ends with .gz
+    """
+    def __init__(self, path, format="jsonl", compress=False):
+        assert format in ["jsonl", "csv"], "output_format must be 'jsonl' or 'csv'"
+        self.path = path
+        self.format = format
+        self.compress = compress == True or path.endswith(".gz")
+        self.separate = "{fact}" in path
+        self.files = {}
+        self.counts = {}
+
+    def open(self, path):
+        if self.compress:
+            return io.TextIOWrapper(gzip.open(path, 'wb'), encoding='utf-8', newline='')
+        return io.open(path, 'w', encoding='utf-8', newline='')
+
+    def write(self, key, facts, fields=None):
+        assert self.format != "csv" or self.separate or len([other for other in self.counts if other != key]) == 0, \
+            "CSV output of more than one type of fact needs {fact} in the output_file name"
+        path = self.path.replace("{fact}", key)
+        if path not in self.files:
+            self.files[path] = {'file': self.open(path), 'writer': None}
+        output = self.files[path]
+        count = 0
+        for fact in facts:
+            if self.format == "csv":
+# facts that are not objects, such as port names, are written in a single name column
+                row = flatten_fact(fact) if isinstance(fact, dict) else {'name': fact}
+                if output['writer'] == None:
+                    columns = fields if fields else sorted(row.keys())
+# facts with fields that are not in the first fact have those fields left out
+                    output['writer'] = csv.DictWriter(output['file'], columns, extrasaction='ignore')
+                    output['writer'].writeheader()
+                output['writer'].writerow(row)
+            elif self.separate:
+                output['file'].write(json.dumps(fact, separators=(',', ':')) + "\n")
+            else:
+                output['file'].write(json.dumps({'fact': key, 'data': fact}, separators=(',', ':')) + "\n")
+            count += 1
+        self.counts[key] = self.counts.get(key, 0) + count
+        return count
+
+    def close(self):
+        for output in self.files.values():
+            output['file'].close()
+        return {'files': sorted(self.files.keys()), 'counts': self.counts}
+
+# fields that identify each object of a fact list, in order of preference
+FACT_IDENTITY_FIELDS = {
+    'nodes': ['nodeId', 'objectId', 'name'],
+    'virtualServers': ['virtualServerId', 'objectId', 'name'],
+    'systemDrives': ['systemDriveId', 'objectId'],
+    'storagePools': ['storagePoolId', 'objectId', 'label'],
+    'filesystems': ['filesystemId', 'objectId', 'label'],
+    'nfsExports': ['objectId', 'name'],
+    'cifsShares': ['objectId', 'name'],
+    'snapshots': ['objectId', 'name', 'displayName'],
+    'networkPorts': ['objectId', 'name'],
+    'aggregatePorts': ['objectId', 'name'],
+    'virtualVolumes': ['objectId', 'name'],
+}
+
+def get_fingerprint(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode('utf-8')).hexdigest()
+
+def get_fact_identity(key, obj, fingerprint):
+    if not isinstance(obj, dict):
+        return fingerprint
+    for field in FACT_IDENTITY_FIELDS.get(key, ['objectId', 'name']):
+        if field in obj:
+            return str(obj[field])
+# objects with no identity can only be matched by their content
+    return fingerprint
+
+def get_fact_fingerprints(facts):
+    """
+    Fingerprint every object of each fact list, keyed by the identity of the object
+    - single facts, rather than lists, are not fingerprinted
+    """
+    fingerprints = {}
+    for key, objs in facts.items():
+        if isinstance(objs, list):
+            fingerprints[key] = {}
+            for obj in objs:
+                fingerprint = get_fingerprint(obj)
+                fingerprints[key][get_fact_identity(key, obj, fingerprint)] = fingerprint
+    return fingerprints
+
+def iterate_fact_fingerprints(key, objs, fingerprints):
+    """
+    Yield each object of a fact list unchanged, adding its fingerprint to fingerprints as it passes
+    - used to fingerprint facts that are written to a file rather than held in memory
+    """
+    for obj in objs:
+        fingerprint = get_fingerprint(obj)
+        fingerprints[get_fact_identity(key, obj, fingerprint)] = fingerprint
+        yield obj
+
+def get_fact_changes(key, objs, previous):
+    """
+    Compare a fact list with the fingerprints of a previous run, in a single pass over the objects
+    - previous maps object identities to fingerprints, and is None if the fact was not gathered before
+    - returns the changes, holding the added and changed objects and the identities of removed objects, and the new fingerprints
+    """
+    if previous == None:
+        previous = {}
+    changes = {'added': [], 'changed': [], 'removed': []}
+    fingerprints = {}
+    for obj in objs:
+        fingerprint = get_fingerprint(obj)
+        identity = get_fact_identity(key, obj, fingerprint)
+        fingerprints[identity] = fingerprint
+        if identity not in previous:
+            changes['added'].append(obj)
+        elif previous[identity] != fingerprint:
+            changes['changed'].append(obj)
+    changes['removed'] = sorted([identity for identity in previous if identity not in fingerprints])
+    return changes, fingerprints
+
+def load_fact_fingerprints(path):
+    """
+    Read the fingerprints of a previous run from a file
+    - the file can hold fingerprints saved by save_fact_fingerprints, or previously gathered facts in JSON
+    - a missing file is treated as a run that gathered nothing
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    if 'ansible_facts' in data:
+        data = data['ansible_facts']
+    if 'fingerprints' in data:
+        return data['fingerprints']
+    return get_fact_fingerprints(data)
+
+def save_fact_fingerprints(path, fingerprints):
+# write a new file and rename it, so an interrupted save never leaves a partial file
+    temp = path + ".tmp"
+    with open(temp, 'w') as f:
+        json.dump({'fingerprints': fingerprints}, f)
+    os.rename(temp, path)
+
+# the number of bytes in each of the units accepted for sizes
+def get_unit_multiplier(unit):
+    unit = unit.lower()
+    if unit == "b" or unit == "bytes":
+        return 1
+    if unit == "k" or unit == "kb":
+        return 1000
+    if unit == "kib":
+        return 1024
+    if unit == "m" or unit == "mb":
+        return 1000 * 1000
+    if unit == "mib":
+        return 1024 * 1024
+    if unit == "g" or unit == "gb":
+        return 1000 * 1000 * 1000
+    if unit == "gib":
+        return 1024 * 1024 * 1024
+    if unit == "t" or unit == "tb":
+        return 1000 * 1000 * 1000 * 1000
+    if unit == "tib":
+        return 1024 * 1024 * 1024 * 1024
+    return 1
+
+# fields that may hold the capacity figures of filesystems and storage pools, in order of preference
+CAPACITY_FIELDS = {
+    'total': ['capacity', 'totalCapacity', 'size'],
+    'used': ['usedCapacity', 'used', 'usedSize'],
+    'free': ['freeCapacity', 'free', 'freeSize'],
+}
+
+def get_capacity_values(obj):
+    """
+    Return the total, used and free capacity of a filesystem or storage pool in bytes
+    - a missing used or free figure is worked out from the other two, otherwise missing figures are 0
+    """
+    values = {}
+    for name, candidates in CAPACITY_FIELDS.items():
+        values[name] = None
+        for field in candidates:
+            if obj.get(field, None) not in [None, ""]:
+                values[name] = int(obj[field])
+                break
+    if values['used'] == None and values['total'] != None and values['free'] != None:
+        values['used'] = values['total'] - values['free']
+    if values['free'] == None and values['total'] != None and values['used'] != None:
+        values['free'] = values['total'] - values['used']
+    return values['total'] or 0, values['used'] or 0, values['free'] or 0
+
+def get_capacity_summary(filesystems, storage_pools, multiplier=1):
+    """
+    Work out capacity aggregates for each storage pool, each virtual server and the whole cluster
+    - the filesystems are read once into columns, and every aggregate is accumulated in the same pass
+    - allocated is the total capacity of the filesystems, and overcommit is allocated as a proportion of the pool capacity
+    - all sizes are divided by multiplier, so they are reported in the requested unit
+    """
+    columns = {'pool': [], 'evs': [], 'total': [], 'used': [], 'free': []}
+    for fs in filesystems:
+        total, used, free = get_capacity_values(fs)
+        columns['pool'].append(fs.get('storagePoolId', None))
+        columns['evs'].append(fs.get('virtualServerId', None))
+        columns['total'].append(total)
+        columns['used'].append(used)
+        columns['free'].append(free)
+    pools = {}
+    for pool in storage_pools:
+        total, used, free = get_capacity_values(pool)
+        pools[str(pool['storagePoolId'])] = {'storagePoolId': pool['storagePoolId'], 'label': pool.get('label', None), 'capacity': total,
+                                             'used': used, 'free': free, 'filesystems': 0, 'allocated': 0, 'filesystemUsed': 0}
+    servers = {}
+    for pool, evs, total, used in zip(columns['pool'], columns['evs'], columns['total'], columns['used']):
+        if str(pool) in pools:
+            pools[str(pool)]['filesystems'] += 1
+            pools[str(pool)]['allocated'] += total
+            pools[str(pool)]['filesystemUsed'] += used
+        row = servers.setdefault(str(evs), {'virtualServerId': evs, 'filesystems': 0, 'allocated': 0, 'used': 0, 'free': 0})
+        row['filesystems'] += 1
+        row['allocated'] += total
+        row['used'] += used
+        row['free'] += total - used
+
+    def ratio(part, whole):
+        if whole == 0:
+            return None
+        return round(float(part) / whole, 4)
+
+    def scale(value):
+        return round(float(value) / multiplier, 2)
+
+    cluster = {'storagePools': len(pools), 'filesystems': len(columns['total']), 'capacity': sum([pool['capacity'] for pool in pools.values()]),
+               'used': sum([pool['used'] for pool in pools.values()]), 'free': sum([pool['free'] for pool in pools.values()]),
+               'allocated': sum(columns['total']), 'filesystemUsed': sum(columns['used'])}
+    for row in list(pools.values()) + [cluster]:
+        row['utilization'] = ratio(row['used'], row['capacity'])
+        row['overcommit'] = ratio(row['allocated'], row['capacity'])
+        row['filesystemUtilization'] = ratio(row['filesystemUsed'], row['allocated'])
+    for row in servers.values():
+        row['utilization'] = ratio(row['used'], row['allocated'])
+    for row in list(pools.values()) + list(servers.values()) + [cluster]:
+        for field in ['capacity', 'used', 'free', 'allocated', 'filesystemUsed']:
+            if field in row:
+                row[field] = scale(row[field])
+    return {'cluster': cluster,
+            'storagePools': sorted(pools.values(), key=lambda row: str(row['storagePoolId'])),
+            'virtualServers': sorted(servers.values(), key=lambda row: str(row['virtualServerId']))}
+
+class CapacityTrendStore:
+    """
+    An append-only file of capacity samples, with a forecast of when each filesystem or storage pool will be full
+    - each sample is a fixed size record of time, series number, used bytes and total bytes
+    - the series names and labels are kept in a JSON file alongside, named <path>.series.json
+    - the records are read through a memory map and split into columns, and the growth of every series is fitted in one pass
+    """
+    MAGIC = b"HNASCAP1"
+    RECORD = struct.Struct("<dIqq")
+
+    def __init__(self, path):
+        self.path = path
+        self.series_path = path + ".series.json"
+
+    def read_series(self):
+        if not os.path.exists(self.series_path):
+            return []
+        with open(self.series_path) as f:
+            return json.load(f)['series']
+
+    def append(self, samples, now=None):
+        """
+        Append a sample for each (name, label, used, total) item
+        - the store is locked while it is written, so several tasks can record samples at the same time
+        """
+        if now == None:
+            now = time.time()
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                series = self.read_series()
+                numbers = dict([(item['name'], number) for number, item in enumerate(series)])
+                records = []
+                for name, label, used, total in samples:
+                    if name not in numbers:
+                        numbers[name] = len(series)
+                        series.append({'name': name, 'label': label})
+                    series[numbers[name]]['label'] = label
+                    records.append(self.RECORD.pack(now, numbers[name], int(used), int(total)))
+# the series file is replaced before any records that refer to new series are written
+                temp = self.series_path + ".tmp"
+                with open(temp, 'w') as series_file:
+                    json.dump({'series': series}, series_file)
+                os.rename(temp, self.series_path)
+# the size is read once the lock is held, so only the first of several writers of a new file writes the header
+                if os.fstat(f.fileno()).st_size == 0:
+                    f.write(self.MAGIC)
+                f.write(b"".join(records))
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return len(records)
+
+    def read_columns(self, since=None):
+        """
+        Return the samples as columns of time, series number, used and total, optionally only those taken since a time
+        """
+        columns = ([], [], [], [])
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= len(self.MAGIC):
+            return columns
+        with open(self.path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                assert data[:len(self.MAGIC)] == self.MAGIC, "{} is not a capacity trend file".format(self.path)
+                end = len(self.MAGIC) + (len(data) - len(self.MAGIC)) // self.RECORD.size * self.RECORD.size
+                for offset in range(len(self.MAGIC), end, self.RECORD.size):
+                    record = self.RECORD.unpack_from(data, offset)
+                    if since == None or record[0] >= since:
+                        for column, value in zip(columns, record):
+                            column.append(value)
+            finally:
+                data.close()
+        return columns
+
+    def forecast(self, window_days=None, now=None):
+        """
+        Fit a straight line to the used capacity of every series, and work out how long each has until it is full
+        - only samples taken in the last window_days are used, if it is supplied
+        - growth is in bytes per day, and daysToFull is None for series that are not growing
+        """
+        if now == None:
+            now = time.time()
+        since = None
+        if window_days != None:
+            since = now - float(window_days) * 86400
+        times, numbers, used, totals = self.read_columns(since)
+        series = self.read_series()
+# running sums for a least squares fit of used against time, plus the latest sample, for each series
+        sums = {}
+        for taken, number, used_bytes, total in zip(times, numbers, used, totals):
+            days = (taken - now) / 86400.0
+            entry = sums.setdefault(number, [0, 0.0, 0.0, 0.0, 0.0, None, 0, 0])
+            entry[0] += 1
+            entry[1] += days
+            entry[2] += used_bytes
+            entry[3] += days * days
+            entry[4] += days * used_bytes
+            if entry[5] == None or taken >= entry[5]:
+                entry[5], entry[6], entry[7] = taken, used_bytes, total
+        forecasts = []
+        for number, (n, st, su, stt, stu, latest, latest_used, latest_total) in sums.items():
+            growth = None
+            days_to_full = None
+            if n > 1 and n * stt - st * st > 0:
+                growth = (n * stu - st * su) / (n * stt - st * st)
+                if growth > 0:
+                    days_to_full = round(max(latest_total - latest_used, 0) / growth, 1)
+            name = series[number]['name'] if number < len(series) else str(number)
+            label = series[number]['label'] if number < len(series) else None
+            forecasts.append({'name': name, 'label': label, 'samples': n, 'used': latest_used, 'capacity': latest_total,
+                              'growthPerDay': growth, 'daysToFull': days_to_full, 'lastSample': latest})
+        return sorted(forecasts, key=lambda item: (item['daysToFull'] == None, item['daysToFull'], item['name']))
+
+# ways of choosing the storage pool for a new filesystem - each gives a sort key, where the lowest key is preferred
+PLACEMENT_STRATEGIES = {
+    'free': lambda pool: (-pool['free'], pool['count']),
+    'count': lambda pool: (pool['count'], -pool['free']),
+    'allocation': lambda pool: (float(pool['allocated']) / pool['capacity'] if pool['capacity'] else 0, -pool['free']),
+}
+
+def choose_storage_pools(storage_pools, filesystems, capacities, strategy="free", candidates=None, placements=None):
+    """
+    Choose a storage pool for each of a batch of new filesystems, from one reading of the pools and filesystems
+    - the largest filesystems are placed first, each in the preferred pool that still has room for it
+    - free space, filesystem counts and allocation are updated as each filesystem is placed, so a batch is spread across the pools
+    - candidates optionally limits the pools to a list of storage pool IDs or labels
+    - placements optionally gives a (strategy, candidates) pair for each capacity, in place of strategy and candidates
+    - returns the storagePoolId chosen for each capacity, in the same order as capacities
+    """
+    if placements == None:
+        placements = [(strategy, candidates)] * len(capacities)
+    for item_strategy, _ in placements:
+        assert item_strategy in PLACEMENT_STRATEGIES, "storage_pool_placement must be one of {}".format(sorted(PLACEMENT_STRATEGIES.keys()))
+    pools = {}
+    for pool in storage_pools:
+        total, _, free = get_capacity_values(pool)
+        pools[str(pool['storagePoolId'])] = {'storagePoolId': pool['storagePoolId'], 'label': pool.get('label', None),
+                                             'capacity': total, 'free': free, 'count': 0, 'allocated': 0}
+    for fs in filesystems:
+        pool = pools.get(str(fs.get('storagePoolId', None)), None)
+        if pool != None:
+            pool['count'] += 1
+            pool['allocated'] += get_capacity_values(fs)[0]
+    chosen = [None] * len(capacities)
+    for index in sorted(range(len(capacities)), key=lambda i: capacities[i], reverse=True):
+        item_strategy, item_candidates = placements[index]
+        available = [pool for pool in pools.values() if item_candidates == None or str(pool['storagePoolId']) in [str(c) for c in item_candidates]
+                     or pool['label'] in item_candidates]
+        assert len(available) != 0, "No storage pools are available for placement"
+        fitting = [pool for pool in available if pool['free'] >= capacities[index]]
+        assert len(fitting) != 0, "No storage pool has {} bytes free for a new filesystem".format(capacities[index])
+        pool = sorted(fitting, key=PLACEMENT_STRATEGIES[item_strategy])[0]
+        pool['free'] -= capacities[index]
+        pool['count'] += 1
+        pool['allocated'] += capacities[index]
+        chosen[index] = pool['storagePoolId']
+    return chosen
+
+def get_node_loads(nodes, virtual_servers, filesystems, node_fields=('nodeId', 'clusterNodeId')):
+    """
+    Work out the load on each cluster node, as the virtual servers it hosts and the filesystems they host
+    - node_fields are the virtual server fields that may hold the hosting node, as the name differs between API versions
+    - returns a dictionary of node ID to load
+    """
+    loads = {}
+    for node in nodes:
+        loads[str(node['nodeId'])] = {'nodeId': node['nodeId'], 'name': node.get('name', None), 'virtualServers': [], 'filesystems': 0}
+    evs_node = {}
+    for evs in virtual_servers:
+        for field in node_fields:
+            if evs.get(field, None) != None and str(evs[field]) in loads:
+                evs_node[str(evs['virtualServerId'])] = str(evs[field])
+                loads[str(evs[field])]['virtualServers'].append({'virtualServerId': evs['virtualServerId'], 'name': evs.get('name', None), 'filesystems': 0})
+                break
+    for fs in filesystems:
+        node = evs_node.get(str(fs.get('virtualServerId', None)), None)
+        if node != None:
+            loads[node]['filesystems'] += 1
+            for evs in loads[node]['virtualServers']:
+                if str(evs['virtualServerId']) == str(fs['virtualServerId']):
+                    evs['filesystems'] += 1
+    return loads
+
+def get_load_key(load):
+    return (load['filesystems'], len(load['virtualServers']), str(load['nodeId']))
+
+def choose_node(loads, candidates=None):
+    """
+    Choose the least loaded node, by the number of filesystems and then virtual servers it hosts
+    - candidates optionally limits the nodes to a list of node IDs
+    """
+    choices = [load for load in loads.values() if candidates == None or str(load['nodeId']) in [str(c) for c in candidates]]
+    assert len(choices) != 0, "No cluster nodes are available for placement"
+    return sorted(choices, key=get_load_key)[0]['nodeId']
+
+def get_rebalance_moves(loads):
+    """
+    Suggest virtual server moves that even out the number of filesystems hosted by each node
+    - the busiest node repeatedly gives the least loaded node the largest virtual server that narrows the gap between them
+    - the loads are updated as moves are suggested, and nothing is moved on the server
+    """
+    moves = []
+    while len(loads) > 1:
+        ordered = sorted(loads.values(), key=get_load_key)
+        lightest, busiest = ordered[0], ordered[-1]
+        gap = busiest['filesystems'] - lightest['filesystems']
+        movable = [evs for evs in busiest['virtualServers'] if 0 < evs['filesystems'] < gap]
+        if len(movable) == 0:
+            break
+        evs = sorted(movable, key=lambda item: item['filesystems'])[-1]
+        busiest['virtualServers'].remove(evs)
+        busiest['filesystems'] -= evs['filesystems']
+        lightest['virtualServers'].append(evs)
+        lightest['filesystems'] += evs['filesystems']
+        moves.append({'virtualServerId': evs['virtualServerId'], 'name': evs['name'], 'filesystems': evs['filesystems'],
+                      'fromNodeId': busiest['nodeId'], 'toNodeId': lightest['nodeId']})
+    return moves
+
+# system drive fields that identify the back-end hardware a drive is built on, from the widest to the narrowest
+SYSTEM_DRIVE_SPREAD_FIELDS = ['storageSystemName', 'arraySerialNumber', 'rackName', 'controller', 'raidGroup', 'parityGroup']
+
+def choose_system_drives(system_drives, count=None, size=None, spread_fields=None, allow_denied=False):
+    """
+    Choose free system drives for a new storage pool, spread as evenly as possible across the back-end hardware
+    - either count drives are chosen, or enough drives for their total capacity to reach size bytes
+    - each drive chosen is the one sharing the fewest back-end values with the drives already chosen, comparing the widest field first
+    - ties go to the largest drive, then the lowest ID
+    - returns the chosen drives
+    """
+    assert count != None or size != None, "Either 'system_drive_count' or 'pool_size' is required to choose system drives"
+    assert count == None or 4 <= count <= 16, "'system_drive_count' must be from 4 to 16, as a storage pool has 4 to 16 system drives"
+    if spread_fields == None:
+        spread_fields = SYSTEM_DRIVE_SPREAD_FIELDS
+    free = [drive for drive in system_drives if drive.get('isAssignedToStoragePool', False) == False
+            and (allow_denied == True or drive.get('isAccessAllowed', True) == True)]
+    spread_fields = [field for field in spread_fields if any([field in drive for drive in free])]
+    used = [{} for _ in spread_fields]
+    chosen = []
+    total = 0
+    while len(chosen) < 16 and len(free) != 0:
+        if count != None and len(chosen) >= count:
+            break
+        if count == None and total >= size and len(chosen) >= 4:
+            break
+        drive = sorted(free, key=lambda drive: ([used[i].get(str(drive.get(field, None)), 0) for i, field in enumerate(spread_fields)],
+                                                -get_capacity_values(drive)[0], int(drive['systemDriveId'])))[0]
+        free.remove(drive)
+        for i, field in enumerate(spread_fields):
+            value = str(drive.get(field, None))
+            used[i][value] = used[i].get(value, 0) + 1
+        chosen.append(drive)
+        total += get_capacity_values(drive)[0]
+    assert len(chosen) >= 4 and (count == None or len(chosen) == count), \
+        "Not enough free system drives - found {} of the {} needed".format(len(chosen), count if count != None else 4)
+    assert size == None or total >= size, "The free system drives can only provide {} of the {} bytes requested".format(total, size)
+    return chosen
+
+class RequestGovernor:
+    """
+    Limit the rate and concurrency of requests to one SMU, across every process on this machine
+    - the rate is a token bucket, kept in a file that is locked while it is updated
+    - concurrency is a set of slot files, and a request holds a lock on one of them while it is in flight
+    - locks are released by the operating system if a process dies, so a failed task never leaves a slot taken
+    - requests wait for a token and a slot rather than failing
+    - the rate must be more than 0, the burst at least 1 and the concurrency at least 1
+    """
+    def __init__(self, address, rate=None, burst=None, max_concurrent=None, state_dir=None):
+        self.address = address
+        self.rate = float(rate) if rate != None else None
+        self.burst = float(burst) if burst != None else max(self.rate or 1.0, 1.0)
+        self.max_concurrent = int(max_concurrent) if max_concurrent != None else None
+        assert self.rate == None or self.rate > 0, "The rate limit for {} must be more than 0".format(address)
+        assert self.burst >= 1, "The rate burst for {} must be at least 1".format(address)
+        assert self.max_concurrent == None or self.max_concurrent >= 1, "The maximum concurrent requests for {} must be at least 1".format(address)
+        self.state_dir = os.path.expanduser(state_dir or "~/.ansible/tmp/hnas_governor")
+        if not os.path.isdir(self.state_dir):
+            try:
+                os.makedirs(self.state_dir, 0o700)
+            except OSError:
+                pass                                    # another process has just created it
+
+    @classmethod
+    def from_config(cls, address):
+        """
+        Build the governor for an SMU from the environment, or return None if no limits are set
+        - HNAS_GOVERNOR_CONFIG names a JSON file of limits, keyed by SMU address, with "default" used for other addresses
+        - HNAS_RATE_LIMIT, HNAS_RATE_BURST and HNAS_MAX_CONCURRENT set limits for every SMU, and HNAS_GOVERNOR_DIR the lock directory
+        """
+        settings = {'rate': os.environ.get('HNAS_RATE_LIMIT', None), 'burst': os.environ.get('HNAS_RATE_BURST', None),
+                    'max_concurrent': os.environ.get('HNAS_MAX_CONCURRENT', None), 'state_dir': os.environ.get('HNAS_GOVERNOR_DIR', None)}
+        config_file = os.environ.get('HNAS_GOVERNOR_CONFIG', None)
+        if config_file != None and os.path.exists(os.path.expanduser(config_file)):
+            with open(os.path.expanduser(config_file)) as f:
+                config = json.load(f)
+            settings.update(config.get(address, config.get('default', {})))
+        if settings.get('rate', None) == None and settings.get('max_concurrent', None) == None:
+            return None
+        return cls(address, settings.get('rate', None), settings.get('burst', None), settings.get('max_concurrent', None), settings.get('state_dir', None))
+
+    def get_path(self, name):
+        return os.path.join(self.state_dir, "{}.{}".format(re.sub(r'[^0-9a-zA-Z.-]', '_', self.address), name))
+
+    def take_token(self):
+        while True:
+            with os.fdopen(os.open(self.get_path("bucket"), os.O_RDWR | os.O_CREAT, 0o600), 'r+') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    text = f.read()
+                    now = time.time()
+                    bucket = json.loads(text) if text != "" else {'tokens': self.burst, 'updated': now}
+                    tokens = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * self.rate)
+                    wait = 0
+                    if tokens >= 1:
+                        tokens -= 1
+                    else:
+                        wait = (1 - tokens) / self.rate
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps({'tokens': tokens, 'updated': now}))
+# the new state must reach the file before the lock is released
+                    f.flush()
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    def take_slot(self):
+        delay = 0.01
+        while True:
+            for slot in range(self.max_concurrent):
+                f = open(self.get_path("slot{}".format(slot)), 'a')
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return f
+                except (IOError, OSError):
+                    f.close()
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def call(self, function):
+        """
+        Call function once a token and a slot are available, holding the slot until it returns
+        """
+        if self.rate != None:
+            self.take_token()
+        slot = None
+        if self.max_concurrent != None:
+            slot = self.take_slot()
+        try:
+            return function()
+        finally:
+            if slot != None:
+                fcntl.flock(slot.fileno(), fcntl.LOCK_UN)
+                slot.close()
+
+class RequestCoalescer:
+    """
+    Share the result of identical GET requests that are in flight at the same time, across every process on this machine
+    - only the cluster wide listings that many tasks read at the start of a playbook are shared, and only if HNAS_COALESCE_GETS is set
+    - the first request for a URL holds a lock on a file while it is sent, and identical requests wait for the lock
+    - waiters hold a shared lock on a second file, so the result is only written to disk when someone is waiting for it
+    - a waiter only uses a result that completed after it asked, and that was sent after its own client last made a change
+    - results are kept by a hash of the URL and the credentials, so clients using different credentials never share them
+    - the last request for a URL removes its files, so results are only kept on disk while they are being shared
+    """
+    LISTINGS = ['nodes', 'virtual-servers', 'filesystems', 'system-drives', 'storage-pools']
+
+    def __init__(self, state_dir=None, max_age=300):
+        self.state_dir = os.path.expanduser(state_dir or "~/.ansible/tmp/hnas_coalesce")
+        if not os.path.isdir(self.state_dir):
+            try:
+                os.makedirs(self.state_dir, 0o700)
+            except OSError:
+                pass                                    # another process has just created it
+# files left behind by a process that died are removed once they are old
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build the coalescer from the environment, or return None if it is not enabled or its directory can not be used
+        - HNAS_COALESCE_GETS=true enables it, and HNAS_COALESCE_DIR sets the directory that holds the locks and results
+        """
+        if os.environ.get('HNAS_COALESCE_GETS', 'false').lower() not in ['true', 'yes', 'on', '1']:
+            return None
+        try:
+            return cls(os.environ.get('HNAS_COALESCE_DIR', None))
+        except OSError:
+            return None
+
+    def is_shared(self, resource):
+        """
+        Check whether a resource, the part of the URL after the API version, is one of the listings that are shared
+        """
+        return resource.split('?')[0].strip('/') in self.LISTINGS
+
+    def get_path(self, key, name):
+        return os.path.join(self.state_dir, "{}.{}".format(key, name))
+
+    def has_waiters(self, key):
+        with open(self.get_path(key, "wait"), 'a') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return True
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return False
+
+    def read_result(self, key, asked, since):
+        try:
+            with open(self.get_path(key, "json")) as f:
+                result = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if result['finished'] >= asked and result['sent'] >= since:
+            return result
+        return None
+
+    def write_result(self, key, sent, body):
+        path = self.get_path(key, "json")
+        temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.current_thread().ident)
+        with os.fdopen(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'sent': sent, 'finished': time.time(), 'body': body}, f)
+        os.rename(temp, path)
+
+    def remove_files(self, key, waiting, lock):
+        """
+        Remove the files for a URL if no other request holds or is waiting for them
+        - a request that opened the files just before they are removed finds no result, and sends its own GET
+        """
+        try:
+            fcntl.flock(waiting.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return
+        for name in ["json", "wait", "lock"]:
+            try:
+                os.remove(self.get_path(key, name))
+            except OSError:
+                pass
+
+    def call(self, url, identity, since, function):
+        """
+        Return the result of function, which sends a GET for url, or the result of an identical GET that was in flight
+        - identity holds anything else that changes the result, such as the credentials
+        - since is the earliest time that a shared request may have been sent
+        """
+        key = hashlib.sha1(json.dumps([url, identity], sort_keys=True).encode('utf-8')).hexdigest()
+        asked = time.time()
+        try:
+            waiting = open(self.get_path(key, "wait"), 'a')
+            lock = open(self.get_path(key, "lock"), 'a')
+        except (IOError, OSError):
+            return function()
+        try:
+            fcntl.flock(waiting.fileno(), fcntl.LOCK_SH)
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            fcntl.flock(waiting.fileno(), fcntl.LOCK_UN)
+            result = self.read_result(key, asked, since)
+            if result != None:
+                return result['body']
+            sent = time.time()
+            body = function()
+            if self.has_waiters(key):
+                try:
+                    self.write_result(key, sent, body)
+                except (IOError, OSError):
+                    pass                                # the waiters send their own requests
+            return body
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+            self.remove_files(key, waiting, lock)
+            lock.close()
+            waiting.close()
+
+# fields that may hold the time a snapshot was taken, in order of preference
+SNAPSHOT_TIME_FIELDS = ['creationTime', 'timestamp', 'createdTime']
+# ISO 8601 times, with optional fractions of a second and a UTC offset
+SNAPSHOT_TIME_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(\.\d+)?\s*(Z|[+-]\d{2}:?\d{2})?$')
+
+def get_snapshot_name(snapshot):
+    return snapshot.get('name', snapshot.get('displayName', ''))
+
+def parse_snapshot_time(value):
+    """
+    Return a snapshot time value as seconds since the epoch, or None if it can not be parsed
+    - numbers, or strings of numbers, that are too big to be seconds are taken to be milliseconds
+    - ISO 8601 strings without a UTC offset are taken to be in UTC
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        try:
+            match = SNAPSHOT_TIME_PATTERN.match(value)
+        except TypeError:
+            return None
+        if match == None:
+            return None
+        try:
+            seconds = calendar.timegm(time.strptime(match.group(1) + "T" + match.group(2), "%Y-%m-%dT%H:%M:%S"))
+        except ValueError:
+            return None
+        if match.group(3) != None:
+            seconds += float(match.group(3))
+        offset = match.group(4)
+        if offset != None and offset != "Z":
+            offset = offset.replace(":", "")
+            seconds -= (1 if offset[0] == "+" else -1) * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+        return float(seconds)
+    if value != value:                  # not a number
+        return None
+    if value > 100000000000:            # too big to be seconds, so must be milliseconds
+        return value / 1000.0
+    return value
+
+def get_snapshot_time(snapshot):
+    """
+    Return the time a snapshot was taken as seconds since the epoch, or None if it is not known
+    - the first of the SNAPSHOT_TIME_FIELDS that can be parsed is used
+    """
+    for field in SNAPSHOT_TIME_FIELDS:
+        value = snapshot.get(field, None)
+        if value == None or value == "":
+            continue
+        value = parse_snapshot_time(value)
+        if value != None:
+            return value
+    return None
+
+def get_snapshot_retention_plan(snapshots, keep_last=None, keep_daily=None, keep_weekly=None, max_age_days=None, now=None):
+    """
+    Work out which snapshots a retention policy would delete, in one pass over the snapshots sorted newest first
+    - keep_last keeps the newest snapshots, keep_daily and keep_weekly keep the newest snapshot of each recent day or week
+    - if any keep rule is supplied, snapshots not kept by a rule are deleted
+    - snapshots older than max_age_days are deleted, unless kept by keep_last
+    - snapshots with no known time are never deleted
+    - returns a list of the snapshots to delete
+    """
+    if now == None:
+        now = time.time()
+    keep_rules = keep_last != None or keep_daily != None or keep_weekly != None
+    cutoff = None
+    if max_age_days != None:
+        cutoff = now - float(max_age_days) * 86400
+    timed = [(get_snapshot_time(snapshot), snapshot) for snapshot in snapshots]
+    timed = sorted([item for item in timed if item[0] != None], key=lambda item: item[0], reverse=True)
+    today = int(now // 86400)
+    days = set()
+    weeks = set()
+    delete = []
+    for position, (taken, snapshot) in enumerate(timed):
+        day = int(taken // 86400)
+# days since the epoch start on a Thursday, so shift by 3 days to make weeks start on a Monday
+        week = (day + 3) // 7
+        newest = keep_last != None and position < keep_last
+        kept = newest
+        if keep_daily != None and day not in days and today - day < keep_daily:
+            days.add(day)
+            kept = True
+        if keep_weekly != None and week not in weeks and (today + 3) // 7 - week < keep_weekly:
+            weeks.add(week)
+            kept = True
+        if (keep_rules and not kept) or (cutoff != None and taken < cutoff and not newest):
+            delete.append(snapshot)
+    return delete
+
+# listings that can be indexed by name - <url> <list key> <name field> <id field>
+RESOURCE_INDEXES = {
+    'virtual_server': ('virtual-servers', 'virtualServers', 'name', 'virtualServerId'),
+    'storage_pool': ('storage-pools', 'storagePools', 'label', 'storagePoolId'),
+    'filesystem': ('filesystems', 'filesystems', 'label', 'filesystemId'),
+    'node': ('nodes', 'nodes', 'name', 'nodeId'),
+}
+
+# the number of seconds that capability probe results are cached on disk
+CAPABILITY_TTL = 24 * 60 * 60
+
+# when several api_url endpoints are given for a cluster, an endpoint is skipped for ENDPOINT_COOLDOWN seconds
+# after a connection error or ENDPOINT_FAILURE_THRESHOLD consecutive 5xx responses
+ENDPOINT_FAILURE_THRESHOLD = 3
+ENDPOINT_COOLDOWN = 60
+ENDPOINT_CONNECT_TIMEOUT = 10
+ENDPOINT_PROBE_TIMEOUT = 5
+# the measured latency and cool down of each endpoint are shared with other tasks through files in the endpoint
+# state directory, and an endpoint is only probed again once its latency is more than ENDPOINT_LATENCY_TTL seconds old
+ENDPOINT_LATENCY_TTL = 300
 
 class HNASFileServer:
 
 # api_url is a standard Ansible parameter - required form https://172.27.1.1:8444/v7
-    def __init__(self, api_url, verify=True):
+# api_url can also be a list, or a comma separated string, of the endpoints of the SMUs that manage one cluster
+# in check_mode no changes are sent to the server, they are recorded in planned_changes instead
+# if refresh_results is False, changed objects are built from the details read before the change instead of being read again
+    def __init__(self, api_url, verify=True, check_mode=False, refresh_results=True):
         p = re.compile(r'(?P<protocol>http[s]?)://(?P<address>[0-9a-zA-Z.-]+):(?P<port>\d+)/v(?P<version>\d)')
-        m = p.match(api_url)
-        assert m != None, "api_url is not of the correct format - http[s]://<address>:<port>/v<api-version>"
-        self.protocol = m.group('protocol')
-        self.address = m.group('address')
-        self.port = m.group('port')
-        self.version = m.group('version')
-        self.base_uri = "{}://{}:{}/v{}/storage/".format(self.protocol, self.address, self.port, self.version)
+        self.endpoints = []
+        for url in api_url if isinstance(api_url, list) else api_url.split(','):
+            m = p.match(url.strip())
+            assert m != None, "api_url is not of the correct format - http[s]://<address>:<port>/v<api-version>"
+            self.endpoints.append({'protocol': m.group('protocol'), 'address': m.group('address'), 'port': m.group('port'), 'version': m.group('version'),
+                                   'base_uri': "{}://{}:{}/v{}/storage/".format(m.group('protocol'), m.group('address'), m.group('port'), m.group('version')),
+                                   'governor': RequestGovernor.from_config(m.group('address')),
+                                   'latency': None, 'measured': 0, 'failures': 0, 'open_until': 0})
+        assert len(set([endpoint['version'] for endpoint in self.endpoints])) == 1, "All of the api_url endpoints must use the same API version"
+# requests are built against the first endpoint, and moved to the endpoint that is serving when they are sent
+        self.protocol = self.endpoints[0]['protocol']
+        self.address = self.endpoints[0]['address']
+        self.port = self.endpoints[0]['port']
+        self.version = self.endpoints[0]['version']
+        self.base_uri = self.endpoints[0]['base_uri']
+        self.endpoint = self.endpoints[0]
+        self.endpoints_probed = len(self.endpoints) == 1
+        self.endpoint_state_dir = os.path.expanduser(os.environ.get('HNAS_ENDPOINT_DIR', "~/.ansible/tmp/hnas_endpoints"))
+        self.endpoint_lock = threading.Lock()
+        self.probe_lock = threading.Lock()
         self.verify = verify
+        self.check_mode = check_mode
+        self.refresh_results = refresh_results
+        self.planned_changes = []
+        self.selected_system_drives = None
+        self.capabilities = None
+        self.capability_lock = threading.Lock()
+        self.coalescer = RequestCoalescer.from_config()
+        self.last_change = 0
+        self.indexes = {}
+        self.index_lock = threading.Lock()
+        self.directory_trees = {}
         self.headers = {}
         self.headers['Content-Type'] = 'application/json'
 # setup a few parameter names which have changed between the different API versions
@@ -41,8 +1105,12 @@ class HNASFileServer:
         else:
             self.headers["X-Api-Key"] = self.api_key
 
+# the address of the endpoint that is serving requests
     def get_address(self):
-        return self.address
+        return self.endpoint['address']
+
+    def get_endpoint(self):
+        return self.endpoint['base_uri'].replace('/storage/', '')
         
     def append_to_url(self, url, parameter):
         if url.find('?') == -1:
@@ -84,50 +1152,273 @@ class HNASFileServer:
             assert item in params, "Missing \'{}\' parameter.  {}".format(item, description)
         return
 
-    def simple_get(self, url):
-        response = requests.get(url, headers=self.headers, verify=self.verify)
+    def send_to(self, endpoint, method, url, **kwargs):
+        if url.startswith(self.base_uri):
+            url = endpoint['base_uri'] + url[len(self.base_uri):]
+        if endpoint['governor'] == None:
+            return requests.request(method, url, **kwargs)
+        return endpoint['governor'].call(lambda: requests.request(method, url, **kwargs))
+
+    def get_endpoint_state_path(self, endpoint):
+        return os.path.join(self.endpoint_state_dir, "{}_{}.json".format(re.sub(r'[^0-9a-zA-Z.-]', '_', endpoint['address']), endpoint['port']))
+
+# the state shared by other tasks is only a hint, so any problem reading or writing it is ignored
+    def load_endpoint_state(self, endpoint):
+        try:
+            with open(self.get_endpoint_state_path(endpoint)) as f:
+                state = json.load(f)
+            endpoint['latency'] = state['latency']
+            endpoint['measured'] = state['measured']
+            endpoint['open_until'] = max(endpoint['open_until'], state['open_until'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save_endpoint_state(self, endpoint):
+        path = self.get_endpoint_state_path(endpoint)
+        temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.current_thread().ident)
+        try:
+            if not os.path.isdir(self.endpoint_state_dir):
+                os.makedirs(self.endpoint_state_dir, 0o700)
+            with os.fdopen(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump({'latency': endpoint['latency'], 'measured': endpoint['measured'], 'open_until': endpoint['open_until']}, f)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            pass
+
+    def record_endpoint_result(self, endpoint, failed, trip=False):
+        """
+        Count a success or failure of an endpoint, and start its cool down once it has failed too often
+        - the start and end of a cool down are saved, so other tasks skip the endpoint as well
+        """
+        with self.endpoint_lock:
+            if failed == False:
+                endpoint['failures'] = 0
+                self.endpoint = endpoint
+                if endpoint['open_until'] == 0:
+                    return False
+                endpoint['open_until'] = 0
+            else:
+                endpoint['failures'] += 1
+                if trip == False and endpoint['failures'] < ENDPOINT_FAILURE_THRESHOLD:
+                    return False
+                endpoint['open_until'] = time.time() + ENDPOINT_COOLDOWN
+        self.save_endpoint_state(endpoint)
+        return failed
+
+    def probe_endpoint(self, endpoint):
+        start = time.time()
+        try:
+            response = self.send_to(endpoint, 'GET', self.base_uri + "file-devices", headers=self.headers, verify=self.verify, timeout=ENDPOINT_PROBE_TIMEOUT)
+            failed = response.status_code != 200
+        except Exception:
+            failed = True
+        endpoint['latency'] = time.time() - start if failed == False else None
+        endpoint['measured'] = time.time()
+        if self.record_endpoint_result(endpoint, failed, trip=failed) == False:
+            self.save_endpoint_state(endpoint)
+
+    def probe_endpoints(self):
+        """
+        Time a small request to each endpoint, the first time that a request is sent
+        - the latency and cool down saved by other tasks are used, and only endpoints with no recent latency are probed
+        - endpoints that fail the probe, or are cooling down, are skipped until their cool down has passed
+        """
+        with self.probe_lock:
+            if self.endpoints_probed == True:
+                return
+            now = time.time()
+            for endpoint in self.endpoints:
+                self.load_endpoint_state(endpoint)
+            stale = [endpoint for endpoint in self.endpoints
+                     if endpoint['open_until'] <= now and (endpoint['latency'] == None or now - endpoint['measured'] > ENDPOINT_LATENCY_TTL)]
+            run_concurrently(self.probe_endpoint, stale, max(len(stale), 1))
+            self.endpoint = self.choose_endpoint([])
+            self.endpoints_probed = True
+
+    def choose_endpoint(self, tried):
+        """
+        Return the fastest endpoint that has not been tried and is not cooling down
+        - if all of them are cooling down, the one whose cool down ends first is tried again
+        """
+        now = time.time()
+        untried = [endpoint for endpoint in self.endpoints if endpoint not in tried]
+        if len(untried) == 0:
+            return None
+        healthy = [endpoint for endpoint in untried if endpoint['open_until'] <= now]
+        if len(healthy) == 0:
+            return sorted(untried, key=lambda endpoint: endpoint['open_until'])[0]
+        return sorted(healthy, key=lambda endpoint: endpoint['latency'] if endpoint['latency'] != None else float('inf'))[0]
+
+# every request is sent from here, so that the rate and concurrency limits for the SMU are applied to all of them
+# with several endpoints, a GET that fails to connect, or trips an endpoint with a 5xx response, is sent again to the next endpoint
+# other requests are not sent again, as they may already have been carried out, but later requests go to the next endpoint
+    def send(self, method, url, **kwargs):
+        if len(self.endpoints) == 1:
+            return self.send_to(self.endpoint, method, url, **kwargs)
+        self.probe_endpoints()
+        kwargs.setdefault('timeout', (ENDPOINT_CONNECT_TIMEOUT, None))
+        tried = []
+        while True:
+            endpoint = self.choose_endpoint(tried)
+            tried.append(endpoint)
+            retry = method == 'GET' and len(tried) < len(self.endpoints)
+            try:
+                response = self.send_to(endpoint, method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.record_endpoint_result(endpoint, True, trip=True)
+                if retry == False:
+                    raise
+                continue
+            if response.status_code >= 500:
+                if self.record_endpoint_result(endpoint, True) == True and retry == True:
+                    continue
+                return response
+            self.record_endpoint_result(endpoint, False)
+            return response
+
+    def read_json(self, url):
+        response = self.send('GET', url, headers=self.headers, verify=self.verify)
         assert response.status_code == 200, "{} {} - {}".format(response.status_code, response.reason, self.get_error_details(response))
         return response.json()
 
+# identical listings in flight from other tasks are shared, but never one sent before this client's last change
+    def simple_get(self, url):
+        if self.coalescer == None or not self.coalescer.is_shared(url.replace(self.base_uri, '', 1)):
+            return self.read_json(url)
+        return self.coalescer.call(url, [self.headers, self.verify], self.last_change, lambda: self.read_json(url))
+
+# records a change that would have been made, for reporting in check mode
+    def plan_change(self, method, url, data=None):
+        change = {'method': method, 'resource': url.replace(self.base_uri, '', 1)}
+        if data != None:
+            change['data'] = data
+        self.planned_changes.append(change)
+
+# should an object be read again after it has been changed, or can the changes be merged locally
+    def refresh_needed(self, changed):
+        return changed == True and self.refresh_results == True and self.check_mode == False
+
     def simple_post(self, url, expected_status_code, data=None):
-        response = requests.post(url, headers=self.headers, json=data, verify=self.verify, allow_redirects=False)
+        if self.check_mode == True:
+            self.plan_change('POST', url, data)
+            return None
+        response = self.send('POST', url, headers=self.headers, json=data, verify=self.verify, allow_redirects=False)
+        self.last_change = time.time()
         assert response.status_code == expected_status_code, "{} {} - {}".format(response.status_code, response.reason, self.get_error_details(response))
         if response.text != "":
             return response.json()
         return None
 
     def simple_patch(self, url, expected_status_code, data=None):
-        response = requests.patch(url, headers=self.headers, json=data, verify=self.verify, allow_redirects=False)
+        if self.check_mode == True:
+            self.plan_change('PATCH', url, data)
+            return None
+        response = self.send('PATCH', url, headers=self.headers, json=data, verify=self.verify, allow_redirects=False)
+        self.last_change = time.time()
         assert response.status_code == expected_status_code, "{} {} - {}".format(response.status_code, response.reason, self.get_error_details(response))
         if response.text != "":
             return response.json()
         return None
 
     def simple_delete(self, url):
-        response = requests.delete(url, headers=self.headers, verify=self.verify)
+        if self.check_mode == True:
+            self.plan_change('DELETE', url)
+            return
+        response = self.send('DELETE', url, headers=self.headers, verify=self.verify)
+        self.last_change = time.time()
         assert response.status_code == 204, "{} {} - {}".format(response.status_code, response.reason, self.get_error_details(response))
         
     def get_unit_multiplier(self, unit):
-        unit = unit.lower()
-        if unit == "b" or unit == "bytes":
-            return 1
-        if unit == "k" or unit == "kb":
-            return 1000
-        if unit == "kib":
-            return 1024
-        if unit == "m" or unit == "mb":
-            return 1000 * 1000
-        if unit == "mib":
-            return 1024 * 1024
-        if unit == "g" or unit == "gb":
-            return 1000 * 1000 * 1000
-        if unit == "gib":
-            return 1024 * 1024 * 1024
-        if unit == "t" or unit == "tb":
-            return 1000 * 1000 * 1000 * 1000
-        if unit == "tib":
-            return 1024 * 1024 * 1024 * 1024
-        return 1
+        return get_unit_multiplier(unit)
+
+    def get_capability_file(self):
+        cache_dir = os.path.expanduser(os.environ.get('HNAS_CAPABILITY_DIR', "~/.ansible/tmp/hnas_capabilities"))
+        return os.path.join(cache_dir, "{}_{}_v{}.json".format(re.sub(r'[^0-9a-zA-Z.-]', '_', self.endpoint['address']), self.endpoint['port'], self.version))
+
+    def probe_request(self, url, failed):
+        """
+        Send a probe, returning the response body, or None if the server did not answer it
+        - a probe refused by the server shows that the feature can not be used
+        - a probe that could not be sent, or that the server failed to answer, shows nothing, so its URL is added to failed
+        """
+        try:
+            response = self.send_to(self.endpoint, 'GET', url, headers=self.headers, verify=self.verify, timeout=ENDPOINT_PROBE_TIMEOUT)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code >= 500:
+                failed.append(url)
+        except Exception:
+            failed.append(url)
+        return None
+
+    def probe_capabilities(self):
+        """
+        Detect the optional features offered by the SMU
+        - paging - listings return a nextPageToken when a pageSize is requested
+        - bulk_quotas - the quotas of all of the virtual volumes on a filesystem can be listed with one request
+        - returns the capabilities, and a list of the probes that failed, whose features are treated as not offered
+        """
+        failed = []
+        capabilities = {'paging': False, 'bulk_quotas': False}
+        page = self.probe_request(self.base_uri + "filesystems?pageSize=1", failed)
+        capabilities['paging'] = page != None and 'nextPageToken' in page
+        if page == None:
+            page = self.probe_request(self.base_uri + "filesystems", failed)
+        filesystems = page.get('filesystems', []) if page != None else []
+# with no filesystems the bulk quota listing can not be checked, and is not used
+        if len(filesystems) != 0 and int(self.version) > 7:
+            quotas = self.probe_request(self.base_uri + "filesystems/{}/quotas?targetType=VIRTUAL_VOLUME&pageSize=1".format(filesystems[0]['filesystemId']), failed)
+            capabilities['bulk_quotas'] = quotas != None and 'quotas' in quotas
+        return capabilities, failed
+
+    def get_capabilities(self):
+        """
+        Return the capabilities of the SMU, probing it only if they are not already known
+        - probe results are kept on disk for each endpoint, so other tasks and processes do not probe it again until they expire
+        - if any probe failed, nothing is cached, and the features that were not confirmed are not used by this client
+        """
+        if len(self.endpoints) > 1:
+            self.probe_endpoints()
+        with self.capability_lock:
+            if self.capabilities != None:
+                return self.capabilities
+            path = self.get_capability_file()
+            ttl = int(os.environ.get('HNAS_CAPABILITY_TTL', CAPABILITY_TTL))
+            try:
+                if time.time() - os.path.getmtime(path) <= ttl:
+                    with open(path) as f:
+                        self.capabilities = json.load(f)
+                    return self.capabilities
+            except (IOError, OSError, ValueError):
+                pass
+            self.capabilities, failed = self.probe_capabilities()
+# a failure may only be brief, so the SMU is probed again by the next task rather than losing a feature until the cache expires
+            if len(failed) != 0:
+                return self.capabilities
+            try:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path), 0o700)
+# write a new file and rename it, so other processes never read a partial file
+                temp = "{}.{}.tmp".format(path, os.getpid())
+                with open(temp, 'w') as f:
+                    json.dump(self.capabilities, f)
+                os.rename(temp, path)
+            except (IOError, OSError):
+                pass
+            return self.capabilities
+
+# True if the SMU is known to offer a feature, or False if it lacks it or could not be probed
+    def supports(self, feature):
+        return self.get_capabilities().get(feature, None)
+
+# applies listing filters locally as well, for servers that ignore them on some listings
+# this costs nothing when the server has filtered the listing, so no probe is needed to find out which listings it filters
+    def filter_listing(self, listing, key, filters):
+        filters = dict([(field, value) for field, value in filters.items() if value != None])
+        if len(filters) == 0:
+            return listing
+        listing[key] = [item for item in listing.get(key, []) if all([str(item.get(field, None)) == str(value) for field, value in filters.items()])]
+        return listing
 
     def get_file_server_info(self):
         return self.simple_get(self.base_uri + "file-devices")
@@ -141,7 +1432,7 @@ class HNASFileServer:
             url = self.append_to_url(url, "virtualServerId={}".format(virtualServerId))
         if name != None:
             url = self.append_to_url(url, "name={}".format(name))
-        return self.simple_get(url)
+        return self.filter_listing(self.simple_get(url), 'virtualServers', {'virtualServerId': virtualServerId, 'name': name})
 
     def get_file_systems(self, virtualServerId=None, label=None):
         url = self.base_uri + "filesystems"
@@ -149,19 +1440,19 @@ class HNASFileServer:
             url = self.append_to_url(url, "virtualServerId={}".format(virtualServerId))
         if label != None:
             url = self.append_to_url(url, "label={}".format(label))
-        return self.simple_get(url)
+        return self.filter_listing(self.simple_get(url), 'filesystems', {'virtualServerId': virtualServerId, 'label': label})
     
     def get_file_system(self, filesystemId):
         url = self.base_uri + "filesystems/{}".format(filesystemId)
         return self.simple_get(url)
 
-    def get_share_or_export(self, virtualServerId, type, name=None):
+    def get_share_or_export(self, virtualServerId, type, name=None, include_authentications=True):
         name = self.check_share_export_name(type, name)
         url = self.base_uri + "virtual-servers/{}/{}".format(virtualServerId, type)
         if name != None:
             url = self.append_to_url(url, "name={}".format(name))
         share_list = self.simple_get(url)
-        if type == "cifs":
+        if type == "cifs" and include_authentications == True:
             for share in share_list['filesystemShares']:
                 saa_list = self.get_cifs_authentications(share['objectId'])
                 share['cifsAuthentications'] = saa_list.get('cifsAuthentications', dict())
@@ -182,11 +1473,145 @@ class HNASFileServer:
             url = self.append_to_url(url, "storagePoolId={}".format(storagePoolId))
         if label != None:
             url = self.append_to_url(url, "label={}".format(label))
-        return self.simple_get(url)
+        return self.filter_listing(self.simple_get(url), 'storagePools', {'storagePoolId': storagePoolId, 'label': label})
 
     def get_snapshots(self, filesystemId):
         return self.simple_get(self.base_uri + "filesystem-snapshots/{}/null".format(filesystemId))
 
+    def iterate_items(self, url, key, page_size=None):
+        """
+        Yield each item from a listing, one page at a time
+        - if page_size is supplied, pages are requested while the server returns a nextPageToken
+        - stopping the iteration early means that no further pages are requested
+        - page_size is ignored if the server is known not to page listings
+        """
+        if page_size != None and self.supports('paging') == False:
+            page_size = None
+        if page_size != None:
+            url = self.append_to_url(url, "pageSize={}".format(page_size))
+        page_url = url
+        while True:
+            page = self.simple_get(page_url)
+            for item in page.get(key, []):
+                yield item
+            if page_size == None or page.get('nextPageToken', None) in [None, ""]:
+                break
+            page_url = self.append_to_url(url, "pageToken={}".format(page['nextPageToken']))
+
+    def iterate_snapshots(self, filesystemId, page_size=None):
+        return self.iterate_items(self.base_uri + "filesystem-snapshots/{}/null".format(filesystemId), 'snapshots', page_size)
+
+    def get_snapshot_summary(self, filesystemId, name_pattern=None, older_than=None, limit=None, page_size=None):
+        """
+        Summarise the snapshots of a filesystem while they are read, rather than holding every snapshot
+        - name_pattern is a shell style pattern, older_than is a number of days
+        - only the name and time of the matching snapshots are kept, up to limit of them
+        - once limit matching snapshots have been found no more are read, and the summary is marked as truncated
+        """
+        summary = {'filesystemId': filesystemId, 'scanned': 0, 'matched': 0, 'oldest': None, 'newest': None, 'truncated': False, 'snapshots': []}
+        cutoff = None
+        if older_than != None:
+            cutoff = time.time() - float(older_than) * 86400
+        for snapshot in self.iterate_snapshots(filesystemId, page_size):
+            summary['scanned'] += 1
+            name = get_snapshot_name(snapshot)
+            taken = get_snapshot_time(snapshot)
+            if name_pattern != None and not fnmatch.fnmatchcase(name, name_pattern):
+                continue
+            if cutoff != None and (taken == None or taken >= cutoff):
+                continue
+            if limit != None and summary['matched'] >= limit:
+                summary['truncated'] = True
+                break
+            summary['matched'] += 1
+            summary['snapshots'].append({'name': name, 'time': taken})
+            if taken != None:
+                if summary['oldest'] == None or taken < summary['oldest']:
+                    summary['oldest'] = taken
+                if summary['newest'] == None or taken > summary['newest']:
+                    summary['newest'] = taken
+        return summary
+
+    def delete_snapshot(self, filesystemId, name):
+        url = self.base_uri + "filesystem-snapshots/{}/{}".format(filesystemId, quote(name, safe=''))
+        self.simple_delete(url)
+        return True
+
+    def apply_snapshot_retention(self, filesystemIds=None, label_pattern=None, name_pattern=None, keep_last=None, keep_daily=None,
+                                 keep_weekly=None, max_age_days=None, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Apply a snapshot retention policy to many filesystems, or all of them if none are selected
+        - the snapshot listings are read concurrently, and the snapshots to delete worked out from each one
+        - all of the deletes are then issued with bounded concurrency
+        - returns a list with the number of snapshots deleted and kept on each filesystem
+        """
+        assert keep_last != None or keep_daily != None or keep_weekly != None or max_age_days != None, \
+            "At least one of 'keep_last', 'keep_daily', 'keep_weekly' or 'max_age_days' is required"
+        filesystems = self.get_file_systems()['filesystems']
+        if filesystemIds != None:
+            filesystems = [fs for fs in filesystems if fs['filesystemId'] in filesystemIds or fs['objectId'] in filesystemIds]
+        if label_pattern != None:
+            filesystems = [fs for fs in filesystems if fnmatch.fnmatchcase(fs['label'], label_pattern)]
+        now = time.time()
+
+        def get_plan(fs):
+            snapshots = [snapshot for snapshot in self.iterate_snapshots(fs['filesystemId'])
+                         if name_pattern == None or fnmatch.fnmatchcase(get_snapshot_name(snapshot), name_pattern)]
+            names = [get_snapshot_name(snapshot) for snapshot in
+                     get_snapshot_retention_plan(snapshots, keep_last, keep_daily, keep_weekly, max_age_days, now)]
+            return len(snapshots), names
+
+        plans = run_concurrently(get_plan, filesystems, max_workers)
+        deletes = [(fs['filesystemId'], name) for fs, (_, names) in zip(filesystems, plans) for name in names]
+        run_concurrently(lambda item: self.delete_snapshot(item[0], item[1]), deletes, max_workers)
+        report = []
+        for fs, (total, names) in zip(filesystems, plans):
+            report.append({'filesystemId': fs['filesystemId'], 'label': fs['label'], 'deleted': len(names),
+                           'kept': total - len(names), 'deletedSnapshots': names})
+        return report
+
+    def get_snapshot_inventory(self, filesystemIds=None, name_pattern=None, older_than=None, limit=None, page_size=None, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Summarise the snapshots of many filesystems, or all of them if no filesystemIds are supplied
+        - the filesystems are read concurrently
+        """
+        filesystems = self.get_file_systems()['filesystems']
+        if filesystemIds != None:
+            filesystems = [fs for fs in filesystems if fs['filesystemId'] in filesystemIds or fs['objectId'] in filesystemIds]
+        summaries = run_concurrently(lambda fs: self.get_snapshot_summary(fs['filesystemId'], name_pattern, older_than, limit, page_size),
+                                     filesystems, max_workers)
+        inventory = {'filesystems': len(summaries), 'scanned': 0, 'matched': 0, 'summaries': []}
+        for fs, summary in zip(filesystems, summaries):
+            summary['label'] = fs['label']
+            inventory['scanned'] += summary['scanned']
+            inventory['matched'] += summary['matched']
+            inventory['summaries'].append(summary)
+        return inventory
+
+    def get_capacity_facts(self, unit="bytes"):
+        """
+        Read the storage pools and filesystems concurrently, and summarise their capacity in the requested unit
+        """
+        storage_pools, filesystems = run_concurrently(lambda read: read(), [lambda: self.get_storage_pools()['storagePools'],
+                                                                             lambda: self.get_file_systems()['filesystems']])
+        summary = get_capacity_summary(filesystems, storage_pools, self.get_unit_multiplier(unit))
+        summary['unit'] = unit
+        return summary
+
+    def get_capacity_samples(self):
+        """
+        Read the storage pools and filesystems concurrently, and return a (name, label, used, total) sample for each of them
+        - names include the cluster address, so samples from many clusters can be kept in one store
+        """
+        storage_pools, filesystems = run_concurrently(lambda read: read(), [lambda: self.get_storage_pools()['storagePools'],
+                                                                             lambda: self.get_file_systems()['filesystems']])
+        samples = []
+        for kind, id_field, label_field, items in [('pool', 'storagePoolId', 'label', storage_pools), ('filesystem', 'filesystemId', 'label', filesystems)]:
+            for item in items:
+                total, used, _ = get_capacity_values(item)
+                samples.append(("{}/{}/{}".format(self.address, kind, item[id_field]), item.get(label_field, None), used, total))
+        return samples
+
 # physical or aggregate interfaces
     def get_network_interfaces(self, physical=False):
         ports = []
@@ -197,6 +1622,60 @@ class HNASFileServer:
                 ports.append(item["name"])
         return dict(ports=ports)
 
+    def load_indexes(self, kinds):
+        """
+        Load the name and ID index for each kind of resource in RESOURCE_INDEXES
+        - each listing is only fetched once per client, and missing listings are fetched concurrently
+        """
+        with self.index_lock:
+            missing = [kind for kind in set(kinds) if kind not in self.indexes]
+        listings = run_concurrently(lambda kind: self.simple_get(self.base_uri + RESOURCE_INDEXES[kind][0])[RESOURCE_INDEXES[kind][1]], missing)
+        with self.index_lock:
+            for kind, listing in zip(missing, listings):
+                self.indexes[kind] = {'names': {}, 'ids': {}}
+                for item in listing:
+                    self.index_resource(kind, item)
+
+    def index_resource(self, kind, item):
+        _, _, name_field, id_field = RESOURCE_INDEXES[kind]
+        self.indexes[kind]['names'][item[name_field]] = item
+        self.indexes[kind]['ids'][str(item[id_field])] = item
+
+    def unindex_resource(self, kind, item):
+        _, _, name_field, id_field = RESOURCE_INDEXES[kind]
+        if kind in self.indexes:
+            self.indexes[kind]['names'].pop(item[name_field], None)
+            self.indexes[kind]['ids'].pop(str(item[id_field]), None)
+
+    def invalidate_indexes(self, kinds=None):
+        with self.index_lock:
+            for kind in list(self.indexes.keys()):
+                if kinds == None or kind in kinds:
+                    del self.indexes[kind]
+
+# return the indexed resource with a specific ID or name, or None if there isn't one
+    def find_resource(self, kind, id=None, name=None):
+        self.load_indexes([kind])
+        if id != None:
+            return self.indexes[kind]['ids'].get(str(id), None)
+        return self.indexes[kind]['names'].get(name, None)
+
+    def resolve_names(self, lookups):
+        """
+        Resolve many names to IDs in one call
+        - lookups is a dictionary of kind to a list of names, for example {'storage_pool': ['Span0', 'Span1']}
+        - returns a dictionary of kind to a dictionary of name to ID, with None for names that are not found
+        """
+        self.load_indexes(lookups.keys())
+        resolved = {}
+        for kind, names in lookups.items():
+            id_field = RESOURCE_INDEXES[kind][3]
+            resolved[kind] = {}
+            for name in names:
+                item = self.indexes[kind]['names'].get(name, None)
+                resolved[kind][name] = item[id_field] if item != None else None
+        return resolved
+
 # return True if the share was deleted, False if it was not present
 # return <changed> <share>
     def delete_share_or_export(self, virtualServerId, type, params):
@@ -230,60 +1709,42 @@ class HNASFileServer:
         data['ensurePathExists'] = True
         if type == "nfs":
             data['ignoreOverlap'] = True
-        settings = {}
+            fields = NFS_EXPORT_SETTINGS_FIELDS
+        else:
+            fields = CIFS_SHARE_SETTINGS_FIELDS
 # check to see if it already exists on the same virtual server
         share_list = self.get_share_or_export(virtualServerId, type, data['name'])
         if len(share_list['filesystemShares']) != 0:  # already there, so can be considered present
             share = share_list['filesystemShares'][0]
 # only parameters that stay constant are the name, virtualServerId and filesystemId - all others can be changed
             if share['filesystemId'] == data['filesystemId']:
-                existing_settings = share['settings']
                 update_needed = False
-                data['filesystemPath'] = params.get('filesystemPath', share['path'])
-                settings['accessConfig'] = params.get('accessConfig', existing_settings['accessConfig'])
-                settings['snapshotOption'] = params.get('snapshotOption', existing_settings['snapshotOption'])
-                settings['transferToReplicationTargetSetting'] = params.get('transferToReplicationTargetSetting', existing_settings['transferToReplicationTargetSetting'])
-                if type == "nfs":
-                    settings['localReadCacheOption'] = params.get('localReadCacheOption', existing_settings['localReadCacheOption'])
-                elif type == 'cifs':
-                    settings['comment'] = params.get('comment', existing_settings['comment'])
-                    settings['userHomeDirectoryPath'] = params.get('userHomeDirectoryPath', existing_settings['userHomeDirectoryPath'])
-                    settings['isScanForVirusesEnabled'] = params.get('isScanForVirusesEnabled', existing_settings['isScanForVirusesEnabled'])
-                    settings['maxConcurrentUsers'] = params.get('maxConcurrentUsers', existing_settings['maxConcurrentUsers'])
-                    settings['cacheOption'] = params.get('cacheOption', existing_settings['cacheOption'])
-                    settings['userHomeDirectoryMode'] = params.get('userHomeDirectoryMode', existing_settings['userHomeDirectoryMode'])
-                    settings['isFollowSymbolicLinks'] = params.get('isFollowSymbolicLinks', existing_settings['isFollowSymbolicLinks'])
-                    settings['isFollowGlobalSymbolicLinks'] = params.get('isFollowGlobalSymbolicLinks', existing_settings['isFollowGlobalSymbolicLinks'])
-                    settings['isForceFileNameToLowercase'] = params.get('isForceFileNameToLowercase', existing_settings['isForceFileNameToLowercase'])
-                    settings['isABEEnabled'] = params.get('isABEEnabled', existing_settings['isABEEnabled'])
-# check for any changes to any settings
-                if (settings['accessConfig'] != existing_settings['accessConfig'] or settings['snapshotOption'] != existing_settings['snapshotOption'] or
-                    settings['transferToReplicationTargetSetting'] != existing_settings['transferToReplicationTargetSetting'] or
-                    data['filesystemPath'] != share['path']):
-                    update_needed = True
-                if (type == "cifs" and (settings['comment'] != existing_settings['comment'] or settings['userHomeDirectoryPath'] != existing_settings['userHomeDirectoryPath'] or
-                    settings['isScanForVirusesEnabled'] != existing_settings['isScanForVirusesEnabled'] or 
-                    settings['maxConcurrentUsers'] != existing_settings['maxConcurrentUsers'] or settings['cacheOption'] != existing_settings['cacheOption'] or
-                    settings['userHomeDirectoryMode'] != existing_settings['userHomeDirectoryMode'] or 
-                    settings['isFollowSymbolicLinks'] != existing_settings['isFollowSymbolicLinks'] or 
-                    settings['isFollowGlobalSymbolicLinks'] != existing_settings['isFollowGlobalSymbolicLinks'] or 
-                    settings['isForceFileNameToLowercase'] != existing_settings['isForceFileNameToLowercase'] or 
-                    settings['isABEEnabled'] != existing_settings['isABEEnabled'])):
-                    update_needed = True
-                if type == "nfs" and settings['localReadCacheOption'] != existing_settings['localReadCacheOption']:
+# only the settings that differ are sent in the update
+                patch = {}
+                settings = diff_fields(fields, params, share['settings'])
+                if len(settings) != 0:
+                    patch['settings'] = settings
+                if 'filesystemPath' in params and params['filesystemPath'] != share['path']:
+                    patch['filesystemPath'] = params['filesystemPath']
+                    patch['ensurePathExists'] = True
+                if len(patch) != 0:
                     update_needed = True
-                if update_needed == True:
-                    data['settings'] = settings
                     url = self.base_uri + "filesystem-shares/{}/{}".format(type, share['objectId'])
-                    self.simple_patch(url, 204, data)
-                    share_list = self.get_share_or_export(virtualServerId, type, data['name'])
-                    share = share_list['filesystemShares'][0]
+                    self.simple_patch(url, 204, patch)
+                    if self.refresh_needed(update_needed):
+                        share_list = self.get_share_or_export(virtualServerId, type, data['name'])
+                        share = share_list['filesystemShares'][0]
+                    else:
+                        share['path'] = patch.get('filesystemPath', share['path'])
+                        share['settings'].update(settings)
 # should see if SAA list needs to be added to
                 if type == 'cifs':
-                    if self.add_cifs_authentications(share['objectId'], params):
+                    saa_list = list(share['cifsAuthentications'])
+                    if self.add_cifs_authentications(share['objectId'], params, saa_list):
                         update_needed = True
-                    saa_list = self.get_cifs_authentications(share['objectId'])
-                    share['cifsAuthentications'] = saa_list.get('cifsAuthentications', dict())
+                        if self.refresh_needed(update_needed):
+                            saa_list = self.get_cifs_authentications(share['objectId']).get('cifsAuthentications', dict())
+                        share['cifsAuthentications'] = saa_list
                 return update_needed, True, share
             else:
 # need to return a failure if a share exists with the same name, virtualServerId, but is hosted on a different filesystem
@@ -292,40 +1753,33 @@ class HNASFileServer:
 # not present, so create it instead
         self.check_required_parameters(params, ['filesystemPath'])
         data['filesystemPath'] = params['filesystemPath']
-        settings['accessConfig'] = params.get('accessConfig', "")
-        settings['snapshotOption'] = params.get('snapshotOption', "SHOW_AND_ALLOW_ACCESS")
-        settings['transferToReplicationTargetSetting'] = params.get('transferToReplicationTargetSetting', "USE_FS_DEFAULT")
         if type == "nfs":
             # need to remove / from beginning of NFS export due to legacy API bug in create operation, native API does not have the issue
             if data['name'][0] == '/':
                 data['name'] = data['name'][1:]
-            settings['localReadCacheOption'] = params.get('localReadCacheOption', "DISABLED")
-        elif type == "cifs":
-            settings['comment'] = params.get('comment', "")
-            settings['userHomeDirectoryPath'] = params.get('userHomeDirectoryPath', "")
-            settings['isScanForVirusesEnabled'] = params.get('isScanForVirusesEnabled', False)
-            settings['maxConcurrentUsers'] = params.get('maxConcurrentUsers', -1)
-            settings['cacheOption'] = params.get('cacheOption', "MANUAL_CACHING_DOCS")
-            settings['userHomeDirectoryMode'] = params.get('userHomeDirectoryMode', "OFF")
-            settings['isFollowSymbolicLinks'] = params.get('isFollowSymbolicLinks', False)
-            settings['isFollowGlobalSymbolicLinks'] = params.get('isFollowGlobalSymbolicLinks', False)
-            settings['isForceFileNameToLowercase'] = params.get('isForceFileNameToLowercase', False)
-            settings['isABEEnabled'] = params.get('isABEEnabled', False)
-        data['settings'] = settings
+        data['settings'] = get_field_values(fields, params)
 
         url = self.base_uri + "filesystem-shares/{}".format(type)
+        if self.check_mode == True:
+# the new share has no objectId yet, so report the authentications that would be added with it
+            self.simple_post(url, 201, data)
+            share = dict(data)
+            if type == "cifs":
+                share['cifsAuthentications'] = params.get('cifsAuthentications', [])
+            return True, True, share
         share = self.simple_post(url, 201, data)['filesystemShare']
         if type == "cifs":
-# add SAA is specified
-            self.add_cifs_authentications(share['objectId'], params)
-            saa_list = self.get_cifs_authentications(share['objectId'])
-            share['cifsAuthentications'] = saa_list.get('cifsAuthentications', dict())
+# add SAA is specified - a new share starts with no SAAs
+            saa_list = []
+            self.add_cifs_authentications(share['objectId'], params, saa_list)
+            if self.refresh_needed(True):
+                saa_list = self.get_cifs_authentications(share['objectId']).get('cifsAuthentications', dict())
+            share['cifsAuthentications'] = saa_list
         return True, True, share
 
     def set_virtual_server_state(self, virtualServerId=None, name=None, state=None):
-        evs_list = self.get_virtual_servers(virtualServerId, name)
-        assert len(evs_list['virtualServers']) != 0, "virtual server not found"
-        evs = evs_list['virtualServers'][0]
+        evs = self.find_resource('virtual_server', virtualServerId, name)
+        assert evs != None, "virtual server not found"
         if state == evs['status']:
             return True
         if state == 'ONLINE':
@@ -335,6 +1789,9 @@ class HNASFileServer:
         else:
             raise "Invalid 'state' value {} - not valid".format(state)
         self.simple_post(url, 204)
+# the cached virtual server only changes once the server has been changed
+        if self.check_mode == False:
+            evs['status'] = state
         return True
 
     def delete_virtual_server_address(self, virtualServerId, address):
@@ -346,12 +1803,14 @@ class HNASFileServer:
 # return three values <changed> <success> <evs>
     def delete_virtual_server(self, virtualServerId=None, name=None, params=None):
         changed = False
-        evs_list = self.get_virtual_servers(virtualServerId, name)
-        if len(evs_list['virtualServers']) == 0:    # not there anyway, so can be considered absent
+        evs = self.find_resource('virtual_server', virtualServerId, name)
+        if evs == None:                             # not there anyway, so can be considered absent
             return changed, True, ""
-        evs = evs_list['virtualServers'][0]
         virtualServerId = evs['virtualServerId']
         if 'address_details' in params and len(params['address_details']) > 0:
+            if self.check_mode == True:
+# the planned changes are merged into a copy, so the cached virtual server keeps its real state
+                evs = dict(evs, ipAddresses=list(evs.get('ipAddresses', [])))
             success = True
             for address in params['address_details']:                # walk around each one and check it's there
                 address_to_remove = address.get('address', "255.255.255.255").lower()
@@ -362,21 +1821,23 @@ class HNASFileServer:
                         changed = True
                     else:                                            # can't remove the last address, so fail
                         success = False
-            evs_list = self.get_virtual_servers(virtualServerId=virtualServerId)
-            evs = evs_list['virtualServers'][0]
+            if self.refresh_needed(changed):
+                evs_list = self.get_virtual_servers(virtualServerId=virtualServerId)
+                evs = evs_list['virtualServers'][0]
+                self.index_resource('virtual_server', evs)
             return changed, success, evs
 # evs can only be deleted if it's disabled - any filesystems will be unmounted and unassigned, so not deleted
-        self.set_virtual_server_state(virtualServerId=virtualServerId, name=name, state='DISABLED')
+        self.set_virtual_server_state(virtualServerId=virtualServerId, state='DISABLED')
         url = self.base_uri + "virtual-servers/{}".format(virtualServerId)
         self.simple_delete(url)
+        self.unindex_resource('virtual_server', evs)
         changed = True
         return changed, True, ""
 
 # adds an IP address to a virtual server
     def add_vitual_server_address(self, virtualServerId=None, name=None, params=None):
-        evs_list = self.get_virtual_servers(virtualServerId, name)
-        assert len(evs_list['virtualServers']) != 0, "virtual server not found"
-        evs = evs_list['virtualServers'][0]
+        evs = self.find_resource('virtual_server', virtualServerId, name)
+        assert evs != None, "virtual server not found"
         self.check_required_parameters(params, ['address', 'netmask', 'port'])
         data = {}
         data['ipAddress'] = params['address']
@@ -385,13 +1846,30 @@ class HNASFileServer:
         url = self.base_uri + "virtual-servers/{}/ip-addresses".format(evs['virtualServerId'])
         self.simple_post(url, 204, data)
 
+    def read_node_loads(self):
+        nodes, virtual_servers, filesystems = run_concurrently(lambda read: read(), [lambda: self.get_nodes()['nodes'],
+                                                                                      lambda: self.get_virtual_servers()['virtualServers'],
+                                                                                      lambda: self.get_file_systems()['filesystems']])
+        return get_node_loads(nodes, virtual_servers, filesystems, (self.node_parameter_name, 'nodeId', 'clusterNodeId'))
+
+    def get_node_balance(self):
+        """
+        Report the load on each cluster node, and the virtual server moves that would even it out
+        """
+        loads = self.read_node_loads()
+        current = [dict(load, virtualServers=list(load['virtualServers'])) for load in sorted(loads.values(), key=lambda load: str(load['nodeId']))]
+        moves = get_rebalance_moves(loads)
+        balanced = sorted(loads.values(), key=lambda load: str(load['nodeId']))
+        return {'nodes': current, 'moves': moves, 'balancedNodes': balanced}
+
 # evs specific parameters are in the params dictionary
 # returns three values <changed> <success> <evs>
     def create_virtual_server(self, params):
         data = {}
         self.check_required_parameters(params, ['name'])
         data['name'] = params['name']
-        data[self.node_parameter_name] = int(params.get('nodeId', 1))
+        if str(params.get('nodeId', 1)) != "auto":
+            data[self.node_parameter_name] = int(params.get('nodeId', 1))
         status = params.get('status', 'ONLINE')
 # if address_details are supplied, make sure there is at least one address
         if 'address_details' in params and len(params['address_details']) > 0:
@@ -402,30 +1880,44 @@ class HNASFileServer:
             if 'port' in params['address_details'][0]:
                 data[self.port_parameter_name] = params['address_details'][0]['port']
         changed = False
-        evs_list = self.get_virtual_servers(name=data['name'])
-        if len(evs_list['virtualServers']) != 0:            # already there, so can be considered present
-            evs = evs_list['virtualServers'][0]
-        else:                                               # not present, so create
+        evs = self.find_resource('virtual_server', name=data['name'])
+        if evs == None:                                     # not present, so create
 # should get the fist IP address in the list to use
             assert 'ipAddress' in data, "Missing 'address' parameter from 'address_details' data value"
             assert 'netmask' in data, "Missing 'netmask' parameter from 'address_details' data value"
             assert self.port_parameter_name in data, "Missing 'port' parameter from 'address_details' data value"
+            if self.node_parameter_name not in data:
+                data[self.node_parameter_name] = int(choose_node(self.read_node_loads(), params.get('node_candidates', None)))
             url = self.base_uri + "virtual-servers"
+            if self.check_mode == True:
+# the new virtual server has no ID yet, so report the addresses and status it would end up with
+                self.simple_post(url, 201, data)
+                evs = dict(data)
+                evs['ipAddresses'] = [address['address'].lower() for address in params['address_details']]
+                evs['status'] = status
+                return True, True, evs
             evs = self.simple_post(url, 201, data)['virtualServer']
+            self.index_resource('virtual_server', evs)
             changed = True
+        elif self.check_mode == True:
+# the planned changes are merged into a copy, so the cached virtual server keeps its real state
+            evs = dict(evs, ipAddresses=list(evs.get('ipAddresses', [])))
         virtualServerId=evs['virtualServerId']
 # walk around each address in the list and check if it's there or not - if not create it
         if 'address_details' in params:                              # some IP address details supplied, so check they are all there
             for address in params['address_details']:                # walk around each one and check it's there
                 if address['address'].lower() not in evs['ipAddresses']:     # IP address not already assigned to evs, so add
                     self.add_vitual_server_address(virtualServerId=virtualServerId, params=address)
+                    evs['ipAddresses'].append(address['address'].lower())
                     changed = True
         if evs['status'] != status:                          # not correct status, so change
             self.set_virtual_server_state(virtualServerId=virtualServerId, state=status)
+            evs['status'] = status
             changed = True
-        if changed == True:
+        if self.refresh_needed(changed):
             evs_list = self.get_virtual_servers(virtualServerId=virtualServerId)
             evs = evs_list['virtualServers'][0]
+            self.index_resource('virtual_server', evs)
         return changed, True, evs
 
     def set_filesystem_state(self, filesystemId=None, label=None, state=None):
@@ -447,11 +1939,32 @@ class HNASFileServer:
         self.wait_for_filesystem(filesystemId, state)
         return True
 
+    def wait_for_filesystems(self, filesystemIds, required_status, virtualServerId=None, timeout=30):
+        """
+        Wait until a group of filesystems all get to a specific status
+        - a single filesystem listing is polled, rather than each filesystem in turn
+        - timeout is the number of seconds allowed for each filesystem
+        """
+        if self.check_mode == True:
+            return
+        waiting = set(filesystemIds)
+        limit = timeout * len(waiting)
+        count = 0
+        while len(waiting) != 0 and count < limit:
+            time.sleep(1)
+            for fs in self.get_file_systems(virtualServerId=virtualServerId)['filesystems']:
+                if fs['objectId'] in waiting and fs['status'] in [required_status, "VOLUME_NOT_AVAILABLE_TO_BS"]:
+                    waiting.discard(fs['objectId'])
+            count += 1
+        assert len(waiting) == 0, "Waited {} seconds for file system status to be {} - giving up".format(limit, required_status)
+
     def wait_for_filesystem(self, filesystemId, required_status):
         """
         Wait until the filesystem gets to a specific status
         - wait for mount/unmount mainly
         """
+        if self.check_mode == True:
+            return
         url = self.base_uri + "filesystems/{}".format(filesystemId)
         current_status = ""
         count = 0
@@ -476,6 +1989,67 @@ class HNASFileServer:
         self.simple_post(url, 204, data)
         return True
 
+    def autogrow_filesystems(self, threshold, grow_by=None, grow_percent=None, target_utilization=None, max_capacity=None,
+                             pool_reserve=0, label_pattern=None, filesystemIds=None, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Expand every filesystem whose utilization, as a percentage, is at or above threshold
+        - filesystems and storage pools are read from one listing each, and the expands are issued concurrently
+        - each filesystem grows by grow_by bytes or grow_percent of its capacity, or enough to bring it down to target_utilization if that is more
+        - no filesystem grows beyond max_capacity, and pool_reserve bytes are always left free in each storage pool
+        - the fullest filesystems are given pool space first, and any that do not fit are skipped
+        - returns the changed flag, a list of the filesystems that grew, and a list of those skipped with the reason
+        """
+        assert grow_by != None or grow_percent != None or target_utilization != None, \
+            "At least one of 'grow_by', 'grow_percent' or 'target_utilization' is required"
+        assert target_utilization == None or 0 < target_utilization <= 100, "'target_utilization' must be more than 0 and no more than 100"
+        storage_pools, filesystems = run_concurrently(lambda read: read(), [lambda: self.get_storage_pools()['storagePools'],
+                                                                             lambda: self.get_file_systems()['filesystems']])
+        if filesystemIds != None:
+            filesystems = [fs for fs in filesystems if fs['filesystemId'] in filesystemIds or fs['objectId'] in filesystemIds]
+        if label_pattern != None:
+            filesystems = [fs for fs in filesystems if fnmatch.fnmatchcase(fs['label'], label_pattern)]
+        pool_free = {}
+        for pool in storage_pools:
+            pool_free[str(pool['storagePoolId'])] = get_capacity_values(pool)[2] - pool_reserve
+        candidates = []
+        for fs in filesystems:
+            total, used, _ = get_capacity_values(fs)
+            if total > 0 and used * 100.0 / total >= threshold:
+                candidates.append((used * 100.0 / total, total, used, fs))
+        grow = []
+        skipped = []
+        for utilization, total, used, fs in sorted(candidates, key=lambda item: item[0], reverse=True):
+            growth = 0
+            if grow_by != None:
+                growth = max(growth, int(grow_by))
+            if grow_percent != None:
+                growth = max(growth, int(total * grow_percent / 100.0))
+            if target_utilization != None:
+                growth = max(growth, int(used * 100.0 / target_utilization) - total)
+            capacity = total + growth
+            if max_capacity != None:
+                capacity = min(capacity, int(max_capacity))
+            item = {'filesystemId': fs['filesystemId'], 'label': fs['label'], 'storagePoolId': fs.get('storagePoolId', None),
+                    'utilization': round(utilization, 2), 'previousCapacity': total}
+            pool = str(fs.get('storagePoolId', None))
+            if growth <= 0:
+                item['reason'] = "already at or below target_utilization" if target_utilization != None else "no growth requested"
+                skipped.append(item)
+            elif capacity <= total:
+                item['reason'] = "already at max_capacity"
+                skipped.append(item)
+            elif pool in pool_free and pool_free[pool] < capacity - total:
+                item['reason'] = "not enough free space in storage pool"
+                skipped.append(item)
+            else:
+                if pool in pool_free:
+                    pool_free[pool] -= capacity - total
+                item['capacity'] = capacity
+                item['grownBy'] = capacity - total
+                grow.append((fs['objectId'], item))
+        run_concurrently(lambda entry: self.expand_filesystem(entry[0], entry[1]['capacity']), grow, max_workers)
+        return len(grow) != 0, [item for _, item in grow], skipped
+
     def delete_filesystem(self, label):
         fs_list = self.get_file_systems(label=label)
         if len(fs_list['filesystems']) == 0:  # not there, so can be considered absent
@@ -488,28 +2062,59 @@ class HNASFileServer:
         self.simple_delete(url)
         return True
 
+    def place_filesystems(self, capacities, strategy="free", candidates=None, placements=None):
+        storage_pools, filesystems = run_concurrently(lambda read: read(), [lambda: self.get_storage_pools()['storagePools'],
+                                                                             lambda: self.get_file_systems()['filesystems']])
+        return choose_storage_pools(storage_pools, filesystems, capacities, strategy, candidates, placements)
+
+    def create_filesystems(self, params_list, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Create or update a batch of filesystems concurrently
+        - filesystems that need a storage pool chosen for them are placed together, so the batch is spread across the pools
+        - each filesystem is placed with its own storage_pool_placement and storage_pool_candidates
+        - returns the changed flag, and a list of the filesystems
+        """
+        params_list = [dict(params) for params in params_list]
+        existing = set([fs['label'] for fs in self.get_file_systems()['filesystems']])
+        placed = [params for params in params_list if params.get('storage_pool_placement', None) != None
+                  and 'storagePoolId' not in params and 'storage_pool_name' not in params and params['label'] not in existing]
+        if len(placed) != 0:
+            capacities = [self.get_unit_multiplier(params.get('capacity_unit', 'bytes')) * int(params['capacity']) for params in placed]
+            placements = [(params['storage_pool_placement'], params.get('storage_pool_candidates', None)) for params in placed]
+            pools = self.place_filesystems(capacities, placements=placements)
+            for params, storagePoolId in zip(placed, pools):
+                params['storagePoolId'] = storagePoolId
+        results = run_concurrently(self.create_filesystem, params_list, max_workers)
+        for params, (_, success, _) in zip(params_list, results):
+            assert success == True, "An existing filesystem exists, with the label {}, but the parameters do not match".format(params['label'])
+        return any([changed for changed, _, _ in results]), [fs for _, _, fs in results]
+
 # filesystem specific parameters are in the params dictionary
 # returns three values <changed> <success> <filesystem>
     def create_filesystem(self, params):
         data = {}
         self.check_required_parameters(params, ['label', 'capacity'])
         data['label'] = params['label']
+# need to get virtualServerId and storagePoolId if names supplied - both are resolved together
+        lookups = {}
+        if 'virtual_server_name' in params:
+            lookups['virtual_server'] = [params['virtual_server_name']]
+        if 'storage_pool_name' in params:
+            lookups['storage_pool'] = [params['storage_pool_name']]
+        resolved = self.resolve_names(lookups)
         if 'virtual_server_name' in params:
-            # need to get virtualServerId if name supplied
-            evs_list = self.get_virtual_servers(name=params['virtual_server_name'])
-            assert len(evs_list['virtualServers']) != 0, "virtual server not found"
-            data['virtualServerId'] = evs_list['virtualServers'][0]['virtualServerId']
+            data['virtualServerId'] = resolved['virtual_server'][params['virtual_server_name']]
+            assert data['virtualServerId'] != None, "virtual server not found"
         else:
             assert 'virtualServerId' in params, "Missing 'virtualServerId' data value"
             data['virtualServerId'] = params['virtualServerId']
         if 'storage_pool_name' in params:
-            # need to get storagePoolId if name supplied
-            pool_list = self.get_storage_pools(label=params['storage_pool_name'])
-            assert len(pool_list['storagePools']) != 0, "storage pool not found"
-            data['storagePoolId'] = pool_list['storagePools'][0]['storagePoolId']
-        else:
-            assert 'storagePoolId' in params, "Missing 'storagePoolId' data value"
+            data['storagePoolId'] = resolved['storage_pool'][params['storage_pool_name']]
+            assert data['storagePoolId'] != None, "storage pool not found"
+        elif 'storagePoolId' in params:
             data['storagePoolId'] = params['storagePoolId']
+        else:
+            assert params.get('storage_pool_placement', None) != None, "Missing 'storagePoolId', 'storage_pool_name' or 'storage_pool_placement' data value"
         data['capacity'] = self.get_unit_multiplier(params.get('capacity_unit', 'bytes')) * int(params['capacity'])
         status = params.get('status', 'MOUNTED')
         blockSize = params.get('blockSize', '4')
@@ -521,21 +2126,34 @@ class HNASFileServer:
             fs = fs_list['filesystems'][0]
         else:                                            # not present, so create
             url = self.base_uri + "filesystems"
+            if 'storagePoolId' not in data:
+                data['storagePoolId'] = self.place_filesystems([data['capacity']], params['storage_pool_placement'],
+                                                               params.get('storage_pool_candidates', None))[0]
+            if self.check_mode == True:
+# the new filesystem has no ID yet, so report the format and status it would end up with
+                self.simple_post(url, 201, data)
+                fs = dict(data)
+                fs['blockSize'] = blockSizeInK
+                fs['status'] = status
+                return True, True, fs
             fs = self.simple_post(url, 201, data)['filesystem']
             changed = True
         filesystemId = fs['objectId']
         if int(fs['blockSize']) == 0:                    # not formatted, so can format it
             self.format_filesystem(filesystemId, blockSize)
+            fs['blockSize'] = blockSizeInK
             changed = True
         elif int(blockSizeInK) != int(fs['blockSize']):  # block size is different - will not reformat to change the block size - customer data loss
             return changed, False, None
         if status != fs['status']:                       # not correct status, so change
             self.set_filesystem_state(filesystemId, state=status)
+            fs['status'] = status
             changed = True
         if int(data['capacity']) > int(fs['capacity']):  # capacity lower than size, so can expand
             self.expand_filesystem(filesystemId, int(data['capacity']))
+            fs['capacity'] = int(data['capacity'])
             changed = True
-        if changed == True:
+        if self.refresh_needed(changed):
             fs = self.get_file_system(filesystemId)['filesystem']
         return changed, True, fs
 
@@ -556,16 +2174,21 @@ class HNASFileServer:
         self.check_required_parameters(params, ['label'])
         data['label'] = params['label']
         data['chunkSize'] = params.get('chunkSize', 19327352832) # appears to be the default chunk size value
-        assert len(params['systemDrives']) >= 4, "Need a minimum of 4 system drives to create a storage pool"
+# system drives are chosen automatically if a drive count or pool size is given instead of a list
+        select = 'systemDrives' not in params and ('system_drive_count' in params or 'pool_size' in params)
+        if select == False:
+            assert len(params['systemDrives']) >= 4, "Need a minimum of 4 system drives to create a storage pool"
 # make sure each system drive is an integer value
-        for drive in params['systemDrives']:
-            data['systemDrives'].append(int(drive))
+            for drive in params['systemDrives']:
+                data['systemDrives'].append(int(drive))
         pool_list = self.get_storage_pools(label=params['label'])
         if len(pool_list['storagePools']) != 0:  # already there, so can be considered present
             pool = pool_list['storagePools'][0]
 # should get list of system drives, and compare
             if 'chunkSize' in params and int(pool['chunkSize']) != int(data['chunkSize']):
                 return False, False, ""
+            if select == True:
+                return False, True, pool
             url = self.base_uri + "storage-pools/{}/system-drives".format(pool['objectId'])
             sd_list = self.simple_get(url)
             if len(sd_list['systemDrives']) != len(data['systemDrives']):
@@ -578,13 +2201,23 @@ class HNASFileServer:
 # need to check if access needs to be allowed to the system drives
 
 # should maybe add this check before checking for the pool, as allowing access might make the pool appear
-######################################
-# This needs to be improved or removed
-        for systemDriveId in data['systemDrives']:
-            url = self.base_uri + "system-drives?systemDriveId={}".format(systemDriveId)
-            sd_list = self.simple_get(url)
-            assert len(sd_list['systemDrives']) != 0, "system drive not found '{}'".format(systemDriveId)
-            system_drive = sd_list['systemDrives'][0]
+# one listing of the system drives is used to choose or find the drives, and to check them
+        system_drives = self.get_system_drives()['systemDrives']
+        if select == True:
+            size = None
+            if 'pool_size' in params:
+                size = self.get_unit_multiplier(params.get('capacity_unit', 'bytes')) * int(params['pool_size'])
+            drives = choose_system_drives(system_drives, count=params.get('system_drive_count', None), size=size,
+                                          spread_fields=params.get('spread_fields', None), allow_denied=params.get('allow_denied_system_drives', False))
+            data['systemDrives'] = [int(drive['systemDriveId']) for drive in drives]
+            self.selected_system_drives = drives
+        else:
+            by_id = dict([(int(drive['systemDriveId']), drive) for drive in system_drives])
+            for systemDriveId in data['systemDrives']:
+                assert systemDriveId in by_id, "system drive not found '{}'".format(systemDriveId)
+            drives = [by_id[systemDriveId] for systemDriveId in data['systemDrives']]
+        for system_drive in drives:
+            systemDriveId = int(system_drive['systemDriveId'])
             assert system_drive['isAssignedToStoragePool'] == False, "system drive '{}' already in use".format(systemDriveId)
             if 'allow_denied_system_drives' in params and params['allow_denied_system_drives'] is True and system_drive['isAccessAllowed'] == False:
                 url = self.base_uri + "system-drives/{}".format(systemDriveId)
@@ -592,6 +2225,9 @@ class HNASFileServer:
                 self.simple_patch(url, 204, sd_data)
 # need to create new pool
         url = self.base_uri + "storage-pools"
+        if self.check_mode == True:
+            self.simple_post(url, 201, data)
+            return True, True, data
         pool = self.simple_post(url, 201, data)['storagePool']
         return True, True, pool
 
@@ -604,27 +2240,37 @@ class HNASFileServer:
     def is_saa_present(self, saa_list, check_saa):
         for saa in saa_list:
             if check_saa['name'] == saa['name'] or saa['name'].lower().endswith(check_saa['name'].lower()):
-                if 'permission' in check_saa and check_saa['permission'] == saa['permission']:
-                    return True, True, saa['encodedName']
+                if 'permission' in check_saa and check_saa['permission'] == saa.get('permission', None):
+                    return True, True, saa.get('encodedName', None)
                 else:
-                    return True, False, saa['encodedName']
+                    return True, False, saa.get('encodedName', None)
         return False, False, ""
         
 # return False if none were added
 # return True if some were added i.e. changed
-    def add_cifs_authentications(self, shareId, params):
+# saa_list can be supplied if the existing SAAs are already known - it is updated with the changes made
+    def add_cifs_authentications(self, shareId, params, saa_list=None):
         changed = False
         if 'cifsAuthentications' not in params:
             return changed
-        saa_list = self.get_cifs_authentications(shareId)['cifsAuthentications']
+        if saa_list == None:
+            saa_list = self.get_cifs_authentications(shareId)['cifsAuthentications']
+# the SAAs added here are only compared with those the server already has, as the names are matched loosely
+        existing_saa_list = list(saa_list)
+# the first of any SAAs in the parameters that name the same account is used, so each account is only added once
+        added = set()
 # need to walk around the list of existing ones and see if they are present already, as the correct permissions
-        new_saa_list = params['cifsAuthentications']
-        for saa in new_saa_list:
-            present, same, encodedName = self.is_saa_present(saa_list, saa)
+        for saa in params['cifsAuthentications']:
+            if saa['name'].lower() in added:
+                continue
+            added.add(saa['name'].lower())
+            present, same, encodedName = self.is_saa_present(existing_saa_list, saa)
             if present == True and same == False:
             # remove existing if the permissions do not match, as it's not possible to update them
                 url = self.base_uri + "filesystem-shares/cifs/{}/authentications/{}".format(shareId, encodedName)
                 self.simple_delete(url)
+                existing_saa_list = [item for item in existing_saa_list if item.get('encodedName', None) != encodedName]
+                saa_list[:] = [item for item in saa_list if item.get('encodedName', None) != encodedName]
                 present = False
             if present == False:
             # not there so add it - easier to add them one at time
@@ -632,6 +2278,7 @@ class HNASFileServer:
                 data = {'cifsAuthentications':[]}
                 data['cifsAuthentications'].append(saa)
                 self.simple_post(url, 201, data)
+                saa_list.append(saa)
                 changed = True
         return changed
         
@@ -672,6 +2319,18 @@ class HNASFileServer:
             quota = {}
         return quota
 
+# get the quotas of all of the virtual volumes on a filesystem with one listing, keyed by the objectId of the virtual volume
+    def get_virtual_volume_quotas(self, filesystemId):
+        quotas = {}
+        url = self.base_uri + "filesystems/{}/quotas?targetType=VIRTUAL_VOLUME".format(filesystemId)
+        for item in self.iterate_items(url, 'quotas', 1000 if self.supports('paging') == True else None):
+            if item.get('targetObjectId', None) == None:
+                continue
+            quota = item['quota']
+            quota['quotaObjectId'] = item['objectId']
+            quotas[str(item['targetObjectId'])] = quota
+        return quotas
+
     def get_virtual_volume_quota(self, virtualVolumeObjectId):
 # virtual volume quota behaviour changed between v7 and newer versions
         if int(self.version) > 7:
@@ -680,7 +2339,7 @@ class HNASFileServer:
             quota = self.get_virtual_volume_quota_v1(virtualVolumeObjectId)
         return quota
 
-    def get_virtual_volumes(self, virtualServerId, filesystemId, name=None):
+    def get_virtual_volumes(self, virtualServerId, filesystemId, name=None, include_quota=True):
         if int(self.version) > 7:
             url = self.base_uri + "filesystems/{}/virtual-volumes".format(filesystemId)
         else:
@@ -689,8 +2348,19 @@ class HNASFileServer:
             url = self.append_to_url(url, "name={}".format(name))
         try:
             virtual_volume_list = self.simple_get(url)
-            for virtual_volume in virtual_volume_list['virtualVolumes']:
-                virtual_volume['quota'] = self.get_virtual_volume_quota(virtual_volume['objectId'])
+            if include_quota == True:
+# one listing of the quotas is cheaper than a request for each virtual volume, if the server offers it
+                quotas = {}
+                if len(virtual_volume_list['virtualVolumes']) > 1 and self.supports('bulk_quotas') == True:
+                    try:
+                        quotas = self.get_virtual_volume_quotas(filesystemId)
+                    except:
+                        quotas = {}
+                for virtual_volume in virtual_volume_list['virtualVolumes']:
+                    if str(virtual_volume['objectId']) in quotas:
+                        virtual_volume['quota'] = quotas[str(virtual_volume['objectId'])]
+                    else:
+                        virtual_volume['quota'] = self.get_virtual_volume_quota(virtual_volume['objectId'])
         except:
             virtual_volume_list = {'virtualVolumes':[]}
         return virtual_volume_list
@@ -701,11 +2371,15 @@ class HNASFileServer:
         virtual_volume_list = self.get_virtual_volumes(params['virtualServerId'], params['filesystemId'], params['name'])
         if len(virtual_volume_list['virtualVolumes']) == 0:  # not there, so can be considered absent
             return False
-# if the contents are deleted, then the virtual volume will also get deleted at the same time
         virtual_volume = virtual_volume_list['virtualVolumes'][0]
+        self.remove_virtual_volume(params['filesystemId'], virtual_volume, params.get('remove_content', False))
+        return True
+
+    def remove_virtual_volume(self, filesystemId, virtual_volume, remove_content=False):
+# if the contents are deleted, then the virtual volume will also get deleted at the same time
         folder_removed = False
-        if params.get('remove_content', False) == True:
-            folder_removed = self.delete_directory(params['filesystemId'], virtual_volume['path'])
+        if remove_content == True:
+            folder_removed = self.delete_directory(filesystemId, virtual_volume['path'])
 # if the path deletion failed, attempt to specifically remove the virtual volume
         if folder_removed == False:
             virtualVolumeObjectId = virtual_volume['objectId']
@@ -714,21 +2388,24 @@ class HNASFileServer:
         return True
 
     def get_quota_threshold(self, params, existing):
-        threshold = {}
-        reset = params.get('reset', existing.get('reset', 5))
-        warning = params.get('warning', existing.get('warning', 0))
-        severe = params.get('severe', existing.get('severe', 0))
+        threshold = get_field_values(QUOTA_THRESHOLD_FIELDS, params, existing)
+        reset = threshold['reset']
+        warning = threshold['warning']
+        severe = threshold['severe']
         assert severe <= 100 or warning <= 100 or reset <= 100, "Quota threshold levels cannot be greater than 100%"
         assert severe >= warning, "Quota threshold warning level must be lower than severe"
         if warning != 0:
             assert warning >= reset, "Quota threshold reset level must be lower than warning"
-        threshold['limit'] = int(params.get('limit', existing.get('limit', 0)))
-        threshold['isHard'] = params.get('isHard', existing.get('isHard', True))
-        threshold['reset'] = reset
-        threshold['warning'] = warning
-        threshold['severe'] = severe
+        threshold['limit'] = int(threshold['limit'])
         return threshold
 
+# build data structure first - same data used in create and update
+    def get_quota_settings(self, quotaParams, existing_quota):
+        updated_quota = get_field_values(QUOTA_FIELDS, quotaParams, existing_quota)
+        updated_quota['diskUsageThreshold'] = self.get_quota_threshold(quotaParams['diskUsageThreshold'], existing_quota.get('diskUsageThreshold', {}))
+        updated_quota['fileCountThreshold'] = self.get_quota_threshold(quotaParams['fileCountThreshold'], existing_quota.get('fileCountThreshold', {}))
+        return updated_quota
+
     def create_virtual_volume(self, params):
         data = {}
         changed = False
@@ -749,6 +2426,7 @@ class HNASFileServer:
                     data['emails'] = params['emails']
                     url = self.base_uri + "virtual-volumes/{}".format(virtual_volume['objectId'])
                     self.simple_patch(url, 204, data)
+                    virtual_volume['emails'] = params['emails']
                     changed = True
         else:
 # this is where we create the virtual volume
@@ -760,35 +2438,50 @@ class HNASFileServer:
             data['createPathIfNotExists'] = True
             data['emails'] = params.get('emails', [])
             url = self.base_uri + "virtual-volumes"
+            if self.check_mode == True:
+# the new virtual volume has no objectId yet, so report the quota it would be created with
+                self.simple_post(url, 201, data)
+                virtual_volume = dict(data)
+                if 'quota' in params:
+                    virtual_volume['quota'] = self.get_quota_settings(params['quota'], {})
+                return True, True, virtual_volume
             virtual_volume = self.simple_post(url, 201, data)['virtualVolume']
             changed = True
 # now need to look at the quota parameters - need to see if quota already exists,
-        if changed == True:
+        if self.refresh_needed(changed):
             virtual_volume_list = self.get_virtual_volumes(params['virtualServerId'], params['filesystemId'], params['name'])
             virtual_volume = virtual_volume_list['virtualVolumes'][0]
 
         virtualVolumeObjectId = virtual_volume['objectId']
         if 'quota' in params:                   # are the quota params in the yaml file - if they are check they are the same, otherwise ignore them
-            existing_quota = self.get_virtual_volume_quota(virtualVolumeObjectId)
+            if 'quota' in virtual_volume:       # quota is read along with an existing virtual volume
+                existing_quota = virtual_volume['quota']
+            else:
+                existing_quota = self.get_virtual_volume_quota(virtualVolumeObjectId)
 
-            quotaParams = params['quota']
-# build data structure first - same data used in create and update
-            updated_quota = {}
-            updated_quota['logEvent'] = quotaParams.get('logEvent', existing_quota.get('logEvent', False))
-            updated_quota['diskUsageThreshold'] = self.get_quota_threshold(quotaParams['diskUsageThreshold'], existing_quota.get('diskUsageThreshold', {}))
-            updated_quota['fileCountThreshold'] = self.get_quota_threshold(quotaParams['fileCountThreshold'], existing_quota.get('fileCountThreshold', {}))
+            quota_changed = False
+            updated_quota = self.get_quota_settings(params['quota'], existing_quota)
             url = self.base_uri + "virtual-volumes/{}/quotas".format(virtual_volume['objectId'])
             if 'logEvent' in existing_quota:            # existing quota will have no content if a quota is yet to be created
                 if 'quotaObjectId' in existing_quota:   # different url is required to update quotas that have an objectId
                     url = self.base_uri + "quotas/{}".format(existing_quota['quotaObjectId'])
-                if updated_quota['logEvent'] != existing_quota['logEvent'] or updated_quota['diskUsageThreshold'] != existing_quota['diskUsageThreshold'] or updated_quota['fileCountThreshold'] != existing_quota['fileCountThreshold']:
-                    self.simple_patch(url, 204, updated_quota)
-                    changed = True
+# only the parts of the quota that differ are sent in the update
+                quota_patch = diff_fields(QUOTA_FIELDS, updated_quota, existing_quota)
+                if len(quota_patch) != 0:
+                    self.simple_patch(url, 204, quota_patch)
+                    quota_changed = True
             else:                                       # otherwise create new one
                 self.simple_post(url, 201, updated_quota)
+                quota_changed = True
+            if quota_changed == True:
                 changed = True
+                virtual_volume['quota'] = dict(existing_quota)
+                virtual_volume['quota'].update(updated_quota)
 # get updated quota at the end to return
-        virtual_volume['quota'] = self.get_virtual_volume_quota(virtualVolumeObjectId)
+        if self.refresh_needed(changed):
+            virtual_volume['quota'] = self.get_virtual_volume_quota(virtualVolumeObjectId)
+        elif 'quota' not in virtual_volume:
+            virtual_volume['quota'] = {}
         return changed, True, virtual_volume
 
     def get_sub_directory_object_id(self, filesystemId, folder, parentObjectId):
@@ -801,24 +2494,67 @@ class HNASFileServer:
             for item in dir['directories']:
                 if item['displayName'][0] == folder:
                     folderObjectId = item['objectId']
+                    break
         except:
             folderObjectId = None
         return folderObjectId
 
-    def get_directory_object_id(self, filesystemId, path):
-        pathObjectId = None
+    def new_directory_node(self, objectId):
+        return {'objectId': objectId, 'children': {}, 'entries': None, 'lock': threading.Lock()}
+
+    def get_directory_child(self, filesystemId, node, folder):
+        """
+        Find a sub-directory of a cached directory node, or None if it is not present
+        - the directory listing is fetched at most once per node
+        - the listing is only scanned as far as the requested entry, and the entries passed over are cached for sibling lookups
+        - a listing that fails is not cached, so the next lookup reads it again
+        """
+        with node['lock']:
+            if folder in node['children']:
+                return node['children'][folder]
+            if node['entries'] == None:
+                url = self.base_uri + "filesystems/{}/directories".format(filesystemId)
+                if node['objectId'] != None:
+                    url += "/{}".format(node['objectId'])
+                try:
+                    node['entries'] = iter(self.simple_get(url)['directories'])
+                except:
+                    return None
+            for item in node['entries']:
+                if item['displayName'][0] not in node['children']:
+                    node['children'][item['displayName'][0]] = self.new_directory_node(item['objectId'])
+                if item['displayName'][0] == folder:
+                    return node['children'][folder]
+        return None
+
+# split a UNIX format path into its folder names
+    def get_path_parts(self, path):
+        return [part for part in path.split('/') if part != ""]
+
+# walks down the cached tree for the filesystem, returning the nodes for each part of the path that was found
+# returns a list of (<folder> <node>), with the root node first
+    def get_directory_nodes(self, filesystemId, path):
+        with self.index_lock:
+            if filesystemId not in self.directory_trees:
+                self.directory_trees[filesystemId] = self.new_directory_node(None)
+        node = self.directory_trees[filesystemId]
+        nodes = [("/", node)]
 # need to split path into objects and walk down the tree
-        parts = path.split('/')
-# will end up with empty item first, so need to remove that 
-        if parts[0] == "":
-            del parts[0]
         dir_path = "/"
-        for part in parts:
+        for part in self.get_path_parts(path):
             dir_path = '/'.join([dir_path, part])
-            pathObjectId = self.get_sub_directory_object_id(filesystemId, dir_path, pathObjectId)
-            if pathObjectId == None:
-                return None
-        return pathObjectId
+            node = self.get_directory_child(filesystemId, node, dir_path)
+            if node == None:
+                break
+            nodes.append((dir_path, node))
+        return nodes
+
+    def get_directory_object_id(self, filesystemId, path):
+        nodes = self.get_directory_nodes(filesystemId, path)
+        parts = self.get_path_parts(path)
+        if len(nodes) != len(parts) + 1:
+            return None
+        return nodes[-1][1]['objectId']
 
     def delete_directory(self, filesystemId, path):
 # need to get root
@@ -828,6 +2564,263 @@ class HNASFileServer:
             return False
         url = self.base_uri + "filesystems/{}/directories/{}".format(filesystemId, pathObjectId)
         self.simple_delete(url)
+# remove the directory, and everything below it, from the cached tree
+        nodes = self.get_directory_nodes(filesystemId, path)
+        if len(nodes) > 1:
+            parent = nodes[-2][1]
+            with parent['lock']:
+                parent['children'].pop(nodes[-1][0], None)
+        return True
+
+# creates a single directory, whose parent must already exist
+# return True if the directory was created, False if it was already present
+    def ensure_directory(self, filesystemId, path):
+        nodes = self.get_directory_nodes(filesystemId, path)
+        parts = self.get_path_parts(path)
+        if len(nodes) == len(parts) + 1:
+            return False
+        assert len(nodes) == len(parts), "parent directory of '{}' not found".format(path)
+        parent = nodes[-1][1]
+        data = {'name': parts[-1]}
+        if parent['objectId'] != None:
+            data['parentObjectId'] = parent['objectId']
+        url = self.base_uri + "filesystems/{}/directories".format(filesystemId)
+        response = self.simple_post(url, 201, data)
+        folder = '/'.join([nodes[-1][0], parts[-1]])
+        with parent['lock']:
+            child = self.new_directory_node(None)
+            if response != None and 'directory' in response:
+                child['objectId'] = response['directory']['objectId']
+            elif self.check_mode == True:
+# placeholder, so directories planned within this one show where they would be created
+                child['objectId'] = "<new {}>".format(path)
+            else:
+# objectId not returned, so the parent listing needs to be read again to find it
+                parent['entries'] = None
+                child = None
+            if child != None:
+# nothing has been created within a new directory yet, so there's no need to list it
+                child['entries'] = iter([])
+                parent['children'][folder] = child
         return True
 
+    def create_directories(self, filesystemId, paths, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Ensure that each of the paths exists, creating any missing parent directories
+        - directories are created a level at a time, with all of the directories at a level created concurrently
+        - parent objectIds are resolved once and shared by all of their sub-directories
+        - returns a list of the directories that were created
+        """
+        levels = []
+        seen = set()
+        for path in paths:
+            parts = self.get_path_parts(path)
+            for depth in range(1, len(parts) + 1):
+                directory = '/' + '/'.join(parts[:depth])
+                if directory in seen:
+                    continue
+                seen.add(directory)
+                while len(levels) < depth:
+                    levels.append([])
+                levels[depth - 1].append(directory)
+        created = []
+        for level in levels:
+            results = run_concurrently(lambda directory: self.ensure_directory(filesystemId, directory), level, max_workers)
+            created.extend([directory for directory, result in zip(level, results) if result == True])
+        return created
+
+    def delete_directories(self, filesystemId, paths, wait=True, timeout=300, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Remove each of the paths, along with their contents
+        - paths within another path being removed are skipped, as they are removed along with it
+        - the directories are removed concurrently
+        - if wait is True, waits until the server has finished removing all of the directories
+        - returns a list of the directories that were removed
+        """
+        candidates = sorted(set(['/' + '/'.join(self.get_path_parts(path)) for path in paths]))
+        selected = []
+        chosen = set()
+        for path in candidates:
+# skip the path if it, or any of its parent directories, is already being removed
+            parts = self.get_path_parts(path)
+            if '/' in chosen or any('/' + '/'.join(parts[:count]) in chosen for count in range(1, len(parts) + 1)):
+                continue
+            selected.append(path)
+            chosen.add(path)
+# resolve every path first, so any shared parents are only listed once
+        parents = {}
+        for path, nodes in zip(selected, run_concurrently(lambda path: self.get_directory_nodes(filesystemId, path), selected, max_workers)):
+            if len(nodes) == len(self.get_path_parts(path)) + 1 and len(nodes) > 1:
+                parents[path] = (nodes[-2][1]['objectId'], nodes[-1][0])
+        removed = [path for path in selected if path in parents]
+        run_concurrently(lambda path: self.delete_directory(filesystemId, path), removed, max_workers)
+        if wait == True:
+            self.wait_for_directories_removed(filesystemId, [parents[path] for path in removed], timeout)
+        return removed
+
+    def wait_for_directories_removed(self, filesystemId, directories, timeout=300):
+        """
+        Wait until a group of directories are no longer present
+        - directories is a list of (<parentObjectId> <folder>)
+        - a single listing of each parent directory is polled, rather than each directory in turn
+        """
+        if self.check_mode == True:
+            return
+        waiting = set(directories)
+        count = 0
+        while len(waiting) != 0 and count < timeout:
+            time.sleep(1)
+            for parentObjectId in set([parent for parent, _ in waiting]):
+                url = self.base_uri + "filesystems/{}/directories".format(filesystemId)
+                if parentObjectId != None:
+                    url += "/{}".format(parentObjectId)
+                try:
+                    present = set([item['displayName'][0] for item in self.simple_get(url)['directories']])
+                except:
+                    present = set()
+                for directory in list(waiting):
+                    if directory[0] == parentObjectId and directory[1] not in present:
+                        waiting.discard(directory)
+            count += 1
+        assert len(waiting) == 0, "Waited {} seconds for directories to be removed - giving up".format(timeout)
+
+# gather everything that depends on a virtual server, or on the filesystems matching a label pattern
+# only the filesystems (and their shares, exports and virtual volumes) are gathered when label_pattern is used
+    def get_teardown_inventory(self, virtualServerId=None, name=None, label_pattern=None, max_workers=DEFAULT_MAX_WORKERS):
+        inventory = {'virtualServers': [], 'filesystems': [], 'nfsExports': [], 'cifsShares': [], 'virtualVolumes': []}
+        if label_pattern != None:
+            filesystems = [fs for fs in self.get_file_systems()['filesystems'] if fnmatch.fnmatchcase(fs['label'], label_pattern)]
+        else:
+            assert virtualServerId != None or name != None, "Missing 'virtualServerId', 'virtual_server_name' or 'label_pattern' data value"
+            evs = self.find_resource('virtual_server', virtualServerId, name)
+            if evs == None:                             # not there anyway, so nothing depends on it
+                return inventory
+            inventory['virtualServers'].append(evs)
+            filesystems = self.get_file_systems(virtualServerId=evs['virtualServerId'])['filesystems']
+        inventory['filesystems'] = filesystems
+        filesystemIds = set([fs['objectId'] for fs in filesystems])
+        virtualServerIds = []
+        for fs in filesystems:
+            if fs['virtualServerId'] not in virtualServerIds:
+                virtualServerIds.append(fs['virtualServerId'])
+        for evs in inventory['virtualServers']:
+            if evs['virtualServerId'] not in virtualServerIds:
+                virtualServerIds.append(evs['virtualServerId'])
+# all the listings are independent of each other, so fetch them at the same time
+        share_requests = [(evsId, type) for evsId in virtualServerIds for type in ['nfs', 'cifs']]
+        share_lists = run_concurrently(lambda request: self.get_share_or_export(request[0], request[1], include_authentications=False)['filesystemShares'],
+                                       share_requests, max_workers)
+        for (evsId, type), share_list in zip(share_requests, share_lists):
+            key = 'nfsExports' if type == 'nfs' else 'cifsShares'
+            inventory[key].extend([share for share in share_list if share['filesystemId'] in filesystemIds])
+        volume_lists = run_concurrently(lambda fs: self.get_virtual_volumes(fs['virtualServerId'], fs['objectId'], include_quota=False)['virtualVolumes'],
+                                        filesystems, max_workers)
+        for fs, volume_list in zip(filesystems, volume_lists):
+            for virtual_volume in volume_list:
+                virtual_volume['filesystemId'] = fs['objectId']
+                inventory['virtualVolumes'].append(virtual_volume)
+        return inventory
+
+# removes shares, exports, virtual volumes, filesystems and optionally the virtual server, one layer at a time
+# each layer is removed concurrently, as nothing within a layer depends on anything else in it
+# returns two values <changed> <removed>
+    def teardown(self, virtualServerId=None, name=None, label_pattern=None, remove_content=False, max_workers=DEFAULT_MAX_WORKERS):
+        inventory = self.get_teardown_inventory(virtualServerId, name, label_pattern, max_workers)
+        removed = {}
+        removed['nfsExports'] = [share['name'] for share in inventory['nfsExports']]
+        removed['cifsShares'] = [share['name'] for share in inventory['cifsShares']]
+        removed['virtualVolumes'] = [virtual_volume['name'] for virtual_volume in inventory['virtualVolumes']]
+        removed['filesystems'] = [fs['label'] for fs in inventory['filesystems']]
+        removed['virtualServers'] = [evs['name'] for evs in inventory['virtualServers']]
+
+        shares = [('nfs', share) for share in inventory['nfsExports']] + [('cifs', share) for share in inventory['cifsShares']]
+        run_concurrently(lambda item: self.simple_delete(self.base_uri + "filesystem-shares/{}/{}".format(item[0], item[1]['objectId'])),
+                         shares, max_workers)
+        run_concurrently(lambda virtual_volume: self.remove_virtual_volume(virtual_volume['filesystemId'], virtual_volume, remove_content),
+                         inventory['virtualVolumes'], max_workers)
+# filesystems need to be unmounted before they can be deleted - unmount them all, then wait for them together
+        mounted = [fs['objectId'] for fs in inventory['filesystems'] if fs['status'] != 'NOT_MOUNTED']
+        run_concurrently(lambda filesystemId: self.simple_post(self.base_uri + "filesystems/{}/unmount".format(filesystemId), 204),
+                         mounted, max_workers)
+        if len(mounted) != 0:
+            virtualServerIds = set([fs['virtualServerId'] for fs in inventory['filesystems']])
+            self.wait_for_filesystems(mounted, 'NOT_MOUNTED', virtualServerIds.pop() if len(virtualServerIds) == 1 else None)
+        run_concurrently(lambda fs: self.simple_delete(self.base_uri + "filesystems/{}".format(fs['objectId'])),
+                         inventory['filesystems'], max_workers)
+# evs can only be deleted if it's disabled
+        for evs in inventory['virtualServers']:
+            if evs['status'] != 'DISABLED':
+                self.simple_post(self.base_uri + "virtual-servers/{}/disable".format(evs['objectId']), 204)
+            self.simple_delete(self.base_uri + "virtual-servers/{}".format(evs['virtualServerId']))
+
+        changed = False
+        for key in removed:
+            if len(removed[key]) != 0:
+                changed = True
+        return changed, removed
+
+
+# the clusters option of the modules that can run against many clusters in one task
+# cluster_timeout is left out for modules that make changes or record results, as a cluster that times out carries on with them
+def cluster_argument_spec(timeout=True):
+    spec = dict(
+        clusters=dict(type='list', elements='dict', required=False, options=dict(
+            api_url=dict(type='str', required=True),
+            api_key=dict(type='str', required=False, no_log=True),
+            api_username=dict(type='str', required=False),
+            api_password=dict(type='str', required=False, no_log=True),
+            validate_certs=dict(type='bool', required=False),
+        )),
+        max_clusters=dict(type='int', default=DEFAULT_MAX_WORKERS),
+    )
+    if timeout == True:
+        spec['cluster_timeout'] = dict(type='int', required=False)
+    return spec
+
+def run_on_clusters(clusters, task, defaults=None, max_workers=DEFAULT_MAX_WORKERS, timeout=None, check_mode=False, refresh_results=True):
+    """
+    Run task against each of a list of clusters, using a bounded pool of threads
+    - each cluster is a dictionary holding its api_url, and any credentials or validate_certs that differ from defaults
+    - a cluster that holds any credentials only uses its own, so they are never mixed with the default credentials
+    - task is called with the HNASFileServer of the cluster, and returns a dictionary of results
+    - results are returned in the same order as the clusters, each with the api_url, the cluster, and the address and endpoint that served it
+    - a cluster that fails, or that has not finished within timeout seconds, is returned with its error and does not stop the others
+    """
+    defaults = defaults or {}
+
+    def run(cluster):
+        settings = dict([(key, defaults.get(key, None)) for key in ['api_key', 'api_username', 'api_password', 'validate_certs']])
+        if any([cluster.get(key, None) != None for key in ['api_key', 'api_username', 'api_password']]):
+            settings.update({'api_key': None, 'api_username': None, 'api_password': None})
+        settings.update(dict([(key, value) for key, value in cluster.items() if value != None]))
+        try:
+            hnas = HNASFileServer(settings['api_url'], verify=settings['validate_certs'] if settings['validate_certs'] != None else True,
+                                  check_mode=check_mode, refresh_results=refresh_results)
+            hnas.set_credentials(settings['api_key'], settings['api_username'], settings['api_password'])
+            result = {'api_url': settings['api_url'], 'cluster': hnas.address}
+            result.update(task(hnas))
+            result['address'] = hnas.get_address()
+            result['endpoint'] = hnas.get_endpoint()
+            if check_mode:
+                result['plan'] = hnas.planned_changes
+            return result
+        except Exception as error:
+            return {'api_url': settings['api_url'], 'error': str(error)}
 
+    clusters = list(clusters)
+    if len(clusters) == 0:
+        return []
+    pool = ThreadPool(min(max(max_workers, 1), len(clusters)))
+    try:
+        pending = [pool.apply_async(run, (cluster,)) for cluster in clusters]
+        deadline = time.time() + timeout if timeout != None else None
+        results = []
+        for cluster, result in zip(clusters, pending):
+            try:
+                results.append(result.get(None if deadline == None else max(deadline - time.time(), 0)))
+            except TimeoutError:
+                results.append({'api_url': cluster['api_url'], 'error': "No result within {} seconds".format(timeout)})
+        return results
+    finally:
+# the pool is not joined, so a cluster that is still running does not hold up the results of the others
+        pool.close()
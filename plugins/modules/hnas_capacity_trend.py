@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+
+DOCUMENTATION = r'''
+---
+module: hnas_capacity_trend
+short_description: This module records Hitachi NAS capacity samples and forecasts when filesystems will be full
+description:
+  - This module appends the used and total capacity of every filesystem and storage pool to a local trend file.
+  - It then fits the growth of each filesystem and storage pool, and forecasts the number of days until each one is full.
+  - The trend file is a compact append-only file of fixed size records, which is read through a memory map, so thousands of series can be forecast in one pass.
+  - Samples from several clusters can be kept in the same file.
+  - The module is intended to be run periodically, for example from cron or a scheduled job template.
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    - Required unless I(clusters) is given.
+    type: str
+    example:
+    - https://10.1.2.3:8444/v7
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  clusters:
+    description:
+    - A list of clusters to run the task against, instead of the single cluster given by I(api_url).
+    - The clusters are handled concurrently, and the results of each cluster, or the error that stopped it, are returned in C(clusters).
+    - A cluster that fails, or is slow, does not hold up or fail the others, and the task only fails if none of the clusters complete.
+    - Each entry holds the I(api_url) of a cluster, and any of I(validate_certs), I(api_key), I(api_username) and I(api_password) that differ from those given for the task.
+    - If an entry holds any of I(api_key), I(api_username) or I(api_password), only the credentials in the entry are used for that cluster.
+    type: list
+    elements: dict
+    suboptions:
+      api_url:
+        description: The URL to access the Hitachi NAS REST API of the cluster.
+        type: str
+        required: true
+      api_key:
+        description: The REST API authentication key for the cluster.
+        type: str
+      api_username:
+        description: The username to authenticate with the REST API of the cluster.
+        type: str
+      api_password:
+        description: The password to authenticate with the REST API of the cluster.
+        type: str
+      validate_certs:
+        description: Should https certificates be validated for the cluster?
+        type: bool
+  max_clusters:
+    description: The maximum number of I(clusters) handled at the same time.
+    type: int
+    default: 8
+  data:
+    description:
+    - Additional data to describe the trend file and the forecast.
+    required: true
+    type: dict
+    suboptions:
+      store_file:
+        description:
+        - The trend file that samples are appended to and forecasts are made from.
+        - The names and labels of the filesystems and storage pools are kept alongside it, in a file with C(.series.json) appended to the name.
+        type: str
+        required: true
+      record:
+        description:
+        - If I(record=true), read the current capacity from the server and append it to the trend file before forecasting.
+        - If I(record=false), only forecast from the samples already in the trend file.
+        - Samples are not recorded in check mode.
+        - The task does not report a change when samples are recorded, as the clusters are only read.
+        type: bool
+        default: true
+      window_days:
+        description: Only use the samples taken in this number of days when working out the growth of each filesystem and storage pool.
+        type: int
+        default: 30
+      fill_within_days:
+        description: Only return the filesystems and storage pools that are forecast to be full within this number of days.
+        type: int
+      capacity_unit:
+        description: The unit used for the sizes and growth rates that are returned
+        type: str
+        choices: ['b', 'bytes', 'k', 'kb', 'kib', 'm', 'mb', 'mib', 'g', 'gb', 'gib', 't', 'tb', 'tib']
+        default: bytes
+
+'''
+
+EXAMPLES = r'''
+- name: Record capacity and report the filesystems that will be full within 30 days
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_capacity_trend:
+      <<: *login
+      data:
+        store_file: /var/lib/hnas/capacity.trend
+        fill_within_days: 30
+        capacity_unit: gib
+    register: result
+  - debug: var=result.forecast
+
+'''
+
+RETURN = r'''
+
+'''
+
+import json
+
+from ansible.module_utils.api import basic_auth_argument_spec
+from ansible.module_utils.basic import AnsibleModule, get_exception
+
+import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
+
+
+def main():
+    argument_spec = basic_auth_argument_spec()
+    argument_spec.update(
+        api_key = dict(type='str', required=False, no_log=True),
+        data=dict(type='dict', required=True),
+    )
+    argument_spec.update(server.cluster_argument_spec(timeout=False))
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+# direct params cover authentication and operation
+    params = module.params
+# variables are specific to the operation being carried out
+    variables = params['data']
+
+    api_url = params['api_url']
+    api_key = params.get('api_key', None)
+    api_username = params.get('api_username', None)
+    api_password = params.get('api_password', None)
+    validate_certs = params['validate_certs']
+    forecast = []
+    recorded = 0
+    clusters = None
+    try:
+        assert 'store_file' in variables, "Missing 'store_file' data value"
+        store = server.CapacityTrendStore(variables['store_file'])
+        record = variables.get('record', True) == True and not module.check_mode
+
+# the samples of every cluster are appended to the same store, which locks the file for each append
+        def sample(hnas):
+            return dict(recorded=store.append(hnas.get_capacity_samples()) if record else 0)
+
+        if params['clusters'] != None:
+# every cluster is waited for, as a cluster still running after the module returned could append samples it did not report
+            clusters = server.run_on_clusters(params['clusters'], sample, defaults=params, max_workers=params['max_clusters'])
+            recorded = sum([cluster['recorded'] for cluster in clusters if 'error' not in cluster])
+        else:
+            assert api_url != None, "Either 'api_url' or 'clusters' is required"
+            hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
+            hnas.set_credentials(api_key, api_username, api_password)
+            recorded = sample(hnas)['recorded']
+        multiplier = server.get_unit_multiplier(variables.get('capacity_unit', 'bytes'))
+        fill_within_days = variables.get('fill_within_days', None)
+        for item in store.forecast(window_days=variables.get('window_days', 30)):
+            if fill_within_days != None and (item['daysToFull'] == None or item['daysToFull'] > fill_within_days):
+                continue
+            for field in ['used', 'capacity', 'growthPerDay']:
+                if item[field] != None:
+                    item[field] = round(float(item[field]) / multiplier, 2)
+            forecast.append(item)
+
+    except:
+        error = get_exception()
+        module.fail_json(msg="Hitachi NAS capacity trend task failed on system at [%s] due of [%s]" % (api_url, str(error)))
+
+# recording samples only adds to the local trend file, and makes no change to the clusters
+    result = dict(changed=False, recorded=recorded, forecast=forecast)
+    if clusters != None:
+        completed = [cluster for cluster in clusters if 'error' not in cluster]
+        if len(clusters) != 0 and len(completed) == 0:
+            module.fail_json(msg="Hitachi NAS capacity trend task failed on all [%d] clusters" % (len(clusters)), clusters=clusters)
+        module.exit_json(msg="Hitachi NAS capacity trend task completed successfully on [%d] of [%d] clusters" % (len(completed), len(clusters)),
+                         clusters=clusters, **result)
+    module.exit_json(msg="Hitachi NAS capacity trend task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
+
+if __name__ == '__main__':
+    main()
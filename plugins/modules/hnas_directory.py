@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+
+DOCUMENTATION = r'''
+---
+module: hnas_directory
+short_description: This module creates and deletes directories on Hitachi NAS filesystems
+description:
+  - This module ensures that a list of directories does or does not exist on a Hitachi NAS filesystem.
+  - Missing parent directories are created as needed, a level at a time, with each level created concurrently.
+  - Directories that are removed are deleted along with their contents.
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    type: str
+    required: true
+    example:
+    - https://10.1.2.3:8444/v7
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  state:
+    description:
+    - If I(state=present), ensure the existence of each of the directories.
+    - If I(state=absent), ensure that each of the directories, and their contents, are not present on the filesystem.
+    type: str
+    default: present
+    choices: ['present', 'absent']
+  data:
+    description:
+    - Additional data to describe the directories.
+    - Either the I(filesystemId) or I(filesystem_label) parameter, and the I(paths) parameter, are required for all operations.
+    required: true
+    type: dict
+    suboptions:
+      filesystemId:
+        description: C(filesystemId) of the filesystem that holds the directories
+        type: str
+      filesystem_label:
+        description: label or name of the filesystem that holds the directories
+        type: str
+      paths:
+        description:
+        - A list of directory paths.
+        - The paths should be in UNIX format - '/folder/sub-folder'
+        type: list
+        elements: str
+        required: true
+      wait:
+        description:
+        - Only relevant for I(state=absent).
+        - If I(wait=true), wait until the server has finished removing the directories and their contents.
+        - If I(wait=false), return as soon as the removal of each directory has been requested.
+        type: bool
+        default: true
+      wait_timeout:
+        description: The number of seconds to wait for the directories to be removed.
+        type: int
+        default: 300
+      max_workers:
+        description: The maximum number of requests sent to the REST API at the same time.
+        type: int
+        default: 8
+
+'''
+
+EXAMPLES = r'''
+- name: Create Hitachi NAS project directories
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_directory:
+      state: present
+      <<: *login
+      data:
+        filesystem_label: "ansible"
+        paths:
+        - /projects/alpha
+        - /projects/beta
+        - /projects/gamma/data
+    register: result
+  - debug: var=result.directories
+
+
+- name: Delete Hitachi NAS project directories, without waiting for the removal of their contents
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_directory:
+      state: absent
+      <<: *login
+      data:
+        filesystemId: "075E75D0D373CA7D0000000000000000"
+        paths:
+        - /projects/alpha
+        - /projects/beta
+        wait: false
+    register: result
+  - debug: var=result.directories
+
+'''
+
+RETURN = r'''
+
+'''
+
+import json
+
+from ansible.module_utils.api import basic_auth_argument_spec
+from ansible.module_utils.basic import AnsibleModule, get_exception
+
+import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
+
+
+def main():
+    argument_spec = basic_auth_argument_spec()
+    argument_spec.update(
+        api_key = dict(type='str', required=False, no_log=True),
+        state=dict(type='str', choices=['present','absent'], default='present'),
+        data=dict(type='dict', required=True),
+    )
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+# direct params cover authentication and operation
+    params = module.params
+# variables are specific to the operation being carried out
+    variables = params['data']
+
+    api_url = params['api_url']
+    api_key = params.get('api_key', None)
+    api_username = params.get('api_username', None)
+    api_password = params.get('api_password', None)
+    validate_certs = params['validate_certs']
+    directories = []
+    try:
+        assert 'paths' in variables, "Missing 'paths' data value"
+        state = params['state']
+        max_workers = int(variables.get('max_workers', server.DEFAULT_MAX_WORKERS))
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
+        hnas.set_credentials(api_key, api_username, api_password)
+        if 'filesystemId' in variables:
+            filesystemId = variables['filesystemId']
+        else:
+            assert 'filesystem_label' in variables, "Missing 'filesystemId' or 'filesystem_label' data value"
+            filesystemId = hnas.resolve_names({'filesystem': [variables['filesystem_label']]})['filesystem'][variables['filesystem_label']]
+            assert filesystemId != None, "filesystem not found"
+        if state == "absent":
+            directories = hnas.delete_directories(filesystemId, variables['paths'], wait=variables.get('wait', True),
+                                                  timeout=int(variables.get('wait_timeout', 300)), max_workers=max_workers)
+        elif state == "present":
+            directories = hnas.create_directories(filesystemId, variables['paths'], max_workers=max_workers)
+        changed = len(directories) != 0
+
+    except:
+        error = get_exception()
+        module.fail_json(msg="Hitachi NAS directory task failed on system at [%s] due of [%s]" % (api_url, str(error)))
+
+    result = dict(changed=changed, directories=directories)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS directory task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
+
+if __name__ == '__main__':
+    main()
@@ -26,14 +26,50 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    - Required unless I(clusters) is given.
     type: str
-    required: true
     example:
     - https://10.1.2.3:8444/v7
   validate_certs:
     description: Should https certificates be validated?
     type: bool
     default: true
+  clusters:
+    description:
+    - A list of clusters to run the task against, instead of the single cluster given by I(api_url).
+    - The clusters are handled concurrently, and the results of each cluster, or the error that stopped it, are returned in C(clusters).
+    - A cluster that fails, or is slow, does not hold up or fail the others, and the task only fails if none of the clusters complete.
+    - Each entry holds the I(api_url) of a cluster, and any of I(validate_certs), I(api_key), I(api_username) and I(api_password) that differ from those given for the task.
+    - If an entry holds any of I(api_key), I(api_username) or I(api_password), only the credentials in the entry are used for that cluster.
+    type: list
+    elements: dict
+    suboptions:
+      api_url:
+        description: The URL to access the Hitachi NAS REST API of the cluster.
+        type: str
+        required: true
+      api_key:
+        description: The REST API authentication key for the cluster.
+        type: str
+      api_username:
+        description: The username to authenticate with the REST API of the cluster.
+        type: str
+      api_password:
+        description: The password to authenticate with the REST API of the cluster.
+        type: str
+      validate_certs:
+        description: Should https certificates be validated for the cluster?
+        type: bool
+  max_clusters:
+    description: The maximum number of I(clusters) handled at the same time.
+    type: int
+    default: 8
+  cluster_timeout:
+    description:
+    - The number of seconds to wait for the I(clusters) to finish.
+    - Clusters that have not finished by then are returned with an error, along with the results of the others.
+    type: int
   fact_type:
     description:
     - A list of required facts.  Valid list items are
@@ -48,6 +84,9 @@ options:
     -  C(network_port_facts)   - gather a list of the physical network ports available to each cluster node
     -  C(aggregate_port_facts) - gather a list of the aggregate network ports available to each cluster node
     -  C(virtual_volume_facts) - gather details about virtual volumes and any associated quota, on a particular filesystem
+    -  C(snapshot_inventory_facts) - gather a compact summary of the snapshots on many, or all, filesystems
+    -  C(capacity_facts)       - gather capacity, utilization and overcommit figures for each storage pool, each virtual server and the whole cluster
+    -  C(node_balance_facts)   - gather the load on each cluster node, and suggested virtual server moves that would even it out
     choices:
       system_facts:
         description: gather details about the Hitachi NAS cluster, including node information
@@ -71,10 +110,79 @@ options:
         description: gather a list of the aggregate network ports available to each cluster node
       virtual_volume_facts:
         description: gather details about virtual volumes and any associated quota, on a particular filesystem
+      snapshot_inventory_facts:
+        description: gather a compact summary of the snapshots on many, or all, filesystems
+      capacity_facts:
+        description: gather capacity, utilization and overcommit figures for each storage pool, each virtual server and the whole cluster
+      node_balance_facts:
+        description: gather the load on each cluster node, and suggested virtual server moves that would even it out
 
     type: list
     elements: str
     required: true
+  fields:
+    description:
+    - Limits the fields returned for each fact type, to reduce the size of the results.
+    - A dictionary keyed by fact type, such as C(filesystem_facts), where each value is a list of the fields to return.
+    - Nested fields can be selected with a dotted path, such as C(settings.snapshotOption) for NFS exports and CIFS shares.
+    - Fact types that are not listed return all of their fields.
+    - For I(system_facts), the fields apply to the C(nodes) list.
+    - I(network_port_facts) and I(aggregate_port_facts) are lists of port names, rather than objects, so they are always returned in full.
+    type: dict
+  where:
+    description:
+    - Limits the objects returned for each fact type to those whose fields match.
+    - A dictionary keyed by fact type, such as C(filesystem_facts), where each value is a dictionary of fields, or dotted paths, and the values they must have.
+    - A value can be a single value to compare with, a list of allowed values, or a regular expression prefixed with C(~).
+    - Fields are matched before any I(fields) projection is applied, so the two can use different fields.
+    - The port names of I(network_port_facts) and I(aggregate_port_facts) are not filtered.
+    type: dict
+  previous_file:
+    description:
+    - Return only the objects that have been added, changed or removed since a previous run, in the C(delta) result, rather than in I(ansible_facts).
+    - The file can hold the fingerprints saved by I(fingerprints_file), or the facts, or registered result, of a previous run in JSON.
+    - If the file does not exist, every object is reported as added.
+    - With I(clusters), C({cluster}) in the name is replaced by the address of each cluster.
+    type: str
+  previous_fingerprints:
+    description:
+    - Return only the objects that have been added, changed or removed since a previous run, in the C(delta) result, rather than in I(ansible_facts).
+    - The C(fingerprints) value returned by a previous run with I(return_fingerprints=true).
+    type: dict
+  return_fingerprints:
+    description:
+    - Return the fingerprint of every object in the C(fingerprints) result, for use as the I(previous_fingerprints) of a later run.
+    - The fingerprints hold an entry for every object, so for large clusters I(fingerprints_file) is usually a better choice.
+    type: bool
+    default: false
+  fingerprints_file:
+    description:
+    - A file to save the fingerprint of every object to, for use as the I(previous_file) of a later run.
+    - This can be the same file as I(previous_file), so each run reports the changes since the last one.
+    - The file is not written in check mode.
+    - With I(clusters), C({cluster}) in the name is replaced by the address of each cluster.
+    type: str
+  output_file:
+    description:
+    - Write the gathered facts to this file as they are read, instead of returning them in I(ansible_facts), so large clusters can be reported on without holding every object in memory.
+    - If the name contains C({fact}), each type of fact is written to its own file, named by replacing C({fact}) with the fact key, such as C(filesystems).
+    - Otherwise all of the facts are written to one file, and each JSON line is written as C({"fact": key, "data": object}).
+    - The names of the files written, and the number of objects written for each fact key, are returned in C(output).
+    - The I(fields) and I(where) options are applied before objects are written.
+    - With I(clusters), C({cluster}) in the name is replaced by the address of each cluster, and it is required if there is more than one cluster.
+    type: str
+  output_format:
+    description:
+    - If I(output_format=jsonl), each object is written as a line of JSON.
+    - If I(output_format=csv), each object is written as a row, with nested fields flattened to dotted names. The columns are the I(fields) requested for the fact type, or the fields of the first object.
+    - CSV output of more than one type of fact needs C({fact}) in the I(output_file) name.
+    type: str
+    choices: ['jsonl', 'csv']
+    default: jsonl
+  output_compress:
+    description: Compress the output files with gzip.  Files whose name ends with C(.gz) are always compressed.
+    type: bool
+    default: false
   data:
     description:
     - Provides additional data when facts to be gathered are associated with a specific resource
@@ -86,6 +194,27 @@ options:
       virtualServerId:
         description: C(virtualServerId) parameter specifying a virtual server - required when retrieving I(nfs_export_facts) or I(smb_share_facts), otherwise not required
         type: int
+      filesystemIds:
+        description: A list of C(filesystemId) values to limit I(snapshot_inventory_facts) to - all filesystems are included if not supplied
+        type: list
+        elements: str
+      snapshot_name_pattern:
+        description: A shell style pattern, such as C(daily-*), that snapshot names must match to be included in I(snapshot_inventory_facts)
+        type: str
+      snapshot_older_than:
+        description: Only include snapshots older than this number of days in I(snapshot_inventory_facts)
+        type: int
+      snapshot_limit:
+        description: The maximum number of matching snapshots to include for each filesystem in I(snapshot_inventory_facts) - no more snapshots are read once it is reached
+        type: int
+      capacity_unit:
+        description: The unit used for the sizes in I(capacity_facts)
+        type: str
+        choices: ['b', 'bytes', 'k', 'kb', 'kib', 'm', 'mb', 'mib', 'g', 'gb', 'gib', 't', 'tb', 'tib']
+        default: bytes
+      page_size:
+        description: The number of snapshots to request at a time when gathering I(snapshot_facts) or I(snapshot_inventory_facts)
+        type: int
 
 '''
 
@@ -139,6 +268,135 @@ EXAMPLES = r'''
     register: result
   - debug: var=result.ansible_facts
 
+
+- name: Get the label and capacity of the mounted filesystems on virtual server 2 whose labels start with ansible
+  hosts: localhost
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      <<: *login
+      fact_type:
+        - filesystem_facts
+      fields:
+        filesystem_facts:
+          - label
+          - filesystemId
+          - capacity
+          - freeCapacity
+      where:
+        filesystem_facts:
+          virtualServerId: 2
+          status: MOUNTED
+          label: "~^ansible"
+    register: result
+  - debug: var=result.ansible_facts.filesystems
+
+
+- name: Report the filesystems and CIFS shares that have changed since the last run
+  hosts: localhost
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      <<: *login
+      fact_type:
+        - filesystem_facts
+        - cifs_share_facts
+      data:
+        virtualServerId: 2
+      previous_file: /var/lib/hnas/fingerprints.json
+      fingerprints_file: /var/lib/hnas/fingerprints.json
+    register: result
+  - debug: var=result.delta
+
+
+- name: Write the filesystems and CIFS shares of virtual server 2 to compressed CSV files
+  hosts: localhost
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      <<: *login
+      fact_type:
+        - filesystem_facts
+        - cifs_share_facts
+      data:
+        virtualServerId: 2
+      output_file: /tmp/hnas-{fact}.csv.gz
+      output_format: csv
+    register: result
+  - debug: var=result.output
+
+
+- name: Get the capacity and overcommit of each storage pool, in TiB
+  hosts: localhost
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      <<: *login
+      fact_type:
+        - capacity_facts
+      data:
+        capacity_unit: tib
+    register: result
+  - debug: var=result.ansible_facts.capacity.storagePools
+
+
+- name: Summarise the daily snapshots older than 30 days on every filesystem
+  hosts: localhost
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      <<: *login
+      fact_type:
+        - snapshot_inventory_facts
+      data:
+        snapshot_name_pattern: "daily-*"
+        snapshot_older_than: 30
+        snapshot_limit: 100
+    register: result
+  - debug: var=result.ansible_facts.snapshotInventory
+
+
+- name: Get the capacity of every cluster, reading four clusters at a time
+  hosts: localhost
+  tasks:
+  - hitachivantara.hnas.hnas_facts: 
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+      clusters:
+      - api_url: https://172.27.5.11:8444/v7
+      - api_url: https://172.27.6.11:8444/v8,https://172.27.6.12:8444/v8
+      - api_url: https://172.27.7.11:8444/v8
+        api_username: admin
+        api_password: secret
+      max_clusters: 4
+      cluster_timeout: 300
+      fact_type:
+        - capacity_facts
+    register: result
+  - debug:
+      msg: "{{ item.cluster | default(item.api_url) }} - {{ item.facts.capacity.cluster | default(item.error) }}"
+    loop: "{{ result.clusters }}"
+
 '''
 
 RETURN = r'''
@@ -153,13 +411,155 @@ from ansible.module_utils.basic import AnsibleModule, get_exception
 import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
 
 
+# file names can hold {cluster}, replaced by the address of the cluster, so each of many clusters has its own files
+def get_cluster_path(path, hnas):
+    if path == None:
+        return None
+    return path.replace("{cluster}", hnas.address)
+
+
+def gather_facts(hnas, params, check_mode=False):
+    """
+    Gather the requested facts from one cluster
+    - returns a dictionary holding the facts, and the delta, fingerprints and output of the run when they were requested
+    - the fingerprints are only returned if return_fingerprints is True, as they hold an entry for every object
+    """
+    fact_type = params['fact_type']
+    if fact_type is None:
+        fact_type = ['system_facts']
+    fields = params.get('fields', None) or {}
+    where = params.get('where', None) or {}
+    output_file = get_cluster_path(params.get('output_file', None), hnas)
+    previous_file = get_cluster_path(params.get('previous_file', None), hnas)
+    fingerprints_file = get_cluster_path(params.get('fingerprints_file', None), hnas)
+
+    writer = None
+    output = None
+    facts = {}
+    written = {}
+    fingerprint_written = fingerprints_file != None or params.get('return_fingerprints', False) == True
+
+# facts are shaped as they are read, then either held for the result or written straight to the output file
+    def gather(type, key, objs):
+        if isinstance(objs, dict):
+# single facts, such as summaries, are only projected
+            objs = server.shape_facts(objs, fields=fields.get(type, None))
+            if writer != None:
+                writer.write(key, [objs], fields.get(type, None))
+            else:
+                facts[key] = objs
+            return
+        shaped = server.iterate_shaped_facts(objs, fields=fields.get(type, None), where=where.get(type, None))
+        if writer != None:
+# facts written to the file are fingerprinted as they pass, as they are not held for the result
+            if fingerprint_written:
+                shaped = server.iterate_fact_fingerprints(key, shaped, written.setdefault(key, {}))
+            writer.write(key, shaped, fields.get(type, None))
+        else:
+            facts[key] = list(shaped)
+
+    label = None
+    virtualServerId = None
+    name = None
+    filesystemId = None
+    variables = {}
+    if 'data' in params and params['data'] != None:
+        variables = params['data']
+        label = variables.get('label', None)
+        name = variables.get('name', None)
+        virtualServerId = variables.get('virtualServerId', None)
+        filesystemId = variables.get('filesystemId', None)
+
+    if output_file != None:
+        assert previous_file == None and params.get('previous_fingerprints', None) == None, \
+            "'output_file' can not be used with 'previous_file' or 'previous_fingerprints'"
+        writer = server.FactFileWriter(output_file, format=params['output_format'], compress=params['output_compress'])
+    if 'system_facts' in fact_type:
+        facts['system'] = hnas.get_file_server_info()
+        gather('system_facts', 'nodes', hnas.get_nodes()['nodes'])
+    if 'virtual_server_facts' in fact_type:
+        gather('virtual_server_facts', 'virtualServers', hnas.get_virtual_servers(virtualServerId=virtualServerId, name=name)['virtualServers'])
+    if 'system_drive_facts' in fact_type:
+        gather('system_drive_facts', 'systemDrives', hnas.get_system_drives()['systemDrives'])
+    if 'storage_pool_facts' in fact_type:
+        gather('storage_pool_facts', 'storagePools', hnas.get_storage_pools(label=label)['storagePools'])
+    if 'filesystem_facts' in fact_type:
+        gather('filesystem_facts', 'filesystems', hnas.get_file_systems(virtualServerId=virtualServerId, label=label)['filesystems'])
+    if 'nfs_export_facts' in fact_type:
+        assert virtualServerId != None, "Missing 'virtualServerId' data value"
+        gather('nfs_export_facts', 'nfsExports', hnas.get_exports(virtualServerId, name=name)['filesystemShares'])
+    if 'cifs_share_facts' in fact_type:
+        assert virtualServerId != None, "Missing 'virtualServerId' data value"
+        gather('cifs_share_facts', 'cifsShares', hnas.get_shares(virtualServerId, name=name)['filesystemShares'])
+    if 'snapshot_facts' in fact_type:
+        assert filesystemId != None, "Missing 'filesystemId' data value"
+        gather('snapshot_facts', 'snapshots', hnas.iterate_snapshots(filesystemId, variables.get('page_size', None)))
+    if 'network_port_facts' in fact_type:
+        gather('network_port_facts', 'networkPorts', hnas.get_network_interfaces(physical=True)['ports'])
+    if 'aggregate_port_facts' in fact_type:
+        gather('aggregate_port_facts', 'aggregatePorts', hnas.get_network_interfaces(physical=False)['ports'])
+    if 'virtual_volume_facts' in fact_type:
+        assert virtualServerId != None, "Missing 'virtualServerId' data value"
+        assert filesystemId != None, "Missing 'filesystemId' data value"
+        gather('virtual_volume_facts', 'virtualVolumes', hnas.get_virtual_volumes(virtualServerId=virtualServerId, filesystemId=filesystemId, name=name)['virtualVolumes'])
+    if 'snapshot_inventory_facts' in fact_type:
+        gather('snapshot_inventory_facts', 'snapshotInventory',
+               hnas.get_snapshot_inventory(filesystemIds=variables.get('filesystemIds', None),
+                                           name_pattern=variables.get('snapshot_name_pattern', None),
+                                           older_than=variables.get('snapshot_older_than', None),
+                                           limit=variables.get('snapshot_limit', None),
+                                           page_size=variables.get('page_size', None)))
+    if 'capacity_facts' in fact_type:
+        gather('capacity_facts', 'capacity', hnas.get_capacity_facts(variables.get('capacity_unit', 'bytes')))
+    if 'node_balance_facts' in fact_type:
+        gather('node_balance_facts', 'nodeBalance', hnas.get_node_balance())
+
+    delta = None
+    fingerprints = None
+    previous = params.get('previous_fingerprints', None)
+    if previous_file != None:
+        previous = server.load_fact_fingerprints(previous_file)
+    if previous != None:
+# lists are replaced by their changes, so only the changed objects are returned
+        delta = {}
+        fingerprints = {}
+        for key in [key for key in facts if isinstance(facts[key], list)]:
+            delta[key], fingerprints[key] = server.get_fact_changes(key, facts.pop(key), previous.get(key, None))
+    elif fingerprint_written:
+        fingerprints = server.get_fact_fingerprints(facts)
+        fingerprints.update(written)
+    if fingerprints_file != None and not check_mode:
+        server.save_fact_fingerprints(fingerprints_file, fingerprints)
+    if writer != None:
+        output = writer.close()
+
+    result = dict(facts=facts)
+    if delta != None:
+        result['delta'] = delta
+    if fingerprints != None and params.get('return_fingerprints', False) == True:
+        result['fingerprints'] = fingerprints
+    if output != None:
+        result['output'] = output
+    return result
+
+
 def main():
     argument_spec = basic_auth_argument_spec()
     argument_spec.update(
         api_key=dict(type='str', required=False, no_log=True),
         fact_type=dict(type='list', elements='str'),
+        fields=dict(type='dict', required=False),
+        where=dict(type='dict', required=False),
+        previous_file=dict(type='str', required=False),
+        previous_fingerprints=dict(type='dict', required=False),
+        fingerprints_file=dict(type='str', required=False),
+        return_fingerprints=dict(type='bool', default=False),
+        output_file=dict(type='str', required=False),
+        output_format=dict(type='str', choices=['jsonl', 'csv'], default='jsonl'),
+        output_compress=dict(type='bool', default=False),
         data=dict(type='dict', required=False),
     )
+    argument_spec.update(server.cluster_argument_spec())
 
     module = AnsibleModule(
         argument_spec=argument_spec,
@@ -172,61 +572,35 @@ def main():
     api_username = params.get('api_username', None)
     api_password = params.get('api_password', None)
     validate_certs = params['validate_certs']
-    fact_type = params['fact_type']
-
-    if fact_type is None:
-        fact_type = ['system_facts']
-
-    label = None
-    virtualServerId = None
-    name = None
-    filesystemId = None
-    if 'data' in params and params['data'] != None:
-        variables = params['data']
-        label = variables.get('label', None)
-        name = variables.get('name', None)
-        virtualServerId = variables.get('virtualServerId', None)
-        filesystemId = variables.get('filesystemId', None)
 
-    facts = {}
+    clusters = None
     try:
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
-        hnas.set_credentials(api_key, api_username, api_password)
-        if 'system_facts' in fact_type:
-            facts['system'] = hnas.get_file_server_info()
-            facts['nodes'] = hnas.get_nodes()['nodes']
-        if 'virtual_server_facts' in fact_type:
-            facts['virtualServers'] = hnas.get_virtual_servers(virtualServerId=virtualServerId, name=name)['virtualServers']
-        if 'system_drive_facts' in fact_type:
-            facts['systemDrives'] = hnas.get_system_drives()['systemDrives']
-        if 'storage_pool_facts' in fact_type:
-            facts['storagePools'] = hnas.get_storage_pools(label=label)['storagePools']
-        if 'filesystem_facts' in fact_type:
-            facts['filesystems'] = hnas.get_file_systems(virtualServerId=virtualServerId, label=label)['filesystems']
-        if 'nfs_export_facts' in fact_type:
-            assert virtualServerId != None, "Missing 'virtualServerId' data value"
-            facts['nfsExports'] = hnas.get_exports(virtualServerId, name=name)['filesystemShares']
-        if 'cifs_share_facts' in fact_type:
-            assert virtualServerId != None, "Missing 'virtualServerId' data value"
-            facts['cifsShares'] = hnas.get_shares(virtualServerId, name=name)['filesystemShares']
-        if 'snapshot_facts' in fact_type:
-            assert filesystemId != None, "Missing 'filesystemId' data value"
-            facts['snapshots'] = hnas.get_snapshots(filesystemId)['snapshots']
-        if 'network_port_facts' in fact_type:
-            facts['networkPorts'] = hnas.get_network_interfaces(physical=True)['ports']
-        if 'aggregate_port_facts' in fact_type:
-            facts['aggregatePorts'] = hnas.get_network_interfaces(physical=False)['ports']
-        if 'virtual_volume_facts' in fact_type:
-            assert virtualServerId != None, "Missing 'virtualServerId' data value"
-            assert filesystemId != None, "Missing 'filesystemId' data value"
-            facts['virtualVolumes'] = hnas.get_virtual_volumes(virtualServerId=virtualServerId, filesystemId=filesystemId, name=name)['virtualVolumes']
+        if params['clusters'] != None:
+            assert len(params['clusters']) < 2 or params.get('previous_fingerprints', None) == None, \
+                "'previous_fingerprints' can not be used with more than one cluster - use 'previous_file' with {cluster} in its name"
+            for option in ['previous_file', 'fingerprints_file', 'output_file']:
+                assert len(params['clusters']) < 2 or params.get(option, None) == None or "{cluster}" in params[option], \
+                    "'{}' must contain {{cluster}} when facts are gathered from more than one cluster".format(option)
+            clusters = server.run_on_clusters(params['clusters'], lambda hnas: gather_facts(hnas, params, module.check_mode), defaults=params,
+                                              max_workers=params['max_clusters'], timeout=params['cluster_timeout'])
+        else:
+            assert api_url != None, "Either 'api_url' or 'clusters' is required"
+            hnas = server.HNASFileServer(api_url, verify=validate_certs)
+            hnas.set_credentials(api_key, api_username, api_password)
+            gathered = gather_facts(hnas, params, module.check_mode)
 
     except:
         error = get_exception()
         module.fail_json(msg="Failed to obtain facts from system at [%s] because of [%s]" % (api_url, str(error)))
 
-    result = dict(ansible_facts=facts, changed=False)
-    module.exit_json(msg="Gathered facts from system at [%s]" % (hnas.get_address()), **result)
+    if clusters != None:
+        completed = [cluster for cluster in clusters if 'error' not in cluster]
+        if len(clusters) != 0 and len(completed) == 0:
+            module.fail_json(msg="Failed to obtain facts from all [%d] clusters" % (len(clusters)), clusters=clusters)
+        module.exit_json(msg="Gathered facts from [%d] of [%d] clusters" % (len(completed), len(clusters)), changed=False, clusters=clusters)
+    result = dict(ansible_facts=gathered.pop('facts'), changed=False)
+    result.update(gathered)
+    module.exit_json(msg="Gathered facts from system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 
 if __name__ == '__main__':
@@ -27,6 +27,7 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
     type: str
     required: true
     example:
@@ -35,6 +36,12 @@ options:
     description: Should https certificates be validated?
     type: bool
     default: true
+  refresh_results:
+    description:
+    - If I(refresh_results=true), objects are read again from the server after they have been changed, so the returned details are authoritative.
+    - If I(refresh_results=false), the returned details are built by merging the requested changes into the details read before the change, which saves several requests for each changed item.
+    type: bool
+    default: true
   state:
     description:
     - If I(state=present), ensure the existence of a filesystem, with the requested I(status), and that it is at least the requested I(capacity).
@@ -46,9 +53,10 @@ options:
     description:
     - Additional data to describe the filesystem.
     - The I(label) parameter is required for all operations, and is the only parameter required for the delete operation.
-    - Either the I(storage_pool_name) or I(storagePoolId) parameter needs to be specified for all C(present) operations.
+    - One of the I(storage_pool_name), I(storagePoolId) or I(storage_pool_placement) parameters needs to be specified for all C(present) operations.
     - Either the I(virtual_server_name) or I(virtualServerId) parameter needs to be specified for all C(present) operations.
     - The I(capacity) value is required for all C(present) operations.
+    - A batch of filesystems can be managed by a single task with the I(filesystems) parameter.
     required: true
     type: dict
     suboptions:
@@ -62,6 +70,20 @@ options:
       storagePoolId:
         description: ID of the storage pool that should contain the filesystem
         type: int
+      storage_pool_placement:
+        description:
+        - Choose the storage pool for a new filesystem, rather than naming it with I(storage_pool_name) or I(storagePoolId).
+        - If I(storage_pool_placement=free), the pool with the most free space is chosen.
+        - If I(storage_pool_placement=count), the pool with the fewest filesystems is chosen.
+        - If I(storage_pool_placement=allocation), the pool with the lowest proportion of its capacity allocated to filesystems is chosen.
+        - Only pools with enough free space for the filesystem are considered, and existing filesystems are never moved.
+        - For a batch of I(filesystems), the largest are placed first and each placement is taken into account for the next, so the batch is spread across the pools.
+        choices: ['free', 'count', 'allocation']
+        type: str
+      storage_pool_candidates:
+        description: A list of storage pool labels or IDs that I(storage_pool_placement) may choose from - all pools are considered if not supplied
+        type: list
+        elements: str
       virtual_server_name:
         description: name of the virtual server that should host the filesystem
         type: str
@@ -91,6 +113,17 @@ options:
         choices: [4, 32]
         type: int
         default: 4
+      filesystems:
+        description:
+        - A list of filesystems to create, update or delete concurrently in a single task.
+        - Each item holds the parameters of one filesystem, such as I(label) and I(capacity), and any parameter not in an item is taken from the other I(data) parameters.
+        - The filesystems are returned in the C(filesystems) value, instead of C(filesystem).
+        type: list
+        elements: dict
+      max_workers:
+        description: The maximum number of requests sent to the REST API at the same time, when I(filesystems) is used.
+        type: int
+        default: 8
 
 '''
 
@@ -157,6 +190,33 @@ EXAMPLES = r'''
     register: result
   - debug: var=result.filesystem
 
+
+- name: Create a batch of Hitachi NAS filesystems, spread across the storage pools with the most free space
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_filesystem:
+      state: present
+      <<: *login
+      data:
+        virtualServerId: 1
+        storage_pool_placement: free
+        capacity_unit: gib
+        filesystems:
+        - label: "ansible-1"
+          capacity: 100
+        - label: "ansible-2"
+          capacity: 50
+        - label: "ansible-3"
+          capacity: 50
+    register: result
+  - debug: var=result.filesystems
+
 '''
 
 RETURN = r'''
@@ -176,6 +236,7 @@ def main():
     argument_spec.update(
         api_key = dict(type='str', required=False, no_log=True),
         state=dict(type='str', choices=['present','absent'], default='present'),
+        refresh_results=dict(type='bool', default=True),
         data=dict(type='dict', required=True),
     )
 
@@ -194,18 +255,36 @@ def main():
     api_password = params.get('api_password', None)
     validate_certs = params['validate_certs']
     filesystem = ""
+    filesystems = None
     try:
-        assert 'label' in variables, "Missing 'label' data value"
         state = params['state']
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode,
+                                     refresh_results=params['refresh_results'])
         hnas.set_credentials(api_key, api_username, api_password)
-        if state == "absent":
+        if 'filesystems' in variables:
+# each item of a batch takes any parameters it does not have from the rest of the data
+            defaults = dict([(key, value) for key, value in variables.items() if key not in ['filesystems', 'max_workers']])
+            batch = [dict(defaults, **item) for item in variables['filesystems']]
+            for item in batch:
+                assert 'label' in item, "Missing 'label' value in filesystems"
+            max_workers = int(variables.get('max_workers', server.DEFAULT_MAX_WORKERS))
+            if state == "absent":
+                removed = server.run_concurrently(lambda item: hnas.delete_filesystem(label=item['label']), batch, max_workers)
+                changed = any(removed)
+                filesystems = [item['label'] for item, deleted in zip(batch, removed) if deleted == True]
+            elif state == "present":
+                for item in batch:
+                    assert 'capacity' in item, "Missing 'capacity' value for filesystem {}".format(item['label'])
+                changed, filesystems = hnas.create_filesystems(batch, max_workers=max_workers)
+        elif state == "absent":
+            assert 'label' in variables, "Missing 'label' data value"
             changed = hnas.delete_filesystem(label=variables['label'])
         elif state == "present":
+            assert 'label' in variables, "Missing 'label' data value"
             if 'virtual_server_name' not in variables:
                 assert 'virtualServerId' in variables, "Missing 'virtualServerId' or 'virtual_server_name' data value"
-            if 'storage_pool_name' not in variables:
-                assert 'storagePoolId' in variables, "Missing 'storagePoolId' or 'storage_pool_name' data value"
+            if 'storage_pool_name' not in variables and 'storage_pool_placement' not in variables:
+                assert 'storagePoolId' in variables, "Missing 'storagePoolId', 'storage_pool_name' or 'storage_pool_placement' data value"
             assert 'capacity' in variables, "Missing 'capacity' data value"
             changed, success, filesystem = hnas.create_filesystem(variables)
             assert success == True, "An existing filesystem exists, with the same name, but the parameters do not match"
@@ -215,7 +294,11 @@ def main():
         module.fail_json(msg="Hitachi NAS filesystem task failed on system at [%s] due to [%s]" % (api_url, str(error)))
 
     result = dict(changed=changed, filesystem=filesystem)
-    module.exit_json(msg="Hitachi NAS filesystem task completed successfully on system at [%s]" % (hnas.get_address()), **result)
+    if filesystems != None:
+        result = dict(changed=changed, filesystems=filesystems)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS filesystem task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 if __name__ == '__main__':
     main()
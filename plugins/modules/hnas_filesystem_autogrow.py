@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+
+DOCUMENTATION = r'''
+---
+module: hnas_filesystem_autogrow
+short_description: This module expands Hitachi NAS filesystems that are running out of space
+description:
+  - This module expands every filesystem whose utilization is at or above a threshold, across all filesystems or those whose label matches a pattern.
+  - The filesystems and storage pools are read from a single listing each, and the expands are issued concurrently.
+  - The free space of each storage pool is checked before a filesystem is grown, and the fullest filesystems are given space first.
+  - The filesystems that grew, and by how much, are returned along with those that could not be grown.
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    - Required unless I(clusters) is given.
+    type: str
+    example:
+    - https://10.1.2.3:8444/v7
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  clusters:
+    description:
+    - A list of clusters to run the task against, instead of the single cluster given by I(api_url).
+    - The clusters are handled concurrently, and the results of each cluster, or the error that stopped it, are returned in C(clusters).
+    - A cluster that fails does not hold up or fail the others, and the task only fails if none of the clusters complete.
+    - Each entry holds the I(api_url) of a cluster, and any of I(validate_certs), I(api_key), I(api_username) and I(api_password) that differ from those given for the task.
+    - If an entry holds any of I(api_key), I(api_username) or I(api_password), only the credentials in the entry are used for that cluster.
+    type: list
+    elements: dict
+    suboptions:
+      api_url:
+        description: The URL to access the Hitachi NAS REST API of the cluster.
+        type: str
+        required: true
+      api_key:
+        description: The REST API authentication key for the cluster.
+        type: str
+      api_username:
+        description: The username to authenticate with the REST API of the cluster.
+        type: str
+      api_password:
+        description: The password to authenticate with the REST API of the cluster.
+        type: str
+      validate_certs:
+        description: Should https certificates be validated for the cluster?
+        type: bool
+  max_clusters:
+    description: The maximum number of I(clusters) handled at the same time.
+    type: int
+    default: 8
+  data:
+    description:
+    - Additional data to describe which filesystems to expand, and by how much.
+    - At least one of I(grow_by), I(grow_percent) or I(target_utilization) is required.
+    - If more than one of them is supplied, the largest resulting growth is used.
+    required: true
+    type: dict
+    suboptions:
+      threshold:
+        description: Filesystems whose used capacity is at or above this percentage of their capacity are expanded
+        type: int
+        default: 80
+      grow_by:
+        description: The amount to grow each filesystem by, in units of I(capacity_unit)
+        type: int
+      grow_percent:
+        description: The amount to grow each filesystem by, as a percentage of its current capacity
+        type: int
+      target_utilization:
+        description: Grow each filesystem enough for its used capacity to fall to this percentage of its capacity, which must be more than 0 and no more than 100
+        type: int
+      max_capacity:
+        description: No filesystem is grown beyond this capacity, in units of I(capacity_unit)
+        type: int
+      pool_reserve:
+        description: The amount of space to leave free in each storage pool, in units of I(capacity_unit)
+        type: int
+        default: 0
+      capacity_unit:
+        description: unit to use as a multiplier for the I(grow_by), I(max_capacity) and I(pool_reserve) values
+        choices: ['b', 'bytes', 'k', 'kb', 'kib', 'm', 'mb', 'mib', 'g', 'gb', 'gib', 't', 'tb', 'tib']
+        type: str
+        default: bytes
+      label_pattern:
+        description: A shell style pattern, such as C(ansible-*), that filesystem labels must match to be considered
+        type: str
+      filesystemIds:
+        description: A list of C(filesystemId) values to limit the filesystems considered
+        type: list
+        elements: str
+      max_workers:
+        description: The maximum number of requests sent to the REST API at the same time.
+        type: int
+        default: 8
+
+'''
+
+EXAMPLES = r'''
+- name: Grow any ansible filesystem that is over 85% full by 20%, keeping 1 TiB free in each pool
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_filesystem_autogrow:
+      <<: *login
+      data:
+        label_pattern: "ansible-*"
+        threshold: 85
+        grow_percent: 20
+        pool_reserve: 1
+        capacity_unit: tib
+    register: result
+  - debug: var=result.grown
+
+'''
+
+RETURN = r'''
+
+'''
+
+import json
+
+from ansible.module_utils.api import basic_auth_argument_spec
+from ansible.module_utils.basic import AnsibleModule, get_exception
+
+import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
+
+
+def main():
+    argument_spec = basic_auth_argument_spec()
+    argument_spec.update(
+        api_key = dict(type='str', required=False, no_log=True),
+        data=dict(type='dict', required=True),
+    )
+    argument_spec.update(server.cluster_argument_spec(timeout=False))
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+# direct params cover authentication and operation
+    params = module.params
+# variables are specific to the operation being carried out
+    variables = params['data']
+
+    api_url = params['api_url']
+    api_key = params.get('api_key', None)
+    api_username = params.get('api_username', None)
+    api_password = params.get('api_password', None)
+    validate_certs = params['validate_certs']
+
+    def grow(hnas):
+        multiplier = hnas.get_unit_multiplier(variables.get('capacity_unit', 'bytes'))
+        grow_by = variables.get('grow_by', None)
+        max_capacity = variables.get('max_capacity', None)
+        changed, grown, skipped = hnas.autogrow_filesystems(int(variables.get('threshold', 80)),
+                                                            grow_by=multiplier * int(grow_by) if grow_by != None else None,
+                                                            grow_percent=variables.get('grow_percent', None),
+                                                            target_utilization=variables.get('target_utilization', None),
+                                                            max_capacity=multiplier * int(max_capacity) if max_capacity != None else None,
+                                                            pool_reserve=multiplier * int(variables.get('pool_reserve', 0)),
+                                                            label_pattern=variables.get('label_pattern', None),
+                                                            filesystemIds=variables.get('filesystemIds', None),
+                                                            max_workers=int(variables.get('max_workers', server.DEFAULT_MAX_WORKERS)))
+        return dict(changed=changed, grown=grown, skipped=skipped)
+
+    clusters = None
+    try:
+        if params['clusters'] != None:
+            clusters = server.run_on_clusters(params['clusters'], grow, defaults=params, max_workers=params['max_clusters'],
+                                              check_mode=module.check_mode)
+        else:
+            assert api_url != None, "Either 'api_url' or 'clusters' is required"
+            hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
+            hnas.set_credentials(api_key, api_username, api_password)
+            result = grow(hnas)
+
+    except:
+        error = get_exception()
+        module.fail_json(msg="Hitachi NAS filesystem autogrow task failed on system at [%s] due of [%s]" % (api_url, str(error)))
+
+    if clusters != None:
+        completed = [cluster for cluster in clusters if 'error' not in cluster]
+        if len(clusters) != 0 and len(completed) == 0:
+            module.fail_json(msg="Hitachi NAS filesystem autogrow task failed on all [%d] clusters" % (len(clusters)), clusters=clusters)
+        module.exit_json(msg="Hitachi NAS filesystem autogrow task completed successfully on [%d] of [%d] clusters" % (len(completed), len(clusters)),
+                         changed=any([cluster['changed'] for cluster in completed]), clusters=clusters)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS filesystem autogrow task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
+
+if __name__ == '__main__':
+    main()
@@ -27,6 +27,7 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
     type: str
     required: true
     example:
@@ -35,6 +36,12 @@ options:
     description: Should https certificates be validated?
     type: bool
     default: true
+  refresh_results:
+    description:
+    - If I(refresh_results=true), objects are read again from the server after they have been changed, so the returned details are authoritative.
+    - If I(refresh_results=false), the returned details are built by merging the requested changes into the details read before the change, which saves several requests for each changed item.
+    type: bool
+    default: true
   state:
     description:
     - If I(state=present), ensure the existence of a share/export, and that it is in the requested state/configuration, including CIFS/SMB share authentications.
@@ -227,6 +234,7 @@ def main():
     argument_spec.update(
         api_key = dict(type='str', required=False, no_log=True),
         state=dict(type='str', choices=['present','absent'], default='present'),
+        refresh_results=dict(type='bool', default=True),
         data=dict(type='dict', required=True),
     )
 
@@ -253,7 +261,8 @@ def main():
         assert 'name' in variables, "Missing 'name' data value"
         name = variables['name']
         state = params['state']
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode,
+                                     refresh_results=params['refresh_results'])
         hnas.set_credentials(api_key, api_username, api_password)
         if state == "absent":
             changed, share = hnas.delete_share_or_export(virtualServerId, type, variables)
@@ -266,11 +275,13 @@ def main():
         module.fail_json(msg="Hitachi NAS share/export task failed on system at [%s] due of [%s]" % (api_url, str(error)))
 
     result = dict(changed=changed)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
     if type == "nfs":
         result['nfsExport'] = share
     else:
         result['cifsShare'] = share
-    module.exit_json(msg="Hitachi NAS share/export task completed successfully on system at [%s]" % (hnas.get_address()), **result)
+    module.exit_json(msg="Hitachi NAS share/export task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 if __name__ == '__main__':
     main()
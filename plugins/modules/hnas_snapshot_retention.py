@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+
+DOCUMENTATION = r'''
+---
+module: hnas_snapshot_retention
+short_description: This module applies snapshot retention rules to Hitachi NAS filesystems
+description:
+  - This module deletes the snapshots that are not retained by a set of retention rules, across many filesystems at once.
+  - The snapshot listings are read concurrently, and the snapshots to delete are worked out in a single pass over each listing.
+  - The deletes are then issued with bounded concurrency, and the number of snapshots deleted and kept is reported for each filesystem.
+  - If any of I(keep_last), I(keep_daily) or I(keep_weekly) are supplied, any snapshot not retained by one of them is deleted.
+  - Snapshots older than I(max_age_days) are deleted, unless they are retained by I(keep_last).
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    - Required unless I(clusters) is given.
+    type: str
+    example:
+    - https://10.1.2.3:8444/v7
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  clusters:
+    description:
+    - A list of clusters to run the task against, instead of the single cluster given by I(api_url).
+    - The clusters are handled concurrently, and the results of each cluster, or the error that stopped it, are returned in C(clusters).
+    - A cluster that fails does not hold up or fail the others, and the task only fails if none of the clusters complete.
+    - Each entry holds the I(api_url) of a cluster, and any of I(validate_certs), I(api_key), I(api_username) and I(api_password) that differ from those given for the task.
+    - If an entry holds any of I(api_key), I(api_username) or I(api_password), only the credentials in the entry are used for that cluster.
+    type: list
+    elements: dict
+    suboptions:
+      api_url:
+        description: The URL to access the Hitachi NAS REST API of the cluster.
+        type: str
+        required: true
+      api_key:
+        description: The REST API authentication key for the cluster.
+        type: str
+      api_username:
+        description: The username to authenticate with the REST API of the cluster.
+        type: str
+      api_password:
+        description: The password to authenticate with the REST API of the cluster.
+        type: str
+      validate_certs:
+        description: Should https certificates be validated for the cluster?
+        type: bool
+  max_clusters:
+    description: The maximum number of I(clusters) handled at the same time.
+    type: int
+    default: 8
+  data:
+    description:
+    - Additional data to describe the filesystems and the retention rules.
+    - At least one of I(keep_last), I(keep_daily), I(keep_weekly) or I(max_age_days) is required.
+    required: true
+    type: dict
+    suboptions:
+      filesystemIds:
+        description: A list of C(filesystemId) values to apply the rules to - all filesystems are included if neither this nor I(label_pattern) is supplied
+        type: list
+        elements: str
+      label_pattern:
+        description: A shell style pattern, such as C(ansible-*), that filesystem labels must match for the rules to be applied
+        type: str
+      snapshot_name_pattern:
+        description:
+        - A shell style pattern, such as C(daily-*), that snapshot names must match.
+        - Snapshots that do not match are ignored, and never deleted.
+        type: str
+      keep_last:
+        description: Keep this number of the newest snapshots on each filesystem
+        type: int
+      keep_daily:
+        description: Keep the newest snapshot taken on each of this number of days, counting back from today
+        type: int
+      keep_weekly:
+        description: Keep the newest snapshot taken in each of this number of weeks, counting back from this week
+        type: int
+      max_age_days:
+        description: Delete snapshots older than this number of days
+        type: int
+      max_workers:
+        description: The maximum number of requests sent to the REST API at the same time.
+        type: int
+        default: 8
+
+'''
+
+EXAMPLES = r'''
+- name: Keep a week of daily snapshots and a month of weekly snapshots on the ansible filesystems
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_snapshot_retention:
+      <<: *login
+      data:
+        label_pattern: "ansible-*"
+        snapshot_name_pattern: "auto-*"
+        keep_last: 3
+        keep_daily: 7
+        keep_weekly: 4
+    register: result
+  - debug: var=result.retention
+
+
+- name: Delete all snapshots older than 90 days on every filesystem
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_snapshot_retention:
+      <<: *login
+      data:
+        max_age_days: 90
+    register: result
+  - debug: var=result.retention
+
+'''
+
+RETURN = r'''
+
+'''
+
+import json
+
+from ansible.module_utils.api import basic_auth_argument_spec
+from ansible.module_utils.basic import AnsibleModule, get_exception
+
+import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
+
+
+def main():
+    argument_spec = basic_auth_argument_spec()
+    argument_spec.update(
+        api_key = dict(type='str', required=False, no_log=True),
+        data=dict(type='dict', required=True),
+    )
+    argument_spec.update(server.cluster_argument_spec(timeout=False))
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+# direct params cover authentication and operation
+    params = module.params
+# variables are specific to the operation being carried out
+    variables = params['data']
+
+    api_url = params['api_url']
+    api_key = params.get('api_key', None)
+    api_username = params.get('api_username', None)
+    api_password = params.get('api_password', None)
+    validate_certs = params['validate_certs']
+
+    def apply(hnas):
+        retention = hnas.apply_snapshot_retention(filesystemIds=variables.get('filesystemIds', None),
+                                                  label_pattern=variables.get('label_pattern', None),
+                                                  name_pattern=variables.get('snapshot_name_pattern', None),
+                                                  keep_last=variables.get('keep_last', None),
+                                                  keep_daily=variables.get('keep_daily', None),
+                                                  keep_weekly=variables.get('keep_weekly', None),
+                                                  max_age_days=variables.get('max_age_days', None),
+                                                  max_workers=int(variables.get('max_workers', server.DEFAULT_MAX_WORKERS)))
+        deleted = sum([fs['deleted'] for fs in retention])
+        return dict(changed=deleted != 0, deleted=deleted, retention=retention)
+
+    clusters = None
+    try:
+        if params['clusters'] != None:
+            clusters = server.run_on_clusters(params['clusters'], apply, defaults=params, max_workers=params['max_clusters'],
+                                              check_mode=module.check_mode)
+        else:
+            assert api_url != None, "Either 'api_url' or 'clusters' is required"
+            hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
+            hnas.set_credentials(api_key, api_username, api_password)
+            result = apply(hnas)
+
+    except:
+        error = get_exception()
+        module.fail_json(msg="Hitachi NAS snapshot retention task failed on system at [%s] due of [%s]" % (api_url, str(error)))
+
+    if clusters != None:
+        completed = [cluster for cluster in clusters if 'error' not in cluster]
+        if len(clusters) != 0 and len(completed) == 0:
+            module.fail_json(msg="Hitachi NAS snapshot retention task failed on all [%d] clusters" % (len(clusters)), clusters=clusters)
+        module.exit_json(msg="Hitachi NAS snapshot retention task completed successfully on [%d] of [%d] clusters" % (len(completed), len(clusters)),
+                         changed=any([cluster['changed'] for cluster in completed]), deleted=sum([cluster['deleted'] for cluster in completed]), clusters=clusters)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS snapshot retention task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
+
+if __name__ == '__main__':
+    main()
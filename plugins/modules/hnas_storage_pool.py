@@ -26,6 +26,7 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
     type: str
     required: true
     example:
@@ -64,8 +65,31 @@ options:
         description:
         - A list of system drive ID values
         - Minimum number of system drives to create a storage pool is 4, and the maximum is 16
+        - Either I(systemDrives), I(system_drive_count) or I(pool_size) is required to create a storage pool.
         type: list
-        required: true
+      system_drive_count:
+        description:
+        - Choose this number of free system drives for a new storage pool, instead of listing them in I(systemDrives).
+        - The count must be from 4 to 16.
+        - The drives are spread as evenly as possible across the back-end storage systems and RAID groups, to maximize parallel throughput.
+        - The chosen drives are returned in C(selectedSystemDrives), and can be reviewed by running the task in check mode.
+        type: int
+      pool_size:
+        description:
+        - Choose enough free system drives for a new storage pool of at least this size, instead of listing them in I(systemDrives).
+        - The I(pool_size) value should be used in conjunction with the I(capacity_unit) value.
+        type: int
+      capacity_unit:
+        description: unit to use as a multiplier for the I(pool_size) value
+        choices: ['b', 'bytes', 'k', 'kb', 'kib', 'm', 'mb', 'mib', 'g', 'gb', 'gib', 't', 'tb', 'tib']
+        type: str
+        default: bytes
+      spread_fields:
+        description:
+        - The system drive fields, from the widest to the narrowest, that chosen drives are spread across.
+        - By default the storage system, rack, controller and RAID or parity group fields are used, where the system drives have them.
+        type: list
+        elements: str
       allow_denied_system_drives:
         description: Allows the use of system drives that currently are denied access
         type: boolean
@@ -93,6 +117,27 @@ EXAMPLES = r'''
   - debug: var=result.storagePool
 
 
+- name: Review the system drives that would be chosen for a 20 TiB Hitachi NAS storage pool
+  hosts: localhost
+  gather_facts: false
+  check_mode: true
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_storage_pool:
+      state: present
+      <<: *login
+      data:
+        label: "ansible-pool-2"
+        pool_size: 20
+        capacity_unit: tib
+    register: result
+  - debug: var=result.selectedSystemDrives
+
+
 - name: Delete Hitachi NAS storage pool
   hosts: localhost
   gather_facts: false
@@ -150,7 +195,7 @@ def main():
     try:
         assert 'label' in variables, "Missing 'label' data value"
         state = params['state']
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
         hnas.set_credentials(api_key, api_username, api_password)
         if state == "absent":
             changed = hnas.delete_storage_pool(label=variables['label'])
@@ -163,7 +208,11 @@ def main():
         module.fail_json(msg="Hitachi NAS storage pool task failed on system at [%s] due of [%s]" % (api_url, str(error)))
 
     result = dict(changed=changed, storagePool=pool)
-    module.exit_json(msg="Hitachi NAS storage pool task completed successfully on system at [%s]" % (hnas.get_address()), **result)
+    if hnas.selected_system_drives != None:
+        result['selectedSystemDrives'] = hnas.selected_system_drives
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS storage pool task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 if __name__ == '__main__':
     main()
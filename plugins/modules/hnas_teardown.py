@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+
+DOCUMENTATION = r'''
+---
+module: hnas_teardown
+short_description: This module removes a Hitachi NAS virtual server or a set of filesystems, along with everything that depends on them
+description:
+  - This module removes the NFS exports, CIFS/SMB shares, virtual volumes and filesystems that belong to a virtual server, and then the virtual server itself.
+  - Alternatively, the filesystems whose label matches a pattern can be removed, along with their exports, shares and virtual volumes.
+  - All of the dependent items are found from a single set of listings, and each layer is removed concurrently.
+  - Filesystems are unmounted together, and a single wait is used for all of the unmounts to complete.
+version_added: "1.3.0"
+author: Hitachi Vantara, LTD.
+options:
+  api_key:
+    description: The REST API authentication key - the preferred authentication method.
+    type: str
+  api_username:
+    description: The username to authenticate with the REST API.
+    type: str
+  api_password:
+    description: The password to authenticate with the REST API.
+    type: str
+  api_url:
+    description:
+    - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
+    type: str
+    required: true
+    example:
+    - https://10.1.2.3:8444/v7
+  validate_certs:
+    description: Should https certificates be validated?
+    type: bool
+    default: true
+  data:
+    description:
+    - Additional data to describe the items to be removed.
+    - One of I(virtual_server_name), I(virtualServerId) or I(label_pattern) is required.
+    required: true
+    type: dict
+    suboptions:
+      virtual_server_name:
+        description: Name of the virtual server to remove, along with everything it hosts
+        type: str
+      virtualServerId:
+        description: ID of the virtual server to remove, along with everything it hosts
+        type: int
+      label_pattern:
+        description:
+        - A shell style pattern, such as C(ansible-*), matched against filesystem labels.
+        - The matching filesystems, and their exports, shares and virtual volumes, are removed.
+        - Virtual servers are not removed when I(label_pattern) is used.
+        type: str
+      remove_content:
+        description:
+        - A non-empty virtual volume can not be removed from an HNAS system.
+        - This option removes each virtual volume and its contents.
+        - This option allows the removal of user data, and should be used with caution.
+        type: bool
+        default: false
+      max_workers:
+        description: The maximum number of requests sent to the REST API at the same time.
+        type: int
+        default: 8
+
+'''
+
+EXAMPLES = r'''
+- name: Remove a Hitachi NAS virtual server and everything it hosts
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_teardown:
+      <<: *login
+      data:
+        virtual_server_name: "ansible-evs"
+    register: result
+  - debug: var=result.removed
+
+
+- name: Remove all Hitachi NAS filesystems with labels starting with ansible-
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+      validate_certs: false
+  tasks:
+  - hitachivantara.hnas.hnas_teardown:
+      <<: *login
+      data:
+        label_pattern: "ansible-*"
+        remove_content: true
+    register: result
+  - debug: var=result.removed
+
+'''
+
+RETURN = r'''
+
+'''
+
+import json
+
+from ansible.module_utils.api import basic_auth_argument_spec
+from ansible.module_utils.basic import AnsibleModule, get_exception
+
+import ansible_collections.hitachivantara.hnas.plugins.module_utils.hnas_main as server
+
+
+def main():
+    argument_spec = basic_auth_argument_spec()
+    argument_spec.update(
+        api_key = dict(type='str', required=False, no_log=True),
+        data=dict(type='dict', required=True),
+    )
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+# direct params cover authentication and operation
+    params = module.params
+# variables are specific to the operation being carried out
+    variables = params['data']
+
+    api_url = params['api_url']
+    api_key = params.get('api_key', None)
+    api_username = params.get('api_username', None)
+    api_password = params.get('api_password', None)
+    validate_certs = params['validate_certs']
+    removed = {}
+    try:
+        assert 'virtual_server_name' in variables or 'virtualServerId' in variables or 'label_pattern' in variables, \
+            "Missing 'virtual_server_name', 'virtualServerId' or 'label_pattern' data value"
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode)
+        hnas.set_credentials(api_key, api_username, api_password)
+        changed, removed = hnas.teardown(virtualServerId=variables.get('virtualServerId', None),
+                                         name=variables.get('virtual_server_name', None),
+                                         label_pattern=variables.get('label_pattern', None),
+                                         remove_content=variables.get('remove_content', False),
+                                         max_workers=int(variables.get('max_workers', server.DEFAULT_MAX_WORKERS)))
+
+    except:
+        error = get_exception()
+        module.fail_json(msg="Hitachi NAS teardown task failed on system at [%s] due of [%s]" % (api_url, str(error)))
+
+    result = dict(changed=changed, removed=removed)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS teardown task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,7 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
     type: str
     required: true
     example:
@@ -34,6 +35,12 @@ options:
     description: Should https certificates be validated?
     type: bool
     default: true
+  refresh_results:
+    description:
+    - If I(refresh_results=true), objects are read again from the server after they have been changed, so the returned details are authoritative.
+    - If I(refresh_results=false), the returned details are built by merging the requested changes into the details read before the change, which saves several requests for each changed item.
+    type: bool
+    default: true
   state:
     description:
     - If I(state=present), ensure the existence of a virtual server, or ensure that IP addresses are assigned to a virtual server.
@@ -55,9 +62,16 @@ options:
         type: str
         required: true
       nodeId:
-        description: Node that initially hosts the virtual server
-        type: int
+        description:
+        - Node that initially hosts the virtual server.
+        - If I(nodeId=auto), a new virtual server is placed on the node hosting the fewest filesystems, and then the fewest virtual servers.
+        - The placement of an existing virtual server is never changed.
+        type: raw
         default: 1
+      node_candidates:
+        description: A list of node IDs that I(nodeId=auto) may choose from - all nodes are considered if not supplied
+        type: list
+        elements: int
       address_details:
         description:
         - A list of IP addresses that should be present/absent from a virtual server.
@@ -104,6 +118,28 @@ EXAMPLES = r'''
   - debug: var=result.virtualServer
 
 
+- name: Create Hitachi NAS virtual server on the least loaded node
+  hosts: localhost
+  gather_facts: false
+  vars:
+    login: &login
+      api_url: https://172.27.5.11:8444/v7
+      api_key: BgB2qWZVkE.e53OLShtF3If9UIVdTNmvW9dS7ObPqYNPM83OQoeAj9
+  tasks:
+  - hitachivantara.hnas.hnas_virtual_server:
+      <<: *login
+      state: present
+      data:
+        name: "evs-ansible-2"
+        nodeId: auto
+        address_details:
+        - address: "172.27.5.17"
+          netmask: "255.255.192.0"
+          port: "ag1"
+    register: result
+  - debug: var=result.virtualServer
+
+
 - name: Delete Hitachi NAS virtual server
   hosts: localhost
   gather_facts: false
@@ -158,6 +194,7 @@ def main():
     argument_spec.update(
         api_key = dict(type='str', required=False, no_log=True),
         state=dict(type='str', choices=['present','absent'], default='present'),
+        refresh_results=dict(type='bool', default=True),
         data=dict(type='dict', required=True),
     )
 
@@ -179,7 +216,8 @@ def main():
     try:
         assert 'name' in variables, "Missing 'name' data value"
         state = params['state']
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode,
+                                     refresh_results=params['refresh_results'])
         hnas.set_credentials(api_key, api_username, api_password)
         if state == "absent":
             changed, success, virtual_server = hnas.delete_virtual_server(name=variables['name'], params=variables)
@@ -192,7 +230,9 @@ def main():
         module.fail_json(msg="Hitachi NAS virtual server task failed on system at [%s] due of [%s]" % (api_url, str(error)))
 
     result = dict(changed=changed, virtualServer=virtual_server)
-    module.exit_json(msg="Hitachi NAS virtual server task completed successfully on system at [%s]" % (hnas.get_address()), **result)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS virtual server task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 if __name__ == '__main__':
     main()
@@ -26,6 +26,7 @@ options:
   api_url:
     description:
     - The URL to access the Hitachi NAS REST API.  This needs to include the protocol, address, port and API version.
+    - Several URLs, separated by commas, can be given for the SMUs that manage one cluster.  The fastest healthy SMU is used, and requests move to another SMU if it fails.
     type: str
     required: true
     example:
@@ -34,6 +35,12 @@ options:
     description: Should https certificates be validated?
     type: bool
     default: true
+  refresh_results:
+    description:
+    - If I(refresh_results=true), objects are read again from the server after they have been changed, so the returned details are authoritative.
+    - If I(refresh_results=false), the returned details are built by merging the requested changes into the details read before the change, which saves several requests for each changed item.
+    type: bool
+    default: true
   state:
     description:
     - If I(state=present), ensure the existence of a virtual volume and its quota.
@@ -220,6 +227,7 @@ def main():
     argument_spec.update(
         api_key = dict(type='str', required=False, no_log=True),
         state=dict(type='str', choices=['present','absent'], default='present'),
+        refresh_results=dict(type='bool', default=True),
         data=dict(type='dict', required=True),
     )
 
@@ -240,7 +248,8 @@ def main():
     virtual_volume = ""
     try:
         state = params['state']
-        hnas = server.HNASFileServer(api_url, verify=validate_certs)
+        hnas = server.HNASFileServer(api_url, verify=validate_certs, check_mode=module.check_mode,
+                                     refresh_results=params['refresh_results'])
         hnas.set_credentials(api_key, api_username, api_password)
         if state == "absent":
             changed = hnas.delete_virtual_volume(variables)
@@ -253,7 +262,9 @@ def main():
         module.fail_json(msg="Hitachi NAS virtual volume task failed on system at [%s] due of [%s]" % (api_url, str(error)))
 
     result = dict(changed=changed, virtualVolume=virtual_volume)
-    module.exit_json(msg="Hitachi NAS virtual volume task completed successfully on system at [%s]" % (hnas.get_address()), **result)
+    if module.check_mode:
+        result['plan'] = hnas.planned_changes
+    module.exit_json(msg="Hitachi NAS virtual volume task completed successfully on system at [%s]" % (hnas.get_address()), endpoint=hnas.get_endpoint(), **result)
 
 if __name__ == '__main__':
     main()
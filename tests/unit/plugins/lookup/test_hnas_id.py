@@ -0,0 +1,68 @@
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import pytest
+
+from ansible.errors import AnsibleError
+from ansible_collections.hitachivantara.hnas.plugins.lookup import hnas_id
+
+
+class FakeLookup(hnas_id.LookupModule):
+    """
+    A lookup whose options are taken directly from the keyword arguments, and whose listings are counted rather than read
+    """
+    listings = {'fs01': 'F1', 'fs02': 'F2'}
+
+    def __init__(self, reads):
+        hnas_id.LookupModule.__init__(self)
+        self.reads = reads
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        self.options = {'field': None, 'missing': 'error', 'cache_ttl': 300, 'api_key': None, 'api_username': None, 'api_password': None}
+        self.options.update(direct)
+
+    def get_option(self, option, hostvars=None):
+        return self.options[option]
+
+    def read_listing(self, kind, field):
+        self.reads.append((self.options['api_key'], self.options['api_username'], kind))
+        return dict(self.listings)
+
+
+@pytest.fixture
+def options(tmp_path, monkeypatch):
+    monkeypatch.setattr(hnas_id, 'resolved', {})
+    return {'api_url': "https://10.1.2.3:8444/v8", 'api_key': "key", 'cache_dir': str(tmp_path)}
+
+
+def test_lookups_share_a_listing(options):
+    reads = []
+    assert FakeLookup(reads).run(['filesystem', 'fs01'], **options) == ['F1']
+    assert FakeLookup(reads).run(['filesystem', ['fs02', 'fs01']], **options) == ['F2', 'F1']
+    assert reads == [('key', None, 'filesystem')]
+
+
+def test_listings_are_kept_apart_for_each_set_of_credentials(options):
+    reads = []
+    FakeLookup(reads).run(['filesystem', 'fs01'], **options)
+    FakeLookup(reads).run(['filesystem', 'fs01'], **dict(options, api_key=None, api_username="admin", api_password="secret"))
+    FakeLookup(reads).run(['filesystem', 'fs01'], **dict(options, api_key="other"))
+    assert reads == [('key', None, 'filesystem'), (None, 'admin', 'filesystem'), ('other', None, 'filesystem')]
+
+
+def test_missing_names_are_cached_with_the_listing(options, monkeypatch):
+    reads = []
+    options['missing'] = 'none'
+    assert FakeLookup(reads).run(['filesystem', 'fs01', 'fs09'], **options) == ['F1', None]
+    assert len(reads) == 2
+    assert FakeLookup(reads).run(['filesystem', 'fs09'], **options) == [None]
+# the names missing from the listing are also kept on disk for other processes
+    monkeypatch.setattr(hnas_id, 'resolved', {})
+    assert FakeLookup(reads).run(['filesystem', 'fs09'], **options) == [None]
+    assert len(reads) == 2
+# a name that has not been looked for before still reads the listing again
+    with pytest.raises(AnsibleError, match="fs10"):
+        FakeLookup(reads).run(['filesystem', 'fs10'], **dict(options, missing='error'))
+    assert len(reads) == 3
@@ -0,0 +1,507 @@
+# Copyright: (c) 2021-2024, Hitachi Vantara, LTD
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import ast
+import calendar
+import json
+import os
+import re
+import time
+
+import pytest
+import yaml
+
+from ansible_collections.hitachivantara.hnas.plugins.module_utils import hnas_main
+
+
+DAY = 86400
+NOW = calendar.timegm((2024, 6, 14, 12, 0, 0))
+
+
+class FakeServer(hnas_main.HNASFileServer):
+    """
+    A client that answers GET requests from a dictionary of URLs, and records every change instead of sending it
+    """
+    def __init__(self, responses=None):
+        hnas_main.HNASFileServer.__init__(self, "https://10.1.2.3:8444/v8")
+        self.set_credentials(api_key="key")
+        self.responses = responses or {}
+        self.gets = []
+        self.changes = []
+
+    def simple_get(self, url):
+        resource = url.replace(self.base_uri, '', 1)
+        self.gets.append(resource)
+        response = self.responses[resource]
+        if isinstance(response, Exception):
+            raise response
+        return json.loads(json.dumps(response))
+
+    def simple_post(self, url, expected_status_code, data=None):
+        self.changes.append(('POST', url.replace(self.base_uri, '', 1), data))
+
+    def simple_patch(self, url, expected_status_code, data=None):
+        self.changes.append(('PATCH', url.replace(self.base_uri, '', 1), data))
+
+    def simple_delete(self, url):
+        self.changes.append(('DELETE', url.replace(self.base_uri, '', 1)))
+
+
+def test_run_concurrently_keeps_order():
+    assert hnas_main.run_concurrently(lambda item: item * 2, range(20), 4) == [item * 2 for item in range(20)]
+
+
+def test_run_concurrently_raises_first_error():
+    def fail(item):
+        if item == 3:
+            raise ValueError("item 3")
+        return item
+    with pytest.raises(ValueError):
+        hnas_main.run_concurrently(fail, range(6), 3)
+
+
+def test_wait_for_filesystems_allows_time_for_each_filesystem(monkeypatch):
+    monkeypatch.setattr(hnas_main.time, 'sleep', lambda seconds: None)
+    filesystems = [{'objectId': "F{}".format(number), 'status': 'MOUNTED'} for number in range(3)]
+    hnas = FakeServer({'filesystems': {'filesystems': filesystems}})
+
+    def get_file_systems(virtualServerId=None):
+# one filesystem is unmounted for every 40 polls, which is more than the time allowed for one filesystem
+        if len(hnas.gets) % 40 == 39:
+            filesystems[len(hnas.gets) // 40]['status'] = 'NOT_MOUNTED'
+        return hnas.simple_get(hnas.base_uri + "filesystems")
+    hnas.get_file_systems = get_file_systems
+    hnas.wait_for_filesystems(["F0", "F1", "F2"], 'NOT_MOUNTED', timeout=45)
+    with pytest.raises(AssertionError, match="Waited 10 seconds"):
+        hnas.wait_for_filesystems(["F0", "F1"], 'MOUNTED', timeout=5)
+
+
+def test_check_mode_records_changes():
+    hnas = hnas_main.HNASFileServer("https://10.1.2.3:8444/v8", check_mode=True)
+    hnas.set_credentials(api_key="key")
+    hnas.simple_post(hnas.base_uri + "filesystems", 201, {'label': 'fs1'})
+    hnas.simple_delete(hnas.base_uri + "filesystems/F1")
+    assert hnas.planned_changes == [{'method': 'POST', 'resource': 'filesystems', 'data': {'label': 'fs1'}},
+                                    {'method': 'DELETE', 'resource': 'filesystems/F1'}]
+
+
+def test_add_cifs_authentications_matches_requested_names_exactly():
+    hnas = FakeServer()
+    saa_list = [{'name': 'DOM\\alice', 'permission': 'READ', 'encodedName': 'A'}]
+    params = {'cifsAuthentications': [{'name': 'DOM\\jimbob', 'permission': 'READ'}, {'name': 'bob', 'permission': 'READ'},
+                                      {'name': 'dom\\JIMBOB', 'permission': 'FULL'}, {'name': 'alice', 'permission': 'READ'}]}
+    assert hnas.add_cifs_authentications('S1', params, saa_list) == True
+    assert [change[2]['cifsAuthentications'][0]['name'] for change in hnas.changes] == ['DOM\\jimbob', 'bob']
+    assert [saa['name'] for saa in saa_list] == ['DOM\\alice', 'DOM\\jimbob', 'bob']
+
+
+def test_diff_fields_returns_only_changes():
+    existing = {'accessConfiguration': '*', 'settings': {'snapshotOption': 'SHOW', 'readOnly': False}}
+    params = {'accessConfiguration': '*', 'settings': {'readOnly': True}}
+    fields = [('accessConfiguration', ''), ('settings', [('snapshotOption', 'HIDE'), ('readOnly', False)])]
+    assert hnas_main.diff_fields(fields, params, existing) == {'settings': {'snapshotOption': 'SHOW', 'readOnly': True}}
+
+
+def test_diff_fields_ignores_unrequested_fields():
+    fields = [('accessConfiguration', ''), ('comment', '')]
+    assert hnas_main.diff_fields(fields, {'comment': 'a'}, {'accessConfiguration': '*', 'comment': 'a'}) == {}
+
+
+def test_delete_virtual_server_address_keeps_index_in_check_mode():
+    evs = {'virtualServerId': 1, 'objectId': 'E1', 'name': 'evs1', 'status': 'ONLINE', 'ipAddresses': ['10.0.0.1', '10.0.0.2']}
+    hnas = FakeServer({'virtual-servers': {'virtualServers': [evs]}})
+    hnas.check_mode = True
+    changed, success, planned = hnas.delete_virtual_server(name='evs1', params={'address_details': [{'address': '10.0.0.2'}]})
+    assert (changed, success, planned['ipAddresses']) == (True, True, ['10.0.0.1'])
+    assert hnas.find_resource('virtual_server', name='evs1')['ipAddresses'] == ['10.0.0.1', '10.0.0.2']
+    assert hnas.changes == [('DELETE', 'virtual-servers/1/ip-addresses/10.0.0.2')]
+
+
+def test_directory_trie_does_not_cache_failed_listing():
+    hnas = FakeServer({'filesystems/F1/directories': IOError("busy")})
+    root = hnas.new_directory_node(None)
+    assert hnas.get_directory_child('F1', root, '/a') == None
+    hnas.responses['filesystems/F1/directories'] = {'directories': [{'displayName': ['/a'], 'objectId': 'A'}]}
+    assert hnas.get_directory_child('F1', root, '/a')['objectId'] == 'A'
+    assert len(hnas.gets) == 2
+
+
+def test_delete_directories_skips_paths_below_removed_directories():
+    hnas = FakeServer()
+    hnas.get_directory_nodes = lambda filesystemId, path: [("/", {'objectId': None})] + [(part, {'objectId': part}) for part in hnas.get_path_parts(path)]
+    removed = []
+    hnas.delete_directory = lambda filesystemId, path: removed.append(path)
+    paths = ['/a', '/a-b', '/a/b', 'a-b/c/', '/c/d', '/c', '/c/d/e']
+    assert hnas.delete_directories('F1', paths, wait=False) == ['/a', '/a-b', '/c']
+    assert sorted(removed) == ['/a', '/a-b', '/c']
+
+
+@pytest.mark.parametrize('value, expected', [
+    (1718366400, 1718366400.0),
+    (1718366400000, 1718366400.0),
+    ('1718366400', 1718366400.0),
+    ('2024-06-14T12:00:00Z', 1718366400.0),
+    ('2024-06-14 12:00:00', 1718366400.0),
+    ('2024-06-14T12:00:00.250+00:00', 1718366400.25),
+    ('2024-06-14T14:00:00+02:00', 1718366400.0),
+    ('2024-06-14T07:30:00-0430', 1718366400.0),
+    ({'seconds': 1}, None),
+    ([1718366400], None),
+    ('yesterday', None),
+    ('2024-13-45T12:00:00Z', None),
+    ('nan', None),
+])
+def test_get_snapshot_time(value, expected):
+    assert hnas_main.get_snapshot_time({'creationTime': value}) == expected
+
+
+def test_get_snapshot_time_falls_through_to_next_field():
+    assert hnas_main.get_snapshot_time({'creationTime': 'unknown', 'timestamp': '2024-06-14T12:00:00Z'}) == 1718366400.0
+    assert hnas_main.get_snapshot_time({'creationTime': 'unknown'}) == None
+
+
+def snapshots_by_day(days):
+    return [{'name': "snap-{}".format(day), 'creationTime': NOW - day * DAY} for day in days]
+
+
+def test_retention_keep_last():
+    snapshots = snapshots_by_day([0, 1, 2, 3, 4])
+    deleted = hnas_main.get_snapshot_retention_plan(snapshots, keep_last=2, now=NOW)
+    assert [snapshot['name'] for snapshot in deleted] == ['snap-2', 'snap-3', 'snap-4']
+
+
+def test_retention_keep_daily_keeps_newest_of_each_day():
+    snapshots = snapshots_by_day([0, 0.1, 1, 1.2, 5])
+    deleted = hnas_main.get_snapshot_retention_plan(snapshots, keep_daily=3, now=NOW)
+    assert sorted([snapshot['name'] for snapshot in deleted]) == ['snap-0.1', 'snap-1.2', 'snap-5']
+
+
+def test_retention_max_age_spares_keep_last_and_unknown_times():
+    snapshots = snapshots_by_day([40, 50]) + [{'name': 'undated'}]
+    deleted = hnas_main.get_snapshot_retention_plan(snapshots, keep_last=1, max_age_days=30, now=NOW)
+    assert [snapshot['name'] for snapshot in deleted] == ['snap-50']
+
+
+def test_shape_facts_filters_and_projects():
+    facts = [{'label': 'fs1', 'status': 'MOUNTED', 'settings': {'snapshotOption': 'HIDE', 'accessConfig': ''}},
+             {'label': 'fs2', 'status': 'NOT_MOUNTED', 'settings': {'snapshotOption': 'SHOW', 'accessConfig': ''}},
+             {'label': 'data3', 'status': 'MOUNTED', 'settings': {'snapshotOption': 'SHOW', 'accessConfig': ''}}]
+    shaped = hnas_main.shape_facts(facts, fields=['label', 'settings.snapshotOption'], where={'status': 'MOUNTED', 'label': '~^fs'})
+    assert shaped == [{'label': 'fs1', 'settings': {'snapshotOption': 'HIDE'}}]
+
+
+def test_shape_facts_leaves_lists_of_names_alone():
+    assert hnas_main.shape_facts(['eth0', 'ag1'], fields=['name'], where={'name': 'eth0'}) == ['eth0', 'ag1']
+
+
+def get_module_examples(module):
+    """
+    Return the plays in the EXAMPLES of a module, each parsed on its own as they reuse the same anchors
+    """
+    path = os.path.join(os.path.dirname(hnas_main.__file__), '..', 'modules', module + '.py')
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and node.targets[0].id == 'EXAMPLES':
+            return [play for text in re.split(r'\n(?=- )', ast.literal_eval(node.value)) for play in yaml.safe_load(text) or []]
+
+
+def test_facts_example_fields_exist_on_a_filesystem():
+    filesystem = {'filesystemId': '3B8A2F5E6C1D4E7F', 'objectId': '3B8A2F5E6C1D4E7F', 'label': 'ansible_fs01', 'virtualServerId': 2,
+                  'storagePoolId': '4C2B', 'status': 'MOUNTED', 'capacity': 107374182400, 'usedCapacity': 2147483648,
+                  'freeCapacity': 105226698752, 'blockSize': 'FOUR_KB', 'isThinProvisioned': False}
+    tasks = [task['hitachivantara.hnas.hnas_facts'] for play in get_module_examples('hnas_facts') for task in play['tasks']
+             if 'filesystem_facts' in (task.get('hitachivantara.hnas.hnas_facts') or {}).get('fields', {})]
+    assert len(tasks) != 0
+    for task in tasks:
+        fields = task['fields']['filesystem_facts']
+        where = task.get('where', {}).get('filesystem_facts', None)
+        assert hnas_main.shape_facts([filesystem], fields, where) == [dict([(field, filesystem[field]) for field in fields])]
+
+
+def test_get_fact_changes():
+    previous = hnas_main.get_fact_fingerprints({'filesystems': [{'filesystemId': 'F1', 'label': 'a'}, {'filesystemId': 'F2', 'label': 'b'}]})
+    current = [{'filesystemId': 'F1', 'label': 'a'}, {'filesystemId': 'F2', 'label': 'c'}, {'filesystemId': 'F3', 'label': 'd'}]
+    changes, fingerprints = hnas_main.get_fact_changes('filesystems', current, previous['filesystems'])
+    assert changes['added'] == [{'filesystemId': 'F3', 'label': 'd'}]
+    assert changes['changed'] == [{'filesystemId': 'F2', 'label': 'c'}]
+    assert changes['removed'] == []
+    assert sorted(fingerprints.keys()) == ['F1', 'F2', 'F3']
+
+
+def test_fact_file_writer_fingerprints_written_facts(tmp_path):
+    path = str(tmp_path / "hnas-{fact}.jsonl")
+    writer = hnas_main.FactFileWriter(path)
+    fingerprints = {}
+    objs = [{'filesystemId': 'F1', 'label': 'a'}, {'filesystemId': 'F2', 'label': 'b'}]
+    writer.write('filesystems', hnas_main.iterate_fact_fingerprints('filesystems', iter(objs), fingerprints))
+    assert writer.close()['counts'] == {'filesystems': 2}
+    assert fingerprints == hnas_main.get_fact_fingerprints({'filesystems': objs})['filesystems']
+    with open(str(tmp_path / "hnas-filesystems.jsonl")) as f:
+        assert [json.loads(line) for line in f] == objs
+
+
+def test_capacity_summary():
+    pools = [{'storagePoolId': 1, 'label': 'p1', 'capacity': 1000, 'usedCapacity': 400}]
+    filesystems = [{'storagePoolId': 1, 'virtualServerId': 2, 'capacity': 300, 'usedCapacity': 150},
+                   {'storagePoolId': 1, 'virtualServerId': 2, 'capacity': 500, 'usedCapacity': 100}]
+    summary = hnas_main.get_capacity_summary(filesystems, pools)
+    assert summary['storagePools'][0]['allocated'] == 800
+    assert summary['storagePools'][0]['overcommit'] == 0.8
+    assert summary['virtualServers'][0]['used'] == 250
+    assert summary['cluster']['free'] == 600
+
+
+def test_capacity_trend_store_forecast(tmp_path):
+    store = hnas_main.CapacityTrendStore(str(tmp_path / "trend.bin"))
+    for day in range(5):
+        store.append([('fs1', 'data', 100 + day * 10, 200), ('fs2', 'logs', 50, 100)], now=NOW + day * DAY)
+    forecasts = store.forecast(now=NOW + 4 * DAY)
+    assert [item['name'] for item in forecasts] == ['fs1', 'fs2']
+    assert forecasts[0]['growthPerDay'] == pytest.approx(10)
+    assert forecasts[0]['daysToFull'] == 6.0
+    assert forecasts[1]['daysToFull'] == None
+    assert len(store.read_columns(since=NOW + 3 * DAY)[0]) == 4
+
+
+def test_capacity_trend_store_writes_one_header(tmp_path):
+    path = str(tmp_path / "trend.bin")
+    hnas_main.CapacityTrendStore(path).append([('fs1', 'data', 1, 2)], now=NOW)
+    hnas_main.CapacityTrendStore(path).append([('fs1', 'data', 1, 2)], now=NOW + 1)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert data.count(hnas_main.CapacityTrendStore.MAGIC) == 1
+    assert len(data) == len(hnas_main.CapacityTrendStore.MAGIC) + 2 * hnas_main.CapacityTrendStore.RECORD.size
+
+
+def test_autogrow_filesystems():
+    hnas = FakeServer({
+        'storage-pools': {'storagePools': [{'storagePoolId': 1, 'capacity': 1000, 'usedCapacity': 800}]},
+        'filesystems': {'filesystems': [
+            {'objectId': 'F1', 'filesystemId': 'F1', 'label': 'full', 'storagePoolId': 1, 'capacity': 100, 'usedCapacity': 90},
+            {'objectId': 'F2', 'filesystemId': 'F2', 'label': 'half', 'storagePoolId': 1, 'capacity': 100, 'usedCapacity': 50},
+        ]},
+    })
+    expanded = []
+    hnas.expand_filesystem = lambda objectId, capacity: expanded.append((objectId, capacity))
+    changed, grown, skipped = hnas.autogrow_filesystems(40, target_utilization=60)
+    assert changed == True
+    assert expanded == [('F1', 150)]
+    assert [(item['label'], item['reason']) for item in skipped] == [('half', "already at or below target_utilization")]
+
+
+def test_autogrow_filesystems_rejects_zero_target():
+    with pytest.raises(AssertionError):
+        FakeServer().autogrow_filesystems(80, target_utilization=0)
+
+
+def test_choose_storage_pools_spreads_batch():
+    pools = [{'storagePoolId': 1, 'label': 'p1', 'capacity': 1000, 'freeCapacity': 500},
+             {'storagePoolId': 2, 'label': 'p2', 'capacity': 1000, 'freeCapacity': 900}]
+    assert hnas_main.choose_storage_pools(pools, [], [300, 300, 300]) == [2, 2, 1]
+
+
+def test_choose_storage_pools_places_each_item_with_its_own_options():
+    pools = [{'storagePoolId': 1, 'label': 'p1', 'capacity': 1000, 'freeCapacity': 500},
+             {'storagePoolId': 2, 'label': 'p2', 'capacity': 1000, 'freeCapacity': 900},
+             {'storagePoolId': 3, 'label': 'p3', 'capacity': 1000, 'freeCapacity': 100}]
+    placements = [('free', None), ('free', ['p1']), ('count', ['3'])]
+    assert hnas_main.choose_storage_pools(pools, [], [100, 100, 50], placements=placements) == [2, 1, 3]
+
+
+def test_choose_storage_pools_without_room():
+    pools = [{'storagePoolId': 1, 'capacity': 1000, 'freeCapacity': 100}]
+    with pytest.raises(AssertionError):
+        hnas_main.choose_storage_pools(pools, [], [200])
+
+
+def node_loads():
+    nodes = [{'nodeId': 1, 'name': 'node-1'}, {'nodeId': 2, 'name': 'node-2'}]
+    virtual_servers = [{'virtualServerId': 1, 'name': 'evs1', 'nodeId': 1}, {'virtualServerId': 2, 'name': 'evs2', 'nodeId': 1},
+                       {'virtualServerId': 3, 'name': 'evs3', 'nodeId': 1}]
+    filesystems = [{'virtualServerId': 1}] * 4 + [{'virtualServerId': 2}] * 2 + [{'virtualServerId': 3}]
+    return hnas_main.get_node_loads(nodes, virtual_servers, filesystems)
+
+
+def test_get_node_loads_and_choose_node():
+    loads = node_loads()
+    assert loads['1']['filesystems'] == 7
+    assert loads['2']['filesystems'] == 0
+    assert hnas_main.choose_node(loads) == 2
+    assert hnas_main.choose_node(loads, candidates=[1]) == 1
+
+
+def test_get_rebalance_moves():
+    loads = node_loads()
+    moves = hnas_main.get_rebalance_moves(loads)
+    assert [(move['name'], move['fromNodeId'], move['toNodeId']) for move in moves] == [('evs1', 1, 2)]
+    assert (loads['1']['filesystems'], loads['2']['filesystems']) == (3, 4)
+
+
+def system_drives():
+    drives = []
+    for number in range(8):
+        drives.append({'systemDriveId': number, 'capacity': 100 + number, 'storageSystemName': "array{}".format(number % 2),
+                       'raidGroup': number % 4, 'isAssignedToStoragePool': number == 7,
+                       'isAccessAllowed': True})
+    return drives
+
+
+def test_choose_system_drives_spreads_across_hardware():
+    chosen = hnas_main.choose_system_drives(system_drives(), count=4)
+    assert sorted([drive['storageSystemName'] for drive in chosen]) == ['array0', 'array0', 'array1', 'array1']
+    assert sorted([drive['raidGroup'] for drive in chosen]) == [0, 1, 2, 3]
+
+
+def test_choose_system_drives_by_size():
+    chosen = hnas_main.choose_system_drives(system_drives(), size=500)
+    assert len(chosen) == 5
+    assert 7 not in [drive['systemDriveId'] for drive in chosen]
+
+
+@pytest.mark.parametrize('count', [3, 17])
+def test_choose_system_drives_checks_count(count):
+    with pytest.raises(AssertionError, match="from 4 to 16"):
+        hnas_main.choose_system_drives(system_drives(), count=count)
+
+
+def test_create_storage_pool_reads_system_drives_once():
+    drives = system_drives()
+    drives[1]['isAccessAllowed'] = False
+    hnas = FakeServer({'system-drives': {'systemDrives': drives}})
+    hnas.get_storage_pools = lambda storagePoolId=None, label=None: {'storagePools': []}
+    hnas.simple_post = lambda url, expected_status_code, data=None: hnas.changes.append(('POST', url.replace(hnas.base_uri, '', 1), data)) or {'storagePool': data}
+    changed, success, pool = hnas.create_storage_pool({'label': 'pool1', 'systemDrives': ['0', '1', '2', '3'], 'allow_denied_system_drives': True})
+    assert (changed, success, pool['systemDrives']) == (True, True, [0, 1, 2, 3])
+    assert hnas.gets == ['system-drives']
+    assert [change[:2] for change in hnas.changes] == [('PATCH', 'system-drives/1'), ('POST', 'storage-pools')]
+    hnas = FakeServer({'system-drives': {'systemDrives': drives}})
+    hnas.get_storage_pools = lambda storagePoolId=None, label=None: {'storagePools': []}
+    with pytest.raises(AssertionError, match="already in use"):
+        hnas.create_storage_pool({'label': 'pool1', 'systemDrives': [4, 5, 6, 7]})
+    with pytest.raises(AssertionError, match="not found '8'"):
+        hnas.create_storage_pool({'label': 'pool1', 'systemDrives': [4, 5, 6, 8]})
+
+
+@pytest.mark.parametrize('limits', [{'rate': 0}, {'rate': 5, 'burst': 0.5}, {'max_concurrent': 0}])
+def test_request_governor_rejects_bad_limits(tmp_path, limits):
+    with pytest.raises(AssertionError):
+        hnas_main.RequestGovernor("10.1.2.3", state_dir=str(tmp_path), **limits)
+
+
+def test_request_governor_calls_function(tmp_path):
+    governor = hnas_main.RequestGovernor("10.1.2.3", rate=100, max_concurrent=2, state_dir=str(tmp_path))
+    assert governor.call(lambda: 42) == 42
+
+
+def test_request_coalescer_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv('HNAS_COALESCE_GETS', raising=False)
+    assert hnas_main.RequestCoalescer.from_config() == None
+    monkeypatch.setenv('HNAS_COALESCE_GETS', 'true')
+    monkeypatch.setenv('HNAS_COALESCE_DIR', str(tmp_path))
+    coalescer = hnas_main.RequestCoalescer.from_config()
+    assert coalescer.is_shared('virtual-servers') and coalescer.is_shared('filesystems?pageSize=100')
+    assert not coalescer.is_shared('filesystems/F1/directories')
+
+
+def test_request_coalescer_removes_its_files(tmp_path):
+    coalescer = hnas_main.RequestCoalescer(str(tmp_path))
+    assert coalescer.call("https://10.1.2.3:8444/v8/storage/nodes", [], 0, lambda: {'nodes': []}) == {'nodes': []}
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_choose_endpoint_prefers_fastest_healthy(monkeypatch, tmp_path):
+    monkeypatch.setenv('HNAS_ENDPOINT_DIR', str(tmp_path))
+    hnas = hnas_main.HNASFileServer("https://10.1.2.3:8444/v8,https://10.1.2.4:8444/v8,https://10.1.2.5:8444/v8")
+    for endpoint, latency in zip(hnas.endpoints, [0.2, 0.1, 0.05]):
+        endpoint['latency'] = latency
+    hnas.endpoints[2]['open_until'] = time.time() + 60
+    assert hnas.choose_endpoint([])['address'] == "10.1.2.4"
+    assert hnas.choose_endpoint([hnas.endpoints[1]])['address'] == "10.1.2.3"
+
+
+def test_endpoint_cool_down_is_shared(monkeypatch, tmp_path):
+    monkeypatch.setenv('HNAS_ENDPOINT_DIR', str(tmp_path))
+    urls = "https://10.1.2.3:8444/v8,https://10.1.2.4:8444/v8"
+    hnas = hnas_main.HNASFileServer(urls)
+    assert hnas.record_endpoint_result(hnas.endpoints[0], True, trip=True) == True
+    other = hnas_main.HNASFileServer(urls)
+    other.load_endpoint_state(other.endpoints[0])
+    assert other.endpoints[0]['open_until'] > time.time()
+
+
+def test_get_virtual_volume_quotas_matches_target_object_id():
+    hnas = FakeServer({'filesystems/F1/quotas?targetType=VIRTUAL_VOLUME': {'quotas': [
+        {'objectId': 'Q1', 'targetObjectId': 'V1', 'targetId': 'V2', 'quota': {'limit': 1}},
+        {'objectId': 'Q2', 'quota': {'limit': 2}},
+    ]}})
+    hnas.capabilities = {'paging': False, 'bulk_quotas': True}
+    assert hnas.get_virtual_volume_quotas('F1') == {'V1': {'limit': 1, 'quotaObjectId': 'Q1'}}
+
+
+def test_filtered_listings_do_not_probe_capabilities():
+    hnas = FakeServer({'filesystems?label=fs1': {'filesystems': [{'filesystemId': 'F1', 'label': 'fs1'}, {'filesystemId': 'F2', 'label': 'fs2'}]},
+                       'storage-pools?label=p1': {'storagePools': [{'storagePoolId': 1, 'label': 'p1'}]}})
+    assert hnas.get_file_systems(label='fs1')['filesystems'] == [{'filesystemId': 'F1', 'label': 'fs1'}]
+    assert hnas.get_storage_pools(label='p1')['storagePools'] == [{'storagePoolId': 1, 'label': 'p1'}]
+    assert hnas.gets == ['filesystems?label=fs1', 'storage-pools?label=p1']
+    assert hnas.capabilities == None
+
+
+class RecordingServer(object):
+    """
+    Stands in for HNASFileServer in run_on_clusters, recording the settings each cluster is opened with
+    """
+    opened = []
+
+    def __init__(self, api_url, verify=True, check_mode=False, refresh_results=True):
+        self.address = api_url.split('//')[1].split(':')[0]
+        self.api_url = api_url
+        self.verify = verify
+        self.planned_changes = []
+
+    def set_credentials(self, api_key=None, api_username=None, api_password=None):
+        RecordingServer.opened.append((self.api_url, self.verify, api_key, api_username, api_password))
+
+    def get_address(self):
+        return self.address
+
+    def get_endpoint(self):
+        return self.api_url
+
+
+def test_run_on_clusters_credentials(monkeypatch):
+    monkeypatch.setattr(hnas_main, 'HNASFileServer', RecordingServer)
+    RecordingServer.opened = []
+    clusters = [{'api_url': 'https://10.1.2.3:8444/v8'},
+                {'api_url': 'https://10.1.2.4:8444/v8', 'api_username': 'admin', 'api_password': 'secret'},
+                {'api_url': 'https://10.1.2.5:8444/v8', 'validate_certs': True}]
+    defaults = {'api_key': 'key', 'validate_certs': False}
+    results = hnas_main.run_on_clusters(clusters, lambda hnas: {'done': True}, defaults=defaults)
+    assert [result['done'] for result in results] == [True, True, True]
+    assert sorted(RecordingServer.opened) == [('https://10.1.2.3:8444/v8', False, 'key', None, None),
+                                              ('https://10.1.2.4:8444/v8', False, None, 'admin', 'secret'),
+                                              ('https://10.1.2.5:8444/v8', True, 'key', None, None)]
+
+
+def test_run_on_clusters_reports_errors_and_timeouts(monkeypatch):
+    monkeypatch.setattr(hnas_main, 'HNASFileServer', RecordingServer)
+
+    def task(hnas):
+        if hnas.address == "10.1.2.4":
+            raise AssertionError("unreachable")
+        if hnas.address == "10.1.2.5":
+            time.sleep(5)
+        return {}
+    clusters = [{'api_url': 'https://10.1.2.3:8444/v8'}, {'api_url': 'https://10.1.2.4:8444/v8'}, {'api_url': 'https://10.1.2.5:8444/v8'}]
+    results = hnas_main.run_on_clusters(clusters, task, defaults={'api_key': 'key'}, timeout=1)
+    assert 'error' not in results[0]
+    assert results[1]['error'] == "unreachable"
+    assert results[2]['error'] == "No result within 1 seconds"
+
+
+def test_cluster_timeout_is_only_offered_when_asked_for():
+    assert 'cluster_timeout' in hnas_main.cluster_argument_spec()
+    assert 'cluster_timeout' not in hnas_main.cluster_argument_spec(timeout=False)